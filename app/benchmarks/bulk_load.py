@@ -0,0 +1,90 @@
+"""
+Time to build the initial book of main.py with initial-levels levels of
+initial-orders orders per side, by pushing one order dict per resting
+order through process_orders (what main.py did before) and with
+OrderBook.bulk_load, for each book backend.
+
+Run from the app directory:
+
+    python -m benchmarks.bulk_load [levels] [orders per level]
+"""
+import gc
+import sys
+import time
+
+from src.orderbook import (
+    OrderBook,
+    BOOK_BACKENDS
+)
+from src.order import (
+    OrderType
+)
+from src.side import (
+    Side
+)
+
+BEST_BID = 9999
+BEST_ASK = 10000
+
+
+def replay(backend, levels, orders_per_level):
+    lob = OrderBook(backend=backend)
+    start = time.perf_counter()
+    limit_orders = []
+    for price in range(BEST_ASK, BEST_ASK + levels):
+        for i in range(orders_per_level):
+            limit_orders.append({'instrument': '0',
+                                 'order_type': OrderType.Limit,
+                                 'side': Side.S,
+                                 'quantity': 1,
+                                 'price': price})
+    for price in range(BEST_BID, BEST_BID - levels, -1):
+        for i in range(orders_per_level):
+            limit_orders.append({'instrument': '0',
+                                 'order_type': OrderType.Limit,
+                                 'side': Side.B,
+                                 'quantity': 1,
+                                 'price': price})
+    lob.process_orders(limit_orders)
+    return lob, time.perf_counter() - start
+
+
+def bulk_load(backend, levels, orders_per_level):
+    lob = OrderBook(backend=backend)
+    start = time.perf_counter()
+    orders = [(1, None)] * orders_per_level
+    asks = [(price, orders) for price in range(BEST_ASK, BEST_ASK + levels)]
+    bids = [(price, orders) for price in range(BEST_BID, BEST_BID - levels, -1)]
+    lob.bulk_load(bids, asks, '0')
+    return lob, time.perf_counter() - start
+
+
+def _queues(lob):
+    # The two books were stamped at different times
+    _, _, bids, asks = lob.export_state()
+    return [[(price, [(order_id, quantity, trader_id) for order_id, quantity, _, trader_id in orders])
+             for price, orders in levels] for levels in (bids, asks)]
+
+
+def main():
+    levels = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    orders_per_level = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f'{levels} levels of {orders_per_level} orders per side')
+    print(f"{'backend':<10}{'replay ms':>12}{'bulk ms':>12}{'speedup':>10}")
+    for backend in BOOK_BACKENDS:
+        # Each book is collected before the next is built, a live book
+        # slows down the garbage collector runs of the next one. The
+        # linked orders form cycles, so the books need a full collection.
+        replayed, replay_time = replay(backend, levels, orders_per_level)
+        expected = _queues(replayed)
+        del replayed
+        gc.collect()
+        loaded, load_time = bulk_load(backend, levels, orders_per_level)
+        assert _queues(loaded) == expected
+        del loaded
+        gc.collect()
+        print(f'{backend:<10}{1000 * replay_time:>12.1f}{1000 * load_time:>12.1f}{replay_time / load_time:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Startup time of a deep book rebuilt from a checkpoint compared to
+replaying its orders through process_orders, and the time the book is
+held for the export when a checkpoint is written.
+
+Run from the app directory:
+
+    python -m benchmarks.checkpoint [orders per level]
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+from src.state import (
+    GlobalState
+)
+from src.checkpoint import (
+    read_checkpoint,
+    write_checkpoint,
+    restore_checkpoint
+)
+from src.order import (
+    OrderType
+)
+from src.side import (
+    Side
+)
+
+LEVELS = 100
+
+
+def _orders(orders_per_level):
+    traders = [None, uuid.uuid4(), uuid.uuid4()]
+    orders = []
+    for level in range(LEVELS):
+        for i in range(orders_per_level):
+            for side, price in ((Side.B, 9999 - level), (Side.S, 10000 + level)):
+                orders.append({'instrument': '0',
+                               'order_type': OrderType.Limit,
+                               'side': side,
+                               'quantity': 1 + i % 5,
+                               'price': price,
+                               'trader_id': traders[i % 3]})
+    return orders
+
+
+def main():
+    orders_per_level = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    orders = _orders(orders_per_level)
+    print(f'{len(orders)} resting orders on {2 * LEVELS} levels')
+
+    state = GlobalState(None)
+    state.add_order_book('0')
+    start = time.perf_counter()
+    state.get_current_lob_state('0').process_orders(orders)
+    replay = time.perf_counter() - start
+
+    lob = state.get_current_lob_state('0')
+    start = time.perf_counter()
+    lob.export_state()
+    export = time.perf_counter() - start
+
+    path = os.path.join(tempfile.mkdtemp(), 'books.ckpt')
+    start = time.perf_counter()
+    write_checkpoint(state, path)
+    write = time.perf_counter() - start
+
+    start = time.perf_counter()
+    read_checkpoint(path)
+    read = time.perf_counter() - start
+
+    restored = GlobalState(None)
+    restored.add_order_book('0')
+    start = time.perf_counter()
+    restore_checkpoint(restored, path)
+    restore = time.perf_counter() - start
+    assert restored.get_current_lob_state('0').get_depth() == lob.get_depth()
+
+    print(f'{"replay through process_orders":<34}{1000 * replay:>10.1f} ms')
+    print(f'{"restore from checkpoint":<34}{1000 * restore:>10.1f} ms')
+    print(f'{"  of which reading the file":<34}{1000 * read:>10.1f} ms')
+    print(f'{"book held for the export":<34}{1000 * export:>10.1f} ms')
+    print(f'{"write checkpoint":<34}{1000 * write:>10.1f} ms')
+    print(f'{"checkpoint size":<34}{os.path.getsize(path) / 1e6:>10.2f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Cost of the random draws of an EventGenerator, one NumPy call per sample
+(what the generators did before) against samples handed out from a
+SampleBuffer that draws blocks of SAMPLE_BLOCK.
+
+Run from the app directory:
+
+    python -m benchmarks.event_sampling [number of samples]
+"""
+import sys
+import time
+
+import numpy as np
+
+from src.event_generator import (
+    SampleBuffer,
+    SAMPLE_BLOCK
+)
+
+
+def _per_call(draw, n_samples):
+    start = time.perf_counter()
+    for _ in range(n_samples):
+        draw()
+    return (time.perf_counter() - start) / n_samples
+
+
+def _buffered(draw, n_samples):
+    buffer = SampleBuffer(draw)
+    start = time.perf_counter()
+    for _ in range(n_samples):
+        buffer.next()
+    return (time.perf_counter() - start) / n_samples
+
+
+def main():
+    n_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = np.random.RandomState(1)
+    samplers = [
+        ('arrival',
+         lambda: int(rng.exponential(1.0 / 1.1, 1)[0] * 1e9),
+         lambda count: (rng.exponential(1.0 / 1.1, count) * 1e9).astype(np.int64)),
+        ('limit size',
+         lambda: int(rng.randint(1, 10)),
+         lambda count: rng.randint(1, 10, count)),
+        ('market size',
+         lambda: max(rng.geometric(0.04, 1)[0].item(), 1),
+         lambda count: np.maximum(rng.geometric(0.04, count), 1)),
+    ]
+    print(f'{n_samples} samples, blocks of {SAMPLE_BLOCK}')
+    print(f"{'sample':<14}{'per call ns':>14}{'buffered ns':>14}{'speedup':>10}")
+    for name, scalar, block in samplers:
+        per_call = _per_call(scalar, n_samples)
+        buffered = _buffered(block, n_samples)
+        print(f'{name:<14}{1e9 * per_call:>14.0f}{1e9 * buffered:>14.0f}{per_call / buffered:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
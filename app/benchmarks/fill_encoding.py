@@ -0,0 +1,80 @@
+"""
+Cost of turning the fills of market orders into wire messages, with the
+message dicts of get_trade_messages and get_remove_and_modify_messages
+serialized by json.dumps, and with the single-pass TransactionList.encode.
+
+Both produce the aggressor and passive execution reports, the public
+trade prints and the public remove/modify messages of every fill. The
+dict path serializes the public messages once, the feed would do that
+once per subscriber.
+
+Run from the app directory:
+
+    python -m benchmarks.fill_encoding [number of sweeps]
+"""
+import json
+import sys
+import time
+import uuid
+
+from src.orderbook import (
+    OrderBook
+)
+from src.order import (
+    OrderType
+)
+from src.side import (
+    Side
+)
+
+LEVELS = 20
+ORDERS_PER_LEVEL = 10
+
+
+def _sweeps(n_sweeps):
+    # Client orders, so the fills are Fill records, and partial fills on the last level
+    lob = OrderBook()
+    maker = uuid.uuid4()
+    taker = uuid.uuid4()
+    sweeps = []
+    for _ in range(n_sweeps):
+        lob.process_orders([{'instrument': '0',
+                             'order_type': OrderType.Limit,
+                             'side': Side.S,
+                             'quantity': 1 + i % 3,
+                             'price': 10000 + level,
+                             'trader_id': maker}
+                            for level in range(LEVELS) for i in range(ORDERS_PER_LEVEL)])
+        trades, _, _ = lob.process_order({'instrument': '0',
+                                          'order_type': OrderType.Market,
+                                          'side': Side.B,
+                                          'quantity': LEVELS * ORDERS_PER_LEVEL * 2 - 5,
+                                          'trader_id': taker}, False, False)
+        sweeps.append(trades)
+    return sweeps
+
+
+def encode_dicts(trades):
+    aggressor_messages, passive_messages = trades.get_trade_messages()
+    aggressor_reports = [json.dumps(message) for message in aggressor_messages]
+    passive_reports = [(trader_id, json.dumps(message)) for trader_id, message in passive_messages]
+    book_deltas = [json.dumps(message) for message in trades.get_remove_and_modify_messages()]
+    return aggressor_reports, passive_reports, book_deltas
+
+
+def main():
+    n_sweeps = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    sweeps = _sweeps(n_sweeps)
+    n_fills = sum(len(trades.get_remove_and_modify_messages()) for trades in sweeps)
+    print(f'{n_sweeps} sweeps, {n_fills} fills')
+    print(f"{'encoder':<14}{'ns/fill':>10}")
+    for name, encode in (('dicts + json', encode_dicts), ('single-pass', lambda trades: trades.encode())):
+        start = time.perf_counter()
+        for trades in sweeps:
+            encode(trades)
+        elapsed = time.perf_counter() - start
+        print(f'{name:<14}{1e9 * elapsed / n_fills:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Cost of building fills during a sweep, with the compact Fill records and
+with the strict debug mode that runs every fill through the checking
+setters of Transaction, AggressingParty and PassiveParty (what every fill
+cost before the compact records).
+
+Market orders of client traders sweep a book of client orders, so every
+fill goes through the order by order matching loop instead of the whole
+level fast path.
+
+Run from the app directory:
+
+    python -m benchmarks.fill_records [number of sweeps]
+"""
+import sys
+import time
+import uuid
+
+from src.orderbook import (
+    OrderBook
+)
+from src.order import (
+    OrderType
+)
+from src.side import (
+    Side
+)
+
+LEVELS = 20
+ORDERS_PER_LEVEL = 10
+
+
+def _refill(lob, maker):
+    lob.process_orders([{'instrument': '0',
+                         'order_type': OrderType.Limit,
+                         'side': Side.S,
+                         'quantity': 1 + i % 3,
+                         'price': 10000 + level,
+                         'trader_id': maker}
+                        for level in range(LEVELS) for i in range(ORDERS_PER_LEVEL)])
+
+
+def run(strict, n_sweeps):
+    lob = OrderBook(strict=strict)
+    maker = uuid.uuid4()
+    taker = uuid.uuid4()
+    elapsed = 0.0
+    fills = 0
+    for _ in range(n_sweeps):
+        _refill(lob, maker)
+        order = {'instrument': '0',
+                 'order_type': OrderType.Market,
+                 'side': Side.B,
+                 'quantity': LEVELS * ORDERS_PER_LEVEL * 2,
+                 'trader_id': taker}
+        start = time.perf_counter()
+        trades, _, _ = lob.process_order(order, False, False)
+        elapsed += time.perf_counter() - start
+        fills += len(trades.get_remove_and_modify_messages())
+    return fills / elapsed
+
+
+def main():
+    n_sweeps = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print(f'{n_sweeps} sweeps of {LEVELS * ORDERS_PER_LEVEL} resting orders')
+    print(f"{'fills':<10}{'fills/s':>12}")
+    for strict in (False, True):
+        print(f"{'strict' if strict else 'compact':<10}{run(strict, n_sweeps):>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
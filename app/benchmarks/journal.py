@@ -0,0 +1,81 @@
+"""
+Orders per second of the single-writer matching thread with the
+write-ahead journal off and on for a few group commit latencies, and the
+number of fsyncs the writer needed for them.
+
+Run from the app directory:
+
+    python -m benchmarks.journal [number of orders]
+"""
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from src.state import (
+    GlobalState
+)
+from src.journal import (
+    CLIENT
+)
+from benchmarks.single_writer import (
+    _orders
+)
+
+
+def _execute(state, lob, command):
+    order = command.payload
+    quantity = order['quantity']
+    result = lob.process_order(order, False, False)
+    journal = state.journal
+    if journal is not None:
+        journal.new_order(CLIENT, result[1], quantity)
+    return result
+
+
+def run(max_latency, n_orders):
+    state = GlobalState(None)
+    state.add_order_book('0')
+    directory = None
+    if max_latency is not None:
+        directory = tempfile.mkdtemp()
+        state.start_journal(directory, max_latency)
+    state.start_matching(4096, 'block')
+
+    done = threading.Event()
+    responses = [0]
+
+    def respond(state, lob, command, result):
+        responses[0] += 1
+        if responses[0] == n_orders:
+            done.set()
+
+    orders = _orders(n_orders, 0)
+    start = time.perf_counter()
+    for order in orders:
+        state.submit('0', _execute, respond, order)
+    done.wait()
+    elapsed = time.perf_counter() - start
+
+    state.stopper.set()
+    state.close()
+    stats = state.journal.stats() if state.journal is not None else None
+    if directory is not None:
+        shutil.rmtree(directory)
+    return n_orders / elapsed, stats
+
+
+def main():
+    n_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    print(f'{n_orders} orders through one single-writer book')
+    print(f"{'journal':<12}{'orders/s':>12}{'fsyncs':>10}{'max group':>12}")
+    rate, _ = run(None, n_orders)
+    print(f"{'off':<12}{rate:>12,.0f}{'-':>10}{'-':>12}")
+    for max_latency in (0.001, 0.005, 0.020):
+        rate, stats = run(max_latency, n_orders)
+        print(f"{f'{1000 * max_latency:g} ms':<12}{rate:>12,.0f}{stats['commits']:>10}{stats['max_group']:>12}")
+
+
+if __name__ == '__main__':
+    main()
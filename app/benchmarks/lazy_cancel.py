@@ -0,0 +1,144 @@
+"""
+Compares eager and lazy cancels on the event mix of run_market_data_simulation.
+
+The simulation runs one add and one cancel generator per side for each of the
+15 levels, pegged to the opposite best price, and one market order generator
+per side. The merged Poisson streams are replayed here as a sequence of events
+drawn in proportion to the generator arrival rates, with the same seed for
+both cancel modes, so both books see exactly the same events. The modes take
+turns and every figure is the best of REPEATS runs.
+
+Run from the app directory:
+
+    python -m benchmarks.lazy_cancel [number of events]
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+from src.orderbook import (
+    OrderBook,
+    CANCEL_MODES
+)
+from src.order import (
+    OrderType
+)
+from src.side import (
+    Side
+)
+
+N_LEVELS = 15
+BEST_BID = 9999
+BEST_ASK = 10000
+REPEATS = 5
+
+
+def _generators():
+    # (event type, side, level, arrival rate) as set up in run_market_data_simulation
+    generators = []
+    for side in (Side.B, Side.S):
+        for level in range(1, N_LEVELS + 1):
+            generators.append(('add', side, level, 1.10 * np.exp(-0.08 * (level - 1))))
+    for side in (Side.B, Side.S):
+        for level in range(1, N_LEVELS + 1):
+            generators.append(('cancel', side, level, 1.0 * np.exp(-0.10 * (level - 1))))
+    for side in (Side.B, Side.S):
+        generators.append(('market', side, None, 0.5))
+    return generators
+
+
+def _initialize(lob):
+    for level in range(20):
+        for _ in range(10):
+            for side, price in ((Side.B, BEST_BID - level), (Side.S, BEST_ASK + level)):
+                lob.process_order({'instrument': '0',
+                                   'order_type': OrderType.Limit,
+                                   'side': side,
+                                   'quantity': 1,
+                                   'price': price}, False, False)
+
+
+def _price_level(lob, side, level):
+    best_bid = lob.get_best_bid()
+    best_ask = lob.get_best_ask()
+    if side == Side.B:
+        return (best_bid if best_ask is None else best_ask) - level
+    return (best_ask if best_bid is None else best_bid) + level
+
+
+def _choose_order_id(lob, side, price, rng):
+    tree = lob.bids if side == Side.B else lob.asks
+    if not tree.price_exists(price):
+        return None
+    order_list = tree.get_price_list(price)
+    if order_list.volume == 0:
+        return None
+    return rng.choice([order.order_id for order in order_list])
+
+
+def run(cancel_mode, n_events, seed=11):
+    generators = _generators()
+    weights = [rate for _, _, _, rate in generators]
+    rng = random.Random(seed)
+    quantities = np.random.RandomState(seed)
+
+    lob = OrderBook(cancel_mode=cancel_mode)
+    _initialize(lob)
+
+    elapsed = {'add': 0.0, 'cancel': 0.0, 'market': 0.0}
+    counts = {'add': 0, 'cancel': 0, 'market': 0}
+    for event_type, side, level, _ in rng.choices(generators, weights, k=n_events):
+        if event_type == 'add':
+            order = {'instrument': '0',
+                     'order_type': OrderType.Limit,
+                     'side': side,
+                     'quantity': rng.randint(1, 9),
+                     'price': _price_level(lob, side, level)}
+            start = time.perf_counter()
+            lob.process_order(order, False, False)
+        elif event_type == 'cancel':
+            order_id = _choose_order_id(lob, side, _price_level(lob, side, level), rng)
+            if order_id is None:
+                continue
+            start = time.perf_counter()
+            lob.cancel(order_id)
+        else:
+            order = {'instrument': '0',
+                     'order_type': OrderType.Market,
+                     'side': side,
+                     'quantity': max(quantities.geometric(0.04), 1)}
+            start = time.perf_counter()
+            lob.process_order(order, False, False)
+        elapsed[event_type] += time.perf_counter() - start
+        counts[event_type] += 1
+
+    return elapsed, counts, lob
+
+
+def main():
+    n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f'{n_events} simulated events')
+    print(f"{'mode':<8}{'add ns':>10}{'cancel ns':>12}{'market ns':>12}{'events/s':>14}")
+    books = []
+    best = {cancel_mode: None for cancel_mode in CANCEL_MODES}
+    for _ in range(REPEATS):
+        for cancel_mode in CANCEL_MODES:
+            elapsed, counts, lob = run(cancel_mode, n_events)
+            books.append(lob.get_depth())
+            per_event = {key: 1e9 * elapsed[key] / max(counts[key], 1) for key in elapsed}
+            per_event['rate'] = sum(counts.values()) / sum(elapsed.values())
+            if best[cancel_mode] is None:
+                best[cancel_mode] = per_event
+            else:
+                best[cancel_mode] = {key: (max if key == 'rate' else min)(value, best[cancel_mode][key])
+                                     for key, value in per_event.items()}
+    for cancel_mode, per_event in best.items():
+        print(f"{cancel_mode:<8}{per_event['add']:>10.0f}{per_event['cancel']:>12.0f}"
+              f"{per_event['market']:>12.0f}{per_event['rate']:>14,.0f}")
+    assert all(book == books[0] for book in books)
+
+
+if __name__ == '__main__':
+    main()
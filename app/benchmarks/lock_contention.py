@@ -0,0 +1,99 @@
+"""
+Lock wait time of order entry threads with one lock for all books (the old
+GlobalState.lock) and with one lock per book.
+
+Every thread plays a client sending random limit and market orders to one
+of the books, threads are spread evenly over the books. The contention
+column is the share of acquires that found the lock taken, wait is the
+mean wait of those acquires.
+
+Run from the app directory:
+
+    python -m benchmarks.lock_contention [orders per thread]
+"""
+import random
+import sys
+import threading
+import time
+
+from src.orderbook import (
+    OrderBook
+)
+from src.locks import (
+    InstrumentedLock
+)
+from src.order import (
+    OrderType
+)
+from src.side import (
+    Side
+)
+
+THREADS = 8
+BOOKS = [1, 2, 4, 8]
+
+
+def _client(book, lock, instrument, n_orders, seed):
+    rng = random.Random(seed)
+    for _ in range(n_orders):
+        side = Side.B if rng.random() < 0.5 else Side.S
+        if rng.random() < 0.9:
+            offset = rng.randint(1, 20)
+            order = {'instrument': instrument,
+                     'order_type': OrderType.Limit,
+                     'side': side,
+                     'quantity': rng.randint(1, 9),
+                     'price': 10000 - offset if side == Side.B else 9999 + offset}
+        else:
+            order = {'instrument': instrument,
+                     'order_type': OrderType.Market,
+                     'side': side,
+                     'quantity': rng.randint(1, 30)}
+        lock.acquire()
+        book.process_order(order, False, False)
+        lock.release()
+
+
+def run(n_books, per_book, n_orders):
+    instruments = [str(i) for i in range(n_books)]
+    books = {instrument: OrderBook() for instrument in instruments}
+    if per_book:
+        locks = {instrument: InstrumentedLock(f'book-{instrument}') for instrument in instruments}
+    else:
+        lock = InstrumentedLock('global')
+        locks = {instrument: lock for instrument in instruments}
+
+    threads = []
+    for i in range(THREADS):
+        instrument = instruments[i % n_books]
+        threads.append(threading.Thread(target=_client,
+                                        args=(books[instrument], locks[instrument], instrument, n_orders, i)))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    unique = {id(lock): lock for lock in locks.values()}.values()
+    acquisitions = sum(lock.acquisitions for lock in unique)
+    contentions = sum(lock.contentions for lock in unique)
+    wait_ns = sum(lock.wait_ns for lock in unique)
+    return acquisitions, contentions, wait_ns, THREADS * n_orders / elapsed
+
+
+def main():
+    n_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    print(f'{THREADS} threads, {n_orders} orders per thread')
+    print(f"{'books':<7}{'locking':<10}{'contention':>12}{'wait us':>10}{'orders/s':>12}")
+    for n_books in BOOKS:
+        for per_book in (False, True):
+            acquisitions, contentions, wait_ns, rate = run(n_books, per_book, n_orders)
+            share = contentions / acquisitions
+            wait = wait_ns / max(contentions, 1) / 1000
+            locking = 'per-book' if per_book else 'global'
+            print(f'{n_books:<7}{locking:<10}{share:>12.2%}{wait:>10.1f}{rate:>12,.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Measures the memory cost of a resting order for each OrderBook backend.
+
+The object backends ('tree', 'ladder') keep one Order per resting order, the
+'array' backend keeps the order fields in the NumPy arrays of an OrderStore.
+
+Run from the app directory:
+
+    python -m benchmarks.order_store_memory [number of orders]
+"""
+import gc
+import sys
+import tracemalloc
+
+from src.orderbook import (
+    OrderBook,
+    BOOK_BACKENDS
+)
+from src.order import (
+    OrderType
+)
+from src.side import (
+    Side
+)
+
+BEST_BID = 9999
+BEST_ASK = 10000
+N_LEVELS = 500
+
+
+def _fill_book(lob, n_orders):
+    for i in range(n_orders):
+        level = (i // 2) % N_LEVELS
+        if i % 2 == 0:
+            side, price = Side.B, BEST_BID - level
+        else:
+            side, price = Side.S, BEST_ASK + level
+        lob.process_order({'instrument': '0',
+                           'order_type': OrderType.Limit,
+                           'side': side,
+                           'quantity': 1 + i % 9,
+                           'price': price}, False, False)
+
+
+def bytes_per_order(backend, n_orders):
+    gc.collect()
+    tracemalloc.start()
+    # The array store is sized up front, the object pools are left empty so
+    # every Order is allocated on insert.
+    pool_size = n_orders if backend == 'array' else 0
+    lob = OrderBook(backend=backend, pool_size=pool_size)
+    _fill_book(lob, n_orders)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(lob.bids) + len(lob.asks) == n_orders
+    return current / n_orders
+
+
+def main():
+    n_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f'{n_orders} resting orders')
+    print(f"{'backend':<10}{'bytes/order':>14}")
+    for backend in BOOK_BACKENDS:
+        print(f'{backend:<10}{bytes_per_order(backend, n_orders):>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Compares the SortedDict OrderTree against the dense PriceLadder and the
+ArrayOrderTree on add, cancel and sweep workloads through the OrderBook,
+and on creating and removing levels directly on one side ('levels').
+
+Finding and removing a level is a small part of what process_order does,
+so on the book workloads the ladder is on par with the tree. The levels
+workload times the price index alone, which is where the ladder is
+faster. Every workload reports the best of REPEATS runs.
+
+Run from the app directory:
+
+    python -m benchmarks.order_tree_backends
+"""
+import random
+import time
+
+from src.orderbook import (
+    OrderBook,
+    BOOK_BACKENDS
+)
+from src.order import (
+    OrderType
+)
+from src.side import (
+    Side
+)
+
+BEST_BID = 9999
+BEST_ASK = 10000
+N_LEVELS = 200
+N_ORDERS = 50_000
+N_LEVEL_CHANGES = 200_000
+REPEATS = 5
+
+
+def _limit_order(side, price, quantity):
+    return {'instrument': '0',
+            'order_type': OrderType.Limit,
+            'side': side,
+            'quantity': quantity,
+            'price': price}
+
+
+def _market_order(side, quantity):
+    return {'instrument': '0',
+            'order_type': OrderType.Market,
+            'side': side,
+            'quantity': quantity}
+
+
+def _random_limit_orders(seed, n):
+    rng = random.Random(seed)
+    orders = []
+    for _ in range(n):
+        if rng.random() < 0.5:
+            orders.append(_limit_order(Side.B, BEST_BID - rng.randrange(N_LEVELS), rng.randint(1, 9)))
+        else:
+            orders.append(_limit_order(Side.S, BEST_ASK + rng.randrange(N_LEVELS), rng.randint(1, 9)))
+    return orders
+
+
+def bench_add(backend):
+    orders = _random_limit_orders(1, N_ORDERS)
+    lob = OrderBook(backend=backend)
+    start = time.perf_counter()
+    for order in orders:
+        lob.process_order(order, False, False)
+    return time.perf_counter() - start
+
+
+def bench_cancel(backend):
+    orders = _random_limit_orders(2, N_ORDERS)
+    lob = OrderBook(backend=backend)
+    for order in orders:
+        lob.process_order(order, False, False)
+    cancels = [order['order_id'] for order in orders]
+    random.Random(3).shuffle(cancels)
+    start = time.perf_counter()
+    for order_id in cancels:
+        lob.cancel(order_id)
+    return time.perf_counter() - start
+
+
+def bench_sweep(backend):
+    lob = OrderBook(backend=backend)
+    for price in range(BEST_ASK, BEST_ASK + N_LEVELS):
+        for _ in range(10):
+            lob.process_order(_limit_order(Side.S, price, 5), False, False)
+    # Each market order takes out a few levels and the book is refilled behind it
+    start = time.perf_counter()
+    n_sweeps = 2000
+    for _ in range(n_sweeps):
+        lob.process_order(_market_order(Side.B, 150), False, False)
+        for price in range(lob.get_best_ask() - 3, lob.get_best_ask()):
+            for _ in range(10):
+                lob.process_order(_limit_order(Side.S, price, 5), False, False)
+    return time.perf_counter() - start
+
+
+def bench_levels(backend):
+    rng = random.Random(4)
+    prices = [BEST_BID - rng.randrange(10 * N_LEVELS) for _ in range(N_LEVEL_CHANGES)]
+    tree = BOOK_BACKENDS[backend](side=Side.B)
+    # A level appears when its price is hit for the first time and goes at the next hit
+    start = time.perf_counter()
+    for price in prices:
+        if tree.price_exists(price):
+            tree.remove_price(price)
+        else:
+            tree.create_price(price)
+        tree.best()
+    return time.perf_counter() - start
+
+
+def main():
+    workloads = [('add', bench_add), ('cancel', bench_cancel), ('sweep', bench_sweep), ('levels', bench_levels)]
+    print(f"{'workload':<10}" + ''.join(f'{backend:>12}' for backend in BOOK_BACKENDS))
+    for name, bench in workloads:
+        timings = [min(bench(backend) for _ in range(REPEATS)) for backend in BOOK_BACKENDS]
+        print(f'{name:<10}' + ''.join(f'{t * 1000:>10.1f}ms' for t in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Replays a recording of order flow into a fresh book of every backend at
+full speed and prints events/s, the latency distribution per event type
+and the hash of the final book, which has to agree between backends.
+
+Without a recording one is made first: the market data simulation of
+main.py runs headless on a journaled book, with the event generators
+drawn in proportion to their arrival rates instead of sleeping.
+
+Run from the app directory:
+
+    python -m benchmarks.replay [journal directory, .jsonl file or number of events to record]
+
+A recording should start on the initial book of main.py with the shipped
+config (20 levels of 10 orders of 1 from 9999 and 10000 out), which the
+replay seeds before the first event.
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from src.state import (
+    GlobalState
+)
+from src.orderbook import (
+    BOOK_BACKENDS
+)
+from src.event_generator import (
+    execute_event
+)
+from src.simulation import (
+    create_generators
+)
+from src.replay import (
+    ReplayEngine,
+    open_recording,
+    book_hash
+)
+
+BEST_BID = 9999
+BEST_ASK = 10000
+LEVELS = 20
+ORDERS = 10
+VOLUME = 1
+
+
+def _seed(order_book):
+    orders = [(VOLUME, None)] * ORDERS
+    asks = [(price, orders) for price in range(BEST_ASK, BEST_ASK + LEVELS)]
+    bids = [(price, orders) for price in range(BEST_BID, BEST_BID - LEVELS, -1)]
+    order_book.bulk_load(bids, asks, '0')
+
+
+def record(directory, n_events):
+    np.random.seed(1)
+    random.seed(1)
+    state = GlobalState(None)
+    state.add_order_book('0')
+    _seed(state.get_current_lob_state('0'))
+    state.start_journal(directory)
+    generators = create_generators('0')
+    rates = np.array([generator.arrival_rate for generator in generators])
+    for index in np.random.choice(len(generators), n_events, p=rates / rates.sum()):
+        state.submit('0', execute_event, None, generators[index])
+    state.stopper.set()
+    state.close()
+    return state.get_current_lob_state('0')
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    n_events = 200_000
+    if path is not None and path.isdigit():
+        n_events = int(path)
+        path = None
+    directory = None
+    if path is None:
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'journal')
+        order_book = record(path, n_events)
+        print(f'Recorded {n_events} simulated events to {path}, book hash {book_hash({"0": order_book})}')
+
+    try:
+        for backend in BOOK_BACKENDS:
+            engine = ReplayEngine(backend=backend)
+            _seed(engine.get_order_book('0'))
+            report = engine.run(open_recording(path))
+            print(f'\n{backend}')
+            print(report)
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Orders per second of the sharded engine as instruments and worker processes
+are added, next to all books matching in the main process (0 workers).
+
+Every instrument gets the same stream of random limit and market orders,
+sent in batches. One round sends the next batch of every instrument at
+once, so the workers match in parallel, and only the market data deltas
+come back. Scaling is bounded by the number of cores, which is printed
+first.
+
+The second table sends the same orders one command at a time through
+GlobalState.submit, the path of the gateways and the simulator, and
+counts the responses.
+
+Run from the app directory:
+
+    python -m benchmarks.sharded_engine [orders per instrument]
+"""
+import os
+import random
+import sys
+import threading
+import time
+
+from src.orderbook import (
+    OrderBook
+)
+from src.shard import (
+    ShardedEngine
+)
+from src.state import (
+    GlobalState
+)
+from src.order import (
+    OrderType
+)
+from src.side import (
+    Side
+)
+
+BATCH_SIZE = 500
+INSTRUMENTS = [1, 2, 4, 8]
+WORKERS = [0, 1, 2, 4, 8]
+
+
+def _orders(instrument, n_orders, seed=5):
+    rng = random.Random(seed)
+    orders = []
+    for _ in range(n_orders):
+        side = Side.B if rng.random() < 0.5 else Side.S
+        if rng.random() < 0.9:
+            offset = rng.randint(1, 20)
+            orders.append({'instrument': instrument,
+                           'order_type': OrderType.Limit,
+                           'side': side,
+                           'quantity': rng.randint(1, 9),
+                           'price': 10000 - offset if side == Side.B else 9999 + offset})
+        else:
+            orders.append({'instrument': instrument,
+                           'order_type': OrderType.Market,
+                           'side': side,
+                           'quantity': rng.randint(1, 30)})
+    return orders
+
+
+def _rounds(instruments, n_orders):
+    streams = {instrument: _orders(instrument, n_orders) for instrument in instruments}
+    return [{instrument: stream[start:start + BATCH_SIZE] for instrument, stream in streams.items()}
+            for start in range(0, n_orders, BATCH_SIZE)]
+
+
+def orders_per_second(n_instruments, workers, n_orders):
+    instruments = [str(i) for i in range(n_instruments)]
+    rounds = _rounds(instruments, n_orders)
+
+    if workers == 0:
+        books = {instrument: OrderBook() for instrument in instruments}
+        start = time.perf_counter()
+        for batches in rounds:
+            for instrument, batch in batches.items():
+                books[instrument].process_orders(batch)
+        elapsed = time.perf_counter() - start
+    else:
+        engine = ShardedEngine({instrument: {} for instrument in instruments}, workers)
+        try:
+            start = time.perf_counter()
+            for batches in rounds:
+                engine.process_orders(batches, outcomes=False)
+            elapsed = time.perf_counter() - start
+        finally:
+            engine.close()
+
+    return n_instruments * n_orders / elapsed
+
+
+class _Responses(object):
+    '''Counts the responses of the submitted commands'''
+
+    def __init__(self, expected):
+        self.expected = expected
+        self.count = 0
+        self.done = threading.Event()
+
+    def add(self):
+        self.count += 1
+        if self.count == self.expected:
+            self.done.set()
+
+
+def _execute(state, lob, command):
+    return lob.process_order(command.payload, False, False)
+
+
+def _respond(state, lob, command, result):
+    command.client.add()
+
+
+def submitted_per_second(n_instruments, workers, n_orders):
+    instruments = [str(i) for i in range(n_instruments)]
+    streams = [_orders(instrument, n_orders) for instrument in instruments]
+    commands = [(instrument, order) for orders in zip(*streams) for instrument, order in zip(instruments, orders)]
+
+    state = GlobalState(None)
+    if workers == 0:
+        for instrument in instruments:
+            state.add_order_book(instrument)
+    else:
+        state.add_sharded_order_books({instrument: {} for instrument in instruments}, workers)
+    responses = _Responses(len(commands))
+    try:
+        start = time.perf_counter()
+        for instrument, order in commands:
+            state.submit(instrument, _execute, _respond, order, responses)
+        responses.done.wait()
+        elapsed = time.perf_counter() - start
+    finally:
+        state.close()
+
+    return len(commands) / elapsed
+
+
+def _table(title, rate, n_orders):
+    print(title)
+    print(f"{'instruments':<13}" + ''.join(f"{f'{workers} workers':>14}" for workers in WORKERS))
+    for n_instruments in INSTRUMENTS:
+        row = f'{n_instruments:<13}'
+        for workers in WORKERS:
+            if workers > n_instruments:
+                row += f"{'-':>14}"
+            else:
+                row += f'{rate(n_instruments, workers, n_orders):>14,.0f}'
+        print(row)
+
+
+def main():
+    n_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    print(f'{os.cpu_count()} cores, {n_orders} orders per instrument')
+    _table(f'\nprocess_orders, batches of {BATCH_SIZE}', orders_per_second, n_orders)
+    _table('\nGlobalState.submit, one command at a time', submitted_per_second, n_orders)
+
+
+if __name__ == '__main__':
+    main()
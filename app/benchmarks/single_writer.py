@@ -0,0 +1,103 @@
+"""
+Orders per second through GlobalState.submit with the book locked per
+order and with a single-writer matching thread per book, for each wait
+strategy of the command and result rings.
+
+Producer threads play order entry clients sending random limit and market
+orders to one book. The clock stops when the responses of all orders have
+been handled.
+
+Run from the app directory:
+
+    python -m benchmarks.single_writer [orders per producer]
+"""
+import random
+import sys
+import threading
+import time
+
+from src.state import (
+    GlobalState
+)
+from src.ringbuffer import (
+    WAIT_STRATEGIES
+)
+from src.order import (
+    OrderType
+)
+from src.side import (
+    Side
+)
+
+PRODUCERS = 4
+
+
+def _orders(n_orders, seed):
+    rng = random.Random(seed)
+    orders = []
+    for _ in range(n_orders):
+        side = Side.B if rng.random() < 0.5 else Side.S
+        if rng.random() < 0.9:
+            offset = rng.randint(1, 20)
+            orders.append({'instrument': '0',
+                           'order_type': OrderType.Limit,
+                           'side': side,
+                           'quantity': rng.randint(1, 9),
+                           'price': 10000 - offset if side == Side.B else 9999 + offset})
+        else:
+            orders.append({'instrument': '0',
+                           'order_type': OrderType.Market,
+                           'side': side,
+                           'quantity': rng.randint(1, 30)})
+    return orders
+
+
+def _execute(state, lob, command):
+    return lob.process_order(command.payload, False, False)
+
+
+def run(matching, wait_strategy, n_orders):
+    state = GlobalState(None)
+    state.add_order_book('0')
+    if matching == 'single-writer':
+        state.start_matching(4096, wait_strategy)
+
+    total = PRODUCERS * n_orders
+    done = threading.Event()
+    responses = [0]
+
+    def respond(state, lob, command, result):
+        responses[0] += 1
+        if responses[0] == total:
+            done.set()
+
+    def produce(orders):
+        for order in orders:
+            state.submit('0', _execute, respond, order)
+
+    streams = [_orders(n_orders, seed) for seed in range(PRODUCERS)]
+    threads = [threading.Thread(target=produce, args=(orders,)) for orders in streams]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.wait()
+    elapsed = time.perf_counter() - start
+
+    state.stopper.set()
+    state.close()
+    return total / elapsed
+
+
+def main():
+    n_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    print(f'{PRODUCERS} producers, {n_orders} orders per producer')
+    print(f"{'matching':<15}{'wait':<8}{'orders/s':>12}")
+    print(f"{'locked':<15}{'-':<8}{run('locked', None, n_orders):>12,.0f}")
+    for wait_strategy in WAIT_STRATEGIES:
+        print(f"{'single-writer':<15}{wait_strategy:<8}{run('single-writer', wait_strategy, n_orders):>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Best price lookups per second on an OrderTree, comparing the lookup through
+the SortedDict keys view (the former max_price/min_price implementation)
+with the cached OrderTree.best().
+
+Run from the app directory:
+
+    python -m benchmarks.top_of_book
+"""
+import timeit
+
+from src.ordertree import (
+    OrderTree
+)
+from src.side import (
+    Side
+)
+
+N_LEVELS = 500
+N_LOOKUPS = 1_000_000
+
+
+def _build_tree(side):
+    tree = OrderTree(side=side)
+    order_id = 0
+    for price in range(10000 - N_LEVELS, 10000):
+        for _ in range(5):
+            tree.insert_order({'order_id': order_id,
+                               'price': price,
+                               'quantity': 1,
+                               'timestamp': 0,
+                               'side': side,
+                               'instrument': '0'})
+            order_id += 1
+    return tree
+
+
+def _keys_view_lookup(tree):
+    # What max_price() + max_price_list() did before the top of book was cached
+    if tree.depth > 0:
+        price = tree.prices[-1]
+        return price, tree.get_price_list(price)
+    return None, None
+
+
+def main():
+    tree = _build_tree(Side.B)
+    assert _keys_view_lookup(tree) == tree.best()
+
+    before = timeit.timeit(lambda: _keys_view_lookup(tree), number=N_LOOKUPS)
+    after = timeit.timeit(tree.best, number=N_LOOKUPS)
+
+    print(f'{N_LEVELS} levels, {N_LOOKUPS} lookups')
+    print(f"{'keys view':<12}{N_LOOKUPS / before:>14,.0f} lookups/s")
+    print(f"{'best()':<12}{N_LOOKUPS / after:>14,.0f} lookups/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import os
 import threading
 import logging
 import time
@@ -6,16 +7,12 @@ from src.state import (
     GlobalState
 )
 
-from src.order import (
-    OrderType
-)
-
 from src.config_reader import (
     ConfigReader
 )
 
-from src.side import (
-    Side
+from src.clock import (
+    VirtualClock
 )
 
 from src.order_entry import (
@@ -31,6 +28,12 @@ from src.simulation import (
     run_market_data_simulation
 )
 
+from src.checkpoint import (
+    write_checkpoint,
+    restore_checkpoint,
+    checkpoint_loop
+)
+
 format = "%(asctime)s: %(message)s"
 logging.basicConfig(format=format, level=logging.INFO,
                     datefmt="%H:%M:%S")
@@ -40,7 +43,14 @@ def main():
 
     config = ConfigReader("src/etc/config.ini")
 
-    state = GlobalState(config)
+    clock = None
+    if config.simulate and config.simulation_speed is not None:
+        if config.workers > 0:
+            raise ValueError('Simulation speed needs the books in-process, workers has to be 0.')
+        # Engine time is the simulated time, the event scheduler moves it
+        clock = VirtualClock(time.time_ns())
+
+    state = GlobalState(config, clock)
 
     # Create thread for the public market data feed
     run_public_market_data_feed = threading.Thread(
@@ -64,51 +74,103 @@ def main():
 
     # TODO: put this into config
     # Add two books
-    state.add_order_book("0")
-    state.add_order_book("1")
-
-    if config.simulate or config.initialize:
-        # Initialize order books
-        limit_orders = []
-        for price in range(config.initial_best_ask, config.initial_best_ask + config.initial_book_levels):
-            for i in range(0, config.initial_orders):
-                order = {'instrument': "0",
-                         'order_type': OrderType.Limit,
-                         'side': Side.S,
-                         'quantity': config.initial_order_volume,
-                         'price': price}
-                limit_orders.append(order)
-
-        for price in range(config.initial_best_bid, config.initial_best_bid - config.initial_book_levels, -1):
-            for i in range(0, config.initial_orders):
-                order = {'instrument': "0",
-                         'order_type': OrderType.Limit,
-                         'side': Side.B,
-                         'quantity': config.initial_order_volume,
-                         'price': price}
-                limit_orders.append(order)
-
-        # Add orders to order book
+    book_args = {}
+    for symbol in ["0", "1"]:
+        book_args[symbol] = {'tick_size': config.tick_size,
+                             'lot_size': config.lot_size,
+                             'backend': config.book_backend,
+                             'pool_size': config.order_pool_size,
+                             'depth_levels': config.depth_levels(symbol),
+                             'cancel_mode': config.cancel_mode,
+                             'smp_mode': config.smp_mode,
+                             'strict': config.strict_fills}
+
+    if config.workers > 0:
+        # Each worker process runs the books of its symbols
+        state.add_sharded_order_books(book_args, config.workers)
+    else:
+        for symbol, kwargs in book_args.items():
+            state.add_order_book(symbol, **kwargs)
+
+    restored = False
+    checkpoint_path = config.checkpoint_path
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        # Resting orders of the last run replace the initial book
+        start = time.perf_counter()
+        symbols = restore_checkpoint(state, checkpoint_path)
+        print(f"Restored {symbols} from {checkpoint_path} in {1000 * (time.perf_counter() - start):.1f} ms.")
+        restored = True
+
+    if (config.simulate or config.initialize) and not restored:
+        # Initialize order books. The configured prices and volumes are
+        # in wire units and are converted into ticks and lots per book.
         order_books = state.get_order_books()
         for instrument_id, order_book in order_books.items():
-            for order in limit_orders:
-                trades = order_book.process_order(order, False, False)
+            scale = order_book.scale
+            best_ask = scale.to_ticks(config.initial_best_ask)
+            best_bid = scale.to_ticks(config.initial_best_bid)
+            quantity = scale.to_lots(config.initial_order_volume)
+
+            # Every level holds the same orders, one list serves all of them
+            orders = [(quantity, None)] * config.initial_orders
+            asks = [(price, orders) for price in range(best_ask, best_ask + config.initial_book_levels)]
+            bids = [(price, orders) for price in range(best_bid, best_bid - config.initial_book_levels, -1)]
+
+            # Add orders to order book
+            with state.get_book_lock(instrument_id):
+                order_book.bulk_load(bids, asks, instrument_id)
+
+    journal_path = config.journal_path
+    if journal_path is not None:
+        journal = state.start_journal(journal_path, config.journal_max_latency, config.journal_segment_records)
+        print(f"Journaling to {journal_path} from sequence {journal.next_sequence}.")
+
+    if config.matching_mode == 'single-writer':
+        # From here on only the matching thread of a book touches it
+        state.start_matching(config.ring_size, config.wait_strategy)
 
     # Start producing market data events
     if config.simulate:
+        start_time = state.clock.now()
+        start_wall = time.time()
         run_market_data_simulation(config, state)
 
+    checkpoint_thread = None
+    if checkpoint_path is not None and config.checkpoint_interval > 0:
+        checkpoint_thread = threading.Thread(
+            target=checkpoint_loop,
+            args=(state, checkpoint_path, config.checkpoint_interval))
+        checkpoint_thread.start()
+
     try:
         while 1:
             time.sleep(.1)
     except KeyboardInterrupt:
+        if checkpoint_path is not None:
+            # Saved while the books still run, orders after it are lost
+            write_checkpoint(state, checkpoint_path)
+            print(f"Order books saved to {checkpoint_path}.")
         print("Attempting to close threads")
         state.stopper.set()
+        if checkpoint_thread is not None:
+            checkpoint_thread.join()
         for thread in state.get_simulation_threads():
             thread.join()
+        if clock is not None:
+            print(f"Simulated {(clock.now() - start_time) / 1e9:.1f} s in {time.time() - start_wall:.1f} s.")
         order_entry_thread.join()
         market_data_thread.join()
+        for engine in state.get_matching_engines().values():
+            engine.join()
+            print(f"Matching {engine.symbol}: {engine.stats()}")
         print("Threads successfully closed")
+        for instrument_id, order_book in state.get_order_books().items():
+            print(f"Order pool of {instrument_id}: {order_book.get_pool_stats()}")
+        for name, stats in state.get_lock_stats().items():
+            print(f"Lock {name}: {stats}")
+        state.close()
+        if state.journal is not None:
+            print(f"Journal: {state.journal.stats()}")
 
     print("System shutdown.")
 
@@ -0,0 +1,71 @@
+"""
+Runs independent headless simulations of the order book on all cores and
+prints statistics aggregated over the sessions.
+
+Run from the app directory, e.g. 200 sessions of one simulated hour with
+market order rates drawn between 0.3 and 0.7 per second:
+
+    python montecarlo.py --sessions 200 --duration 3600 --market-rate 0.3:0.7 --out sessions.jsonl
+
+A rate is a number or a low:high range drawn per session.
+"""
+import argparse
+import json
+import time
+
+from src.montecarlo import (
+    SESSION_STATISTICS,
+    make_specs,
+    run_monte_carlo
+)
+
+
+def _rate(value):
+    if ':' in value:
+        low, high = value.split(':')
+        return float(low), float(high)
+    return float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Monte Carlo runs of the market simulation.')
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=3600, help='simulated seconds per session')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='simulated seconds between samples')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the first session')
+    parser.add_argument('--add-rate', type=_rate, default=1.10)
+    parser.add_argument('--cancel-rate', type=_rate, default=1.0)
+    parser.add_argument('--market-rate', type=_rate, default=0.5)
+    parser.add_argument('--backend', default='tree')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes, all cores by default')
+    parser.add_argument('--out', default=None, help='JSON lines file of the per session summaries')
+    args = parser.parse_args()
+
+    specs = make_specs(args.sessions, args.seed, args.duration, args.sample_interval,
+                       args.add_rate, args.cancel_rate, args.market_rate, backend=args.backend)
+
+    out = open(args.out, 'w') if args.out is not None else None
+
+    def write(summary):
+        if out is None:
+            return
+        record = dict(summary['spec']._asdict())
+        record.update({name: summary[name] for name in SESSION_STATISTICS})
+        record['mid_path'] = [None if mid != mid else mid for mid in summary['mid_path'].tolist()]
+        out.write(json.dumps(record) + '\n')
+
+    start = time.perf_counter()
+    try:
+        aggregate = run_monte_carlo(specs, args.processes, write)
+    finally:
+        if out is not None:
+            out.close()
+    print(aggregate)
+    mean, std = aggregate.mid_path()
+    if len(mean):
+        print(f'mid change at the end {mean[-1]:.3f} +- {std[-1]:.3f} ticks')
+    print(f'{args.sessions} sessions of {args.duration:g} s in {time.perf_counter() - start:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
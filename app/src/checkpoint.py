@@ -0,0 +1,242 @@
+"""
+Checkpoint file layout, all integers little endian:
+
+    header      magic b'SBCP', version u16, number of books u32
+    per book    symbol length u16, symbol utf-8
+                tick size, lot size, next order id, book time and clock
+                time as i64, number of orders u64, number of traders u32
+                16 byte UUID per trader
+                one ORDER_DTYPE record per resting order
+
+Orders are stored bids best price first and then asks best price first,
+in time priority within a level, so loading them in file order restores
+the queues. The trader field is 0 for simulated orders and i for the
+i-th trader of the book otherwise.
+
+Restored client orders keep the TraderId they were entered with, but
+TraderIds are handed out per connection and a client that reconnects
+gets a new one. Nobody owns the restored orders after a restart: they
+can not be canceled or modified through order entry, their fills are
+not reported to anyone and they rest until they trade.
+"""
+import os
+import mmap
+import struct
+import threading
+import uuid
+
+import numpy as np
+
+from .side import (
+    Side
+)
+
+from .clock import (
+    VirtualClock
+)
+
+from .ordertree import (
+    OrderColumns
+)
+
+MAGIC = b'SBCP'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHI')
+_SYMBOL = struct.Struct('<H')
+_BOOK = struct.Struct('<qqqqqQI')
+
+ORDER_DTYPE = np.dtype([('order_id', '<i8'),
+                        ('price', '<i8'),
+                        ('quantity', '<i8'),
+                        ('timestamp', '<i8'),
+                        ('side', 'i1'),
+                        ('trader', '<i4')])
+
+
+class _Capture(object):
+    '''Hands the exported state of a book from its owning thread to the checkpoint writer'''
+    __slots__ = ('done', 'state', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.state = None
+        self.error = None # exception export_state raised
+
+
+def _execute_capture(state, lob, command):
+    return lob.export_state()
+
+
+def _respond_capture(state, lob, command, result):
+    command.client.state = result
+    command.client.done.set()
+
+
+def _fail_capture(state, lob, command, error):
+    command.client.error = error
+    command.client.done.set()
+
+
+def _encode_book(symbol, scale, book_state, clock_time):
+    next_order_id, book_time, bids, asks = book_state
+    trader_index = {None: 0}
+    traders = []
+    records = []
+    for side, levels in ((Side.B, bids), (Side.S, asks)):
+        for price, orders in levels:
+            for order_id, quantity, timestamp, trader_id in orders:
+                index = trader_index.get(trader_id)
+                if index is None:
+                    if not isinstance(trader_id, uuid.UUID):
+                        raise TypeError(f'TraderId has to be type of <uuid.UUID>, was {type(trader_id)}.')
+                    index = len(traders) + 1
+                    trader_index[trader_id] = index
+                    traders.append(trader_id)
+                records.append((order_id, price, quantity, timestamp, side.value, index))
+
+    name = symbol.encode('utf-8')
+    return b''.join([_SYMBOL.pack(len(name)),
+                     name,
+                     _BOOK.pack(scale.tick_size, scale.lot_size, next_order_id, book_time, clock_time,
+                                len(records), len(traders)),
+                     b''.join(trader.bytes for trader in traders),
+                     np.array(records, dtype=ORDER_DTYPE).tobytes()])
+
+
+def write_checkpoint(state, path):
+    """
+    Writes the resting orders, next order id and time of every order book
+    to path.
+
+    Each book is exported by the thread that owns it, the matching thread
+    or the caller under the book lock, so matching only pauses for the
+    copy of one book at a time. Encoding and writing happen on the calling
+    thread. The file is written next to path and renamed over it, a
+    reader never sees a partial checkpoint.
+
+    Raises the exception of a book that could not be exported.
+
+    :return: False if the exchange stopped before all books were exported
+    """
+    captured = []
+    for symbol, lob in state.get_order_books().items():
+        capture = _Capture()
+        # The capture waits for the response like a client, it never goes to a shard worker
+        state.submit(symbol, _execute_capture, _respond_capture, None, capture, _fail_capture)
+        while not capture.done.wait(0.1):
+            if state.stopper.is_set():
+                return False
+        if capture.error is not None:
+            raise capture.error
+        captured.append((symbol, lob.scale, capture.state))
+    clock_time = state.clock.now()
+
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(captured)))
+        for symbol, scale, book_state in captured:
+            f.write(_encode_book(symbol, scale, book_state, clock_time))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    return True
+
+
+def _decode_columns(records, traders):
+    # The records of one side, copied out of the map, are cut into levels where the price changes
+    prices = records['price']
+    starts = np.ones(len(records), dtype=bool)
+    starts[1:] = prices[1:] != prices[:-1]
+    starts = np.flatnonzero(starts)
+    return OrderColumns(prices[starts].astype(np.int64),
+                        np.diff(np.append(starts, len(records))),
+                        records['order_id'].astype(np.int64),
+                        records['quantity'].astype(np.int64),
+                        records['timestamp'].astype(np.int64),
+                        records['trader'].astype(np.int64),
+                        traders)
+
+
+def read_checkpoint(path):
+    """
+    Reads a checkpoint through a memory map. The order records are viewed
+    in place by NumPy and copied column by column into the OrderColumns
+    of each side, no Python object is made per order.
+
+    :return: dict symbol : (tick_size, lot_size, next_order_id, book_time,
+        clock_time, bids, asks) with bids and asks as OrderColumns
+    """
+    books = {}
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, version, n_books = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a checkpoint file.')
+        if version != VERSION:
+            raise ValueError(f'Checkpoint version {version} is not supported, expected {VERSION}.')
+        offset = _HEADER.size
+
+        for _ in range(n_books):
+            (length,) = _SYMBOL.unpack_from(mm, offset)
+            offset += _SYMBOL.size
+            symbol = mm[offset:offset + length].decode('utf-8')
+            offset += length
+            tick_size, lot_size, next_order_id, book_time, clock_time, n_orders, n_traders = \
+                _BOOK.unpack_from(mm, offset)
+            offset += _BOOK.size
+
+            traders = [None]
+            for _ in range(n_traders):
+                traders.append(uuid.UUID(bytes=mm[offset:offset + 16]))
+                offset += 16
+
+            records = np.frombuffer(mm, ORDER_DTYPE, n_orders, offset)
+            # Bids are stored before asks
+            n_bids = int(np.count_nonzero(records['side'] == Side.B.value))
+            if (records['side'][:n_bids] != Side.B.value).any():
+                raise ValueError(f'Orders of {symbol} in {path} are not stored bids first.')
+            bids = _decode_columns(records[:n_bids], traders)
+            asks = _decode_columns(records[n_bids:], traders)
+            # The map can only be closed once no array refers to it
+            del records
+            offset += n_orders * ORDER_DTYPE.itemsize
+
+            books[symbol] = (tick_size, lot_size, next_order_id, book_time, clock_time, bids, asks)
+    return books
+
+
+def restore_checkpoint(state, path):
+    """
+    Bulk loads a checkpoint into the empty order books of the state,
+    without matching. Has to run before the matching threads are started. A
+    VirtualClock is moved forward to the checkpoint time. Restored client
+    orders are left without an owner, see the module docstring.
+
+    :return: list of the restored symbols
+    """
+    if state.get_matching_engines():
+        raise ValueError("Checkpoints have to be restored before the matching threads are started.")
+    books = read_checkpoint(path)
+    for symbol, (tick_size, lot_size, next_order_id, book_time, clock_time, bids, asks) in books.items():
+        if symbol not in state.get_order_books():
+            raise ValueError(f"Checkpoint has a book for symbol {symbol} which does not exist.")
+        lob = state.get_current_lob_state(symbol)
+        if lob.scale.tick_size != tick_size or lob.scale.lot_size != lot_size:
+            raise ValueError(f"Checkpoint of {symbol} has tick size {tick_size} and lot size {lot_size}, "
+                             f"the book has {lob.scale.tick_size} and {lob.scale.lot_size}.")
+        lock = state.get_book_lock(symbol)
+        with lock:
+            lob.import_columns(next_order_id, book_time, bids, asks, symbol)
+
+        clock = state.clock
+        if isinstance(clock, VirtualClock) and clock.now() < clock_time:
+            clock.set(clock_time)
+    return list(books)
+
+
+def checkpoint_loop(state, path, interval):
+    """
+    Writes a checkpoint every interval seconds until the exchange stops.
+    """
+    while not state.stopper.wait(interval):
+        write_checkpoint(state, path)
@@ -0,0 +1,73 @@
+import time
+from datetime import datetime
+
+
+class Clock(object):
+    '''Source of engine timestamps
+
+    Timestamps are integer nanoseconds since the Unix epoch everywhere inside
+    the engine. They are only converted with wire_timestamp or
+    format_timestamp when a message is put on the wire.
+    '''
+
+    def now(self):
+        raise NotImplementedError
+
+
+class RealTimeClock(Clock):
+    '''Wall clock time from a monotonic counter
+
+    time.time_ns() is read once to anchor the clock, after that now() only
+    adds the perf_counter_ns() delta, so timestamps never go backwards when
+    the system clock is adjusted.
+    '''
+    __slots__ = ('_epoch', '_origin')
+
+    def __init__(self):
+        self._origin = time.perf_counter_ns()
+        self._epoch = time.time_ns()
+
+    def now(self):
+        return self._epoch + time.perf_counter_ns() - self._origin
+
+
+class VirtualClock(Clock):
+    '''A clock that only moves when it is told to
+
+    Used by the simulator to drive the engine in virtual time and to get
+    deterministic timestamps in benchmarks.
+    '''
+    __slots__ = ('_now',)
+
+    def __init__(self, start=0):
+        if not isinstance(start, int):
+            raise TypeError(f'Start time has to be <int> nanoseconds, was {type(start)}.')
+        self._now = start
+
+    def now(self):
+        return self._now
+
+    def set(self, timestamp):
+        if timestamp < self._now:
+            raise ValueError(f'Virtual time can not go backwards, {timestamp} < {self._now}.')
+        self._now = timestamp
+
+    def advance(self, nanoseconds):
+        if nanoseconds < 0:
+            raise ValueError(f'Virtual time can not go backwards, was advanced by {nanoseconds}.')
+        self._now += nanoseconds
+
+
+DEFAULT_CLOCK = RealTimeClock()
+
+
+def wire_timestamp(timestamp):
+    '''Nanoseconds to the integer microseconds used in order entry and market data messages.'''
+    return timestamp // 1000
+
+
+def format_timestamp(timestamp):
+    '''Nanoseconds to the local time string of simulator event messages.'''
+    seconds, nanoseconds = divmod(timestamp, 1_000_000_000)
+    dt = datetime.fromtimestamp(seconds).replace(microsecond=nanoseconds // 1000)
+    return dt.strftime('%Y-%m-%d %H:%M:%S.%f')
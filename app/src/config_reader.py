@@ -1,4 +1,5 @@
 import configparser
+import math
 
 
 class ConfigReader:
@@ -47,6 +48,136 @@ class ConfigReader:
     def initial_order_volume(self):
         return int(self._config['book']['initial-order-volume'])
 
+    @property
+    def tick_size(self):
+        return int(self._config['book'].get('tick-size', '1'))
+
+    @property
+    def lot_size(self):
+        return int(self._config['book'].get('lot-size', '1'))
+
+    @property
+    def book_backend(self):
+        value = self._config['book'].get('backend', 'tree')
+        if value not in ['tree', 'ladder', 'array']:
+            raise ValueError('Book backend can only be tree, ladder or array.')
+        return value
+
+    @property
+    def order_pool_size(self):
+        return int(self._config['book'].get('order-pool-size', '0'))
+
+    @property
+    def cancel_mode(self):
+        value = self._config['book'].get('cancel-mode', 'eager')
+        if value not in ['eager', 'lazy']:
+            raise ValueError('Cancel mode can only be eager or lazy.')
+        return value
+
+    @property
+    def smp_mode(self):
+        value = self._config['book'].get('smp-mode', 'cancel-resting')
+        if value not in ['cancel-resting', 'cancel-aggressor', 'cancel-both', 'decrement-and-cancel']:
+            raise ValueError('Self-match prevention mode can only be cancel-resting, cancel-aggressor, '
+                             'cancel-both or decrement-and-cancel.')
+        return value
+
+    @property
+    def strict_fills(self):
+        value = self._config['book'].get('strict-fills', 'false')
+        if value == 'true':
+            return True
+        elif value == 'false':
+            return False
+        else:
+            raise ValueError('Strict fills flag can only be true or false.')
+
+    @property
+    def workers(self):
+        return int(self._config['book'].get('workers', '0'))
+
+    @property
+    def matching_mode(self):
+        value = self._config['book'].get('matching', 'locked')
+        if value not in ['locked', 'single-writer']:
+            raise ValueError('Matching can only be locked or single-writer.')
+        return value
+
+    @property
+    def wait_strategy(self):
+        value = self._config['book'].get('wait-strategy', 'block')
+        if value not in ['block', 'yield', 'spin']:
+            raise ValueError('Wait strategy can only be block, yield or spin.')
+        return value
+
+    @property
+    def ring_size(self):
+        return int(self._config['book'].get('ring-size', '4096'))
+
+    @property
+    def simulation_speed(self):
+        # None runs the simulation on the wall clock, otherwise simulated
+        # time passes this many times faster than wall time
+        value = self._config['book'].get('simulation-speed', 'real')
+        if value == 'real':
+            return None
+        if value == 'max':
+            return math.inf
+        speed = float(value)
+        if speed <= 0:
+            raise ValueError('Simulation speed has to be real, max or a positive number.')
+        return speed
+
+    def depth_levels(self, symbol):
+        # depth-levels.<symbol> overrides the default for one instrument
+        book = self._config['book']
+        value = int(book.get(f'depth-levels.{symbol}', book.get('depth-levels', '10')))
+        if value <= 0:
+            raise ValueError('Depth levels have to be positive.')
+        return value
+
+    @property
+    def checkpoint_path(self):
+        # An empty path or no [checkpoint] section turns checkpoints off
+        if not self._config.has_section('checkpoint'):
+            return None
+        return self._config['checkpoint'].get('path', '') or None
+
+    @property
+    def checkpoint_interval(self):
+        if not self._config.has_section('checkpoint'):
+            return 0.0
+        value = float(self._config['checkpoint'].get('interval', '0'))
+        if value < 0:
+            raise ValueError('Checkpoint interval can not be negative.')
+        return value
+
+    @property
+    def journal_path(self):
+        # An empty path or no [journal] section turns the journal off
+        if not self._config.has_section('journal'):
+            return None
+        return self._config['journal'].get('path', '') or None
+
+    @property
+    def journal_max_latency(self):
+        # Configured in milliseconds, returned in seconds
+        if not self._config.has_section('journal'):
+            return 0.005
+        value = float(self._config['journal'].get('max-latency', '5'))
+        if value <= 0:
+            raise ValueError('Journal max latency has to be positive.')
+        return value / 1000
+
+    @property
+    def journal_segment_records(self):
+        if not self._config.has_section('journal'):
+            return 1 << 20
+        value = int(self._config['journal'].get('segment-records', str(1 << 20)))
+        if value <= 0:
+            raise ValueError('Records per journal segment have to be positive.')
+        return value
+
     @property
     def market_data_address(self):
         return self._config['market-data']['request-address']
@@ -9,7 +9,7 @@ class ClientConnection:
         self._port = None
         self._encoding = 1
         self._handshaken = False
-        self._snapshot_sent = False
+        self._snapshots = set() # Symbols whose order book snapshot has been sent
 
         self._uuid = id_
 
@@ -102,14 +102,8 @@ class ClientConnection:
         self._handshaken = value
 
     @property
-    def snapshot_sent(self):
-        return self._snapshot_sent
-
-    @snapshot_sent.setter
-    def snapshot_sent(self, value):
-        if not isinstance(value, int):
-            raise TypeError(f'Snapshot_sent has to be type of <bool>, was {type(value)}')
-        self._snapshot_sent = value
+    def snapshots(self):
+        return self._snapshots
 
     def order_set_as_canceled(self, order):
         if order.order_id in self._orders:
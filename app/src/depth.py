@@ -0,0 +1,112 @@
+from bisect import bisect_left
+
+import numpy as np
+
+from .side import Side
+
+
+class DepthView(object):
+    '''Aggregated top-N price levels of one side of the book
+
+    Keeps (price, volume, order count) of the N best levels, best first. The
+    owning OrderTree reports every level change through update() and remove(),
+    and the view patches its entries in place, so reading it never touches
+    the Order objects.
+
+    When a level inside a full view disappears the view can not know the next
+    level beyond its worst one. It is then marked stale and rebuilt from the
+    tree's OrderList aggregates on the next read.
+    '''
+    __slots__ = ('_tree', '_levels', '_descending', '_keys', '_prices', '_volumes', '_counts', '_stale')
+
+    def __init__(self, tree, levels):
+        if levels <= 0:
+            raise ValueError(f'Number of depth levels has to be positive, was {levels}.')
+        self._tree = tree
+        self._levels = levels
+        self._descending = tree.side == Side.B
+        self._keys = [] # Sort keys in best first order (negated prices for bids)
+        self._prices = []
+        self._volumes = []
+        self._counts = []
+        self._stale = True
+
+    @property
+    def levels(self):
+        return self._levels
+
+    def update(self, price, volume, count):
+        '''Records the new volume and order count of the level at price.'''
+        if self._stale:
+            return
+        key = -price if self._descending else price
+        keys = self._keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            self._volumes[i] = volume
+            self._counts[i] = count
+            return
+
+        # New level, only of interest if it is one of the N best
+        if i >= self._levels:
+            return
+        keys.insert(i, key)
+        self._prices.insert(i, price)
+        self._volumes.insert(i, volume)
+        self._counts.insert(i, count)
+        if len(keys) > self._levels:
+            keys.pop()
+            self._prices.pop()
+            self._volumes.pop()
+            self._counts.pop()
+
+    def remove(self, price):
+        '''Drops the level at price.'''
+        if self._stale:
+            return
+        key = -price if self._descending else price
+        keys = self._keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            full = len(keys) == self._levels
+            del keys[i]
+            del self._prices[i]
+            del self._volumes[i]
+            del self._counts[i]
+            # A level beyond the view may now belong to the N best
+            if full:
+                self._stale = True
+
+    def invalidate(self):
+        '''Rebuilds the view on the next read, for changes that bypass update() and remove().'''
+        self._stale = True
+
+    def _rebuild(self):
+        self._keys = []
+        self._prices = []
+        self._volumes = []
+        self._counts = []
+        for price, order_list in self._tree.price_levels(self._descending):
+            if len(self._keys) == self._levels:
+                break
+            if len(order_list) == 0:
+                continue # only tombstones left
+            self._keys.append(-price if self._descending else price)
+            self._prices.append(price)
+            self._volumes.append(order_list.volume)
+            self._counts.append(len(order_list))
+        self._stale = False
+
+    def get(self):
+        '''Returns a list of (price, volume, order count) tuples, best level first.'''
+        if self._stale:
+            self._rebuild()
+        return list(zip(self._prices, self._volumes, self._counts))
+
+    def get_arrays(self):
+        '''Returns prices, volumes and order counts as NumPy arrays, best level first.'''
+        if self._stale:
+            self._rebuild()
+        return (np.array(self._prices, dtype=np.int64),
+                np.array(self._volumes, dtype=np.int64),
+                np.array(self._counts, dtype=np.int64))
@@ -1,6 +1,4 @@
 from enum import Enum
-from decimal import Decimal
-from datetime import datetime
 
 from .side import (
     Side,
@@ -12,6 +10,15 @@ from .order import (
     order_type_to_str
 )
 
+from .ticks import (
+    UNIT_SCALE
+)
+
+from .clock import (
+    DEFAULT_CLOCK,
+    format_timestamp
+)
+
 class EventTypes(Enum):
     ADD = 1
     CANCEL = 2
@@ -20,12 +27,12 @@ class EventTypes(Enum):
 
 class Event:
 
-    def __init__(self, event_type):
+    def __init__(self, event_type, clock=DEFAULT_CLOCK):
         self._event_type = event_type
         self._side = None
         self._trade_id = None
         self._order_id = None
-        self._timestamp = datetime.now()
+        self._timestamp = clock.now() # integer nanoseconds
 
     @property
     def trade_id(self):
@@ -48,12 +55,12 @@ class Event:
         self._trade_id = value
 
     @property
-    def dt_timestamp(self):
+    def timestamp(self):
         return self._timestamp
-    
+
     @property
     def str_timestamp(self):
-        return self._timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')
+        return format_timestamp(self._timestamp)
 
     @property
     def event_type(self):
@@ -81,8 +88,8 @@ class Event:
 
 class Add(Event):
 
-    def __init__(self):
-        Event.__init__(self, EventTypes.ADD)
+    def __init__(self, clock=DEFAULT_CLOCK):
+        Event.__init__(self, EventTypes.ADD, clock)
         self._price = None
         self._quantity = None
 
@@ -92,10 +99,10 @@ class Add(Event):
 
     @price.setter
     def price(self, value):
-        if not isinstance(value, Decimal):
-            raise TypeError(f"Price needs to be <Decimal, was {type(value)}.")
+        if not isinstance(value, int):
+            raise TypeError(f"Price needs to be <int> ticks, was {type(value)}.")
         if value <= 0:
-            raise ValueError(f"Price has to be positive <Decimal>.")
+            raise ValueError(f"Price has to be positive <int>.")
         self._price = value
 
     @property
@@ -104,10 +111,10 @@ class Add(Event):
 
     @quantity.setter
     def quantity(self, value):
-        if not isinstance(value, Decimal):
-            raise TypeError(f"Quantity needs to be <Decimal, was {type(value)}.")
+        if not isinstance(value, int):
+            raise TypeError(f"Quantity needs to be <int> lots, was {type(value)}.")
         if value <= 0:
-            raise ValueError(f"Quantity has to be positive <Decimal>.")
+            raise ValueError(f"Quantity has to be positive <int>.")
         self._quantity = value
 
     def to_lob_format(self):
@@ -124,7 +131,7 @@ class Add(Event):
 
         return result
 
-    def get_message(self):
+    def get_message(self, scale=UNIT_SCALE):
         """
         Transforms the event object into SDM format.
 
@@ -137,8 +144,8 @@ class Add(Event):
         message.update({'instrument': self.instrument})
         message.update({'order-id': self.order_id})
         message.update({'order-type': OrderType.Limit})
-        message.update({'quantity': int(self.quantity)})
-        message.update({'price': int(self.price)})
+        message.update({'quantity': scale.to_quantity(self.quantity)})
+        message.update({'price': scale.to_price(self.price)})
         message.update({'side': side_to_str(self.side)})
         message.update({'timestamp': self.str_timestamp})
         message.update({'snapshot': 0})
@@ -148,8 +155,8 @@ class Add(Event):
 
 class Cancel(Event):
 
-    def __init__(self):
-        Event.__init__(self, EventTypes.CANCEL)
+    def __init__(self, clock=DEFAULT_CLOCK):
+        Event.__init__(self, EventTypes.CANCEL, clock)
         self._price = None
         self._quantity = None
 
@@ -159,10 +166,10 @@ class Cancel(Event):
 
     @price.setter
     def price(self, value):
-        if not isinstance(value, Decimal):
-            raise TypeError(f"Price needs to be <Decimal, was {type(value)}.")
+        if not isinstance(value, int):
+            raise TypeError(f"Price needs to be <int> ticks, was {type(value)}.")
         if value <= 0:
-            raise ValueError(f"Price has to be positive <Decimal>.")
+            raise ValueError(f"Price has to be positive <int>.")
         self._price = value
 
     def to_lob_format(self):
@@ -175,7 +182,7 @@ class Cancel(Event):
         result.update({'instrument': self.instrument})
         result.update({'type': 'cancel'})
         result.update({'side': self.side})
-        result.update({'timestamp': self.str_timestamp})
+        result.update({'timestamp': self.timestamp})
 
         return result
 
@@ -192,8 +199,8 @@ class Cancel(Event):
 
 class MarketOrder(Event):
 
-    def __init__(self):
-        Event.__init__(self, EventTypes.MARKET_ORDER)
+    def __init__(self, clock=DEFAULT_CLOCK):
+        Event.__init__(self, EventTypes.MARKET_ORDER, clock)
         self._quantity = None
 
     @property
@@ -202,10 +209,10 @@ class MarketOrder(Event):
 
     @quantity.setter
     def quantity(self, value):
-        if not isinstance(value, Decimal):
-            raise TypeError(f"Quantity needs to be <Decimal, was {type(value)}.")
+        if not isinstance(value, int):
+            raise TypeError(f"Quantity needs to be <int> lots, was {type(value)}.")
         if value <= 0:
-            raise ValueError(f"Quantity has to be positive <Decimal>.")
+            raise ValueError(f"Quantity has to be positive <int>.")
         self._quantity = value
 
     def to_lob_format(self):
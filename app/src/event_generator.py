@@ -1,13 +1,17 @@
+import heapq
+import math
+import threading
+import time
 import numpy as np
 import random
-import time
 from abc import ABCMeta, abstractmethod
-import json
-from decimal import Decimal
 from .side import (
     Side,
     side_to_str
 )
+from .clock import (
+    VirtualClock
+)
 from .event import (
     EventTypes,
     Add,
@@ -17,13 +21,57 @@ from .event import (
 from src.transaction import (
     TransactionList
 )
+from src.order_entry_messaging import (
+    OrderEntryMessageFactory
+)
+from src.journal import (
+    SIMULATION
+)
 
 import src.messaging as messaging
 
+# Market data messages queued for publishing at which a simulation at
+# full speed waits for the feed to catch up
+MAX_PUBLISH_BACKLOG = 100_000
+
+# Samples a generator draws at a time
+SAMPLE_BLOCK = 2048
+
+
+class SampleBuffer(object):
+    """
+    Hands out the samples of a NumPy sampler one at a time.
+
+    draw(count) returns an array of count samples. It is called for a
+    whole block when the buffer runs empty, the first time on the first
+    next(), and the samples are kept as plain Python numbers.
+    """
+    __slots__ = ('_draw', '_size', '_samples', '_position')
+
+    def __init__(self, draw, size=SAMPLE_BLOCK):
+        if size <= 0:
+            raise ValueError(f'Sample block size has to be positive, was {size}.')
+        self._draw = draw
+        self._size = size
+        self._samples = []
+        self._position = 0
+
+    def next(self):
+        position = self._position
+        if position == len(self._samples):
+            self._samples = self._draw(self._size).tolist()
+            position = 0
+        self._position = position + 1
+        return self._samples[position]
+
 
 class EventGenerator:
 
-    def __init__(self, thread_id, instrument, event_type, event_side, level, arrival_rate, tick_size):
+    # Lives in the worker process of a sharded book, its samples carry over
+    shard_resident = True
+
+    def __init__(self, thread_id, instrument, event_type, event_side, level, arrival_rate, tick_size,
+                 sample_block=SAMPLE_BLOCK):
         self._instrument = instrument
         self._thread_id = thread_id
         self._event_type = event_type
@@ -32,7 +80,17 @@ class EventGenerator:
         self._arrival_rate = arrival_rate
         self._tick_size = tick_size
         self._rng = np.random.RandomState()
-        self._rng.seed(np.random.randint(1, 100))
+        # Generators draw arrivals from their own stream, so the seeds must not collide
+        self._rng.seed(np.random.randint(1, 2 ** 31))
+
+        # Arrival times and order sizes are drawn in blocks
+        self._arrival_delays = SampleBuffer(self._draw_arrival_delays, sample_block)
+        if event_type == EventTypes.ADD:
+            self._quantities = SampleBuffer(self._draw_limit_order_quantities, sample_block)
+        elif event_type == EventTypes.MARKET_ORDER:
+            self._quantities = SampleBuffer(self._draw_market_order_quantities, sample_block)
+        else:
+            self._quantities = None
 
     @property
     def thread_id(self):
@@ -64,7 +122,8 @@ class EventGenerator:
 
     def _infer_price_level(self, state):
         """
-        Infers correct price level based on the reference level.
+        Infers correct price level based on the reference level, None
+        if the book is empty.
         """
 
         lob = state.get_current_lob_state(self.instrument)
@@ -75,6 +134,8 @@ class EventGenerator:
         # Get current best bid and ask
         best_bid = lob.get_best_bid()
         best_ask = lob.get_best_ask()
+        if best_bid is None and best_ask is None:
+            return None
 
         # Calculate price level
         if self.side == Side.B:
@@ -90,33 +151,30 @@ class EventGenerator:
 
         return price_level
 
+    def _draw_arrival_delays(self, count):
+        # Exponential times between events in nanoseconds
+        numpy_beta = 1.0 / self.arrival_rate
+        return (self._rng.exponential(numpy_beta, count) * 1e9).astype(np.int64)
+
+    def _draw_limit_order_quantities(self, count):
+        return self._rng.randint(1, 10, count)
+        #return np.maximum(self._rng.geometric(0.25, count), 1)
+
+    def _draw_market_order_quantities(self, count):
+        # TODO: get distribution parameters from configuration
+        return np.maximum(self._rng.geometric(0.04, count), 1)
+
     def _generate_random_limit_order_quantity(self, price):
         """
         Generates random order quantity
         """
-
-        quantity = self._rng.randint(1, 10)
-        #quantity = max(self._rng.geometric(0.25, 1)[0], 1)
-
-        return Decimal(quantity)
+        return self._quantities.next()
 
     def _generate_random_market_order_quantity(self, price, state):
         """
         Generates random order quantity for a market order.
-        TODO: get distribution parameters from configuration
         """
-
-        lob = state.get_current_lob_state(self.instrument)
-
-        if self.side == Side.B:  # buy market order
-
-            quantity = max(self._rng.geometric(0.04, 1)[0].item(), 1)
-
-        elif self.side == Side.S:  # sell market order
-
-            quantity = max(self._rng.geometric(0.04, 1)[0].item(), 1)
-
-        return Decimal(quantity)
+        return self._quantities.next()
 
     def _choose_random_order_id(self, price, state):
         """
@@ -128,36 +186,15 @@ class EventGenerator:
 
         """
         lob = state.get_current_lob_state(self.instrument)
-        if self.side == Side.B:
-            if lob.bids.price_exists(price):
-                order_list = lob.bids.get_price_list(price)
-                if order_list.volume > 0:
-                    order_ids = [order.order_id for order in list(order_list)]
-                    chosen = random.choice(order_ids)
-                    return chosen
-                else:
-                    # We cannot cancel if the price level is empty
-                    return None
-            else:
-                # We cannot cancel if the price level is empty
-                return None
-
-        elif self.side == Side.S:
-            if lob.asks.price_exists(price):
-                order_list = lob.asks.get_price_list(price)
-                if order_list.volume > 0:
-                    order_ids = [order.order_id for order in list(order_list)]
-                    chosen = random.choice(order_ids)
-                    return chosen
-                else:
-                    # We cannot cancel if the price level is empty
-                    return None
-            else:
-                # We cannot cancel if the price level is empty
-                return None
+        if self.side not in [Side.B, Side.S]:
+            raise ValueError("Side not valid.")
 
+        order_ids = lob.get_order_ids_at_price(self.side, price)
+        if order_ids:
+            return random.choice(order_ids)
         else:
-            raise ValueError("Side not valid.")
+            # We cannot cancel if the price level is empty
+            return None
 
     def _create_new_limit_order_addition(self, state):
         """
@@ -170,9 +207,13 @@ class EventGenerator:
         'quantity': 1,
         'price': 97}
         """
-        event = Add()
+        price = self._infer_price_level(state)
+        if price is None:
+            # Nothing to peg against
+            return None
+        event = Add(state.clock)
         event.instrument = self.instrument
-        event.price = self._infer_price_level(state)
+        event.price = price
         event.quantity = self._generate_random_limit_order_quantity(state)
         event.side = self.side
 
@@ -184,9 +225,12 @@ class EventGenerator:
 
         Format understood by the OrderBook:
         """
-        event = Cancel()
+        price = self._infer_price_level(state)
+        if price is None:
+            return None
+        event = Cancel(state.clock)
         event.instrument = self.instrument
-        event.price = self._infer_price_level(state)
+        event.price = price
         event.order_id = self._choose_random_order_id(event.price, state)
         event.side = self.side
 
@@ -203,25 +247,19 @@ class EventGenerator:
          'quantity': 40,
          'trade_id': 111}
         """
-        event = MarketOrder()
+        event = MarketOrder(state.clock)
         event.instrument = self.instrument
         event.quantity = self._generate_random_market_order_quantity(state, state)
         event.side = self.side
 
         return event
 
-    def sleep_until_next_event(self, state):
+    def next_arrival_delay(self):
         """
-        Sleeps a random time determined by an exponential random variable.
+        Time to the next event of the generator in nanoseconds, an
+        exponential random variable with the arrival rate per second.
         """
-        numpy_beta = 1.0 / self.arrival_rate
-        time_delta_seconds = np.random.exponential(numpy_beta, 1)[0]
-        millis_to_sleep = int(time_delta_seconds * 1000)
-        n_loops = int(millis_to_sleep / 10)
-        for i in range(0, n_loops):
-            if state.stopper.is_set():
-                break
-            time.sleep(0.010)
+        return self._arrival_delays.next()
 
     def create_event(self, state):
         """
@@ -246,81 +284,207 @@ class EventGenerator:
         return s
 
 
-def _create_add_message_from_add_event(order):
-    """
-    Creates add message from an order
-    :param order:
-    :return:
+class EventSchedule(object):
     """
-    message = {}
-    message.update({"message-type": "A"})
-    message.update({"instrument": order["instrument"]})
-    message.update({"order-id": order["order_id"]})
-    message.update({"price": int(order["price"])})
-    message.update({"quantity": int(order["quantity"])})
-    message.update({"side": side_to_str(order["side"])})
-    message.update({"timestamp": order["timestamp"]})
-    message.update({"snapshot": 0})
-    return message
-
-
-def event_generation_loop(state, generator):
-    """
-    Runs order book events for one event type.
+    Next arrival times of a set of event generators, earliest first.
+
+    Every generator is a Poisson process. The arrival times are kept in a
+    heap and the next arrival of a generator is drawn from the time its
+    last event was due. Ties go to the generator given first.
     """
-    if not isinstance(generator, EventGenerator):
-        raise TypeError("Thread function now takes parameter class.")
 
-    while not state.stopper.is_set():
+    def __init__(self, generators, now=0):
+        for generator in generators:
+            if not isinstance(generator, EventGenerator):
+                raise TypeError("Scheduler takes EventGenerator instances.")
+        # The index breaks ties, generators are never compared
+        self._heap = [(now + generator.next_arrival_delay(), index, generator)
+                      for index, generator in enumerate(generators)]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def peek(self):
+        """
+        Returns (due time, generator) of the next event.
+        """
+        due, _, generator = self._heap[0]
+        return due, generator
+
+    def advance(self):
+        """
+        Draws the next arrival of the generator of the next event, once
+        that event was applied or submitted.
+        """
+        due, index, generator = self._heap[0]
+        heapq.heapreplace(self._heap, (due + generator.next_arrival_delay(), index, generator))
+
+    def step(self, state, lob):
+        """
+        Sets the VirtualClock of the state to the due time of the next
+        event, applies the event to the book right away and advances.
+
+        :return: the result of apply_event
+        """
+        due, generator = self.peek()
+        state.clock.set(due)
+        result = apply_event(state, lob, generator)
+        self.advance()
+        return result
+
 
-        # Sleep until next event
-        generator.sleep_until_next_event(state)
+def event_scheduling_loop(state, generators, speed=None):
+    """
+    Runs the events of all generators on one thread.
+
+    The thread sleeps until the next event of the EventSchedule is due
+    and submits it to its book. Setting the stopper wakes the thread right
+    away.
+
+    With a speed the state has to run on a VirtualClock. Instead of
+    waiting for the clock the thread sets it to the due time of every
+    event, and only sleeps to keep simulated time speed times as fast as
+    wall time. math.inf does not sleep at all, then the thread only waits
+    while more than MAX_PUBLISH_BACKLOG messages are queued for the
+    market data feed. The clock is only moved on once the book applied the
+    event, also on a matching thread, so the book stamps every event with
+    its due time.
+    """
+    clock = state.clock
+    stopper = state.stopper
+    virtual = speed is not None
+    if virtual:
+        if not isinstance(clock, VirtualClock):
+            raise TypeError(f"Simulation speed needs a <VirtualClock>, the clock is {type(clock)}.")
+        if speed <= 0:
+            raise ValueError(f"Simulation speed has to be positive, was {speed}.")
+    event_queue = state.event_queue
+
+    # Set by the book once it applied the event
+    applied = threading.Event()
+
+    def execute(state, lob, command):
+        try:
+            return execute_event(state, lob, command)
+        finally:
+            applied.set()
+
+    now = clock.now()
+    wall_start = time.perf_counter()
+    schedule = EventSchedule(generators, now)
+
+    while schedule and not stopper.is_set():
+        due, generator = schedule.peek()
+
+        # Sleep until the next event is due, or until stopped
+        if not virtual:
+            timeout = (due - clock.now()) / 1e9
+        elif speed != math.inf:
+            timeout = wall_start + (due - now) / 1e9 / speed - time.perf_counter()
+        elif event_queue.qsize() > MAX_PUBLISH_BACKLOG:
+            # Let the market data feed catch up
+            stopper.wait(0.001)
+            continue
+        else:
+            timeout = 0
+        if timeout > 0 and stopper.wait(timeout):
+            break
+
+        # The event is created where the book is, it depends on the current prices
+        if virtual:
+            clock.set(due)
+            applied.clear()
+            state.submit(generator.instrument, execute, _respond_event, generator)
+            # A matching thread reads the clock when it gets to the event,
+            # the next event must not move it before that
+            while not applied.wait(0.1):
+                if stopper.is_set():
+                    break
+        else:
+            state.submit(generator.instrument, execute_event, _respond_event, generator)
+        schedule.advance()
 
-        state.lock.acquire()
+    print('Event generation stopped.')
 
-        # Create event
-        event = generator.create_event(state)
 
-        if event is not None:
+def execute_event(state, lob, command):
+    """
+    Runs apply_event for the generator in the payload of the command, to
+    submit events with GlobalState.submit.
+    """
+    return apply_event(state, lob, command.payload)
 
-            lob = state.get_current_lob_state("0")
 
-            if event.event_type in [EventTypes.ADD]:
-                _, order_in_book, _ = lob.process_order(event.to_lob_format(), False, False)
-                state.event_queue.put(_create_add_message_from_add_event(order_in_book))
+def apply_event(state, lob, generator):
+    """
+    Creates the next event of the generator and applies it to the book.
 
-            elif event.event_type in [EventTypes.CANCEL]:
-                if event.order_id is not None:
-                    lob.cancel_order(event.side, event.order_id)
-                    state.event_queue.put(event.get_message())
+    :return: (event, result of the event in the book) or None
+    """
+    event = generator.create_event(state)
 
-            elif event.event_type in [EventTypes.MARKET_ORDER]:
+    if event is None:
+        return None
 
-                transactions, _, _ = lob.process_order(event.to_lob_format(), False, False)
+    journal = state.journal
 
-                # Generate trade messages
-                aggressor_messages, passive_messages = transactions.get_trade_messages()
+    if event.event_type in [EventTypes.ADD]:
+        _, order_in_book, _ = lob.process_order(event.to_lob_format(), False, False)
+        if journal is not None:
+            journal.new_order(SIMULATION, order_in_book, event.quantity)
+        return event, order_in_book
 
-                # Send order executed message(s) to the passive side of the transaction.
-                # If passive_trader_id is None the order was simulated.
-                for passive_trader_id, msg in passive_messages:
-                    if passive_trader_id is not None:
-                        passive_side_client = state.get_order_client_nts(passive_trader_id)
-                        if passive_side_client is not None:
-                            messaging.send_data(
-                                passive_side_client.socket,
-                                json.dumps(msg),
-                                passive_side_client.encoding)
+    elif event.event_type in [EventTypes.CANCEL]:
+        if event.order_id is not None:
+            canceled = lob.cancel(event.order_id)
+            if journal is not None and canceled is not None:
+                journal.cancel(SIMULATION, canceled, state.clock.now())
+            return event, None
 
-                # Publish trade(s) via the public market data feed
-                for msg in aggressor_messages:
-                    state.event_queue.put(msg)
+    elif event.event_type in [EventTypes.MARKET_ORDER]:
+        transactions, order, _ = lob.process_order(event.to_lob_format(), False, False)
+        if journal is not None:
+            journal.new_order(SIMULATION, order, event.quantity)
+        return event, transactions
 
-                # Publish remove and modify messages via the public market data feed
-                remove_and_modify_messages = transactions.get_remove_and_modify_messages()
-                for msg in remove_and_modify_messages:
-                    state.event_queue.put(msg)
+    return None
 
-        state.lock.release()
 
-    print('Event generation stopped.')
+def _respond_event(state, lob, command, result):
+    """
+    Publishes the messages of an event applied by execute_event.
+    """
+    if result is None:
+        return
+    event, outcome = result
+
+    if event.event_type in [EventTypes.ADD]:
+        state.event_queue.put(OrderEntryMessageFactory.book_add_message(outcome, lob.scale))
+
+    elif event.event_type in [EventTypes.CANCEL]:
+        state.event_queue.put(event.get_message())
+
+    elif event.event_type in [EventTypes.MARKET_ORDER]:
+
+        # Serialize all trade messages in one pass
+        encoded = outcome.encode()
+
+        # Send order executed message(s) to the passive side of the transaction.
+        # If passive_trader_id is None the order was simulated.
+        for passive_trader_id, msg in encoded.passive_reports:
+            if passive_trader_id is not None:
+                passive_side_client = state.get_order_client(passive_trader_id)
+                if passive_side_client is not None:
+                    messaging.send_data(
+                        passive_side_client.socket,
+                        msg,
+                        passive_side_client.encoding)
+
+        # Publish trade(s) via the public market data feed
+        for msg in encoded.trade_prints:
+            state.event_queue.put(msg)
+
+        # Publish remove and modify messages via the public market data feed
+        for msg in encoded.book_deltas:
+            state.event_queue.put(msg)
@@ -0,0 +1,346 @@
+"""
+Write-ahead journal of the commands applied to the order books.
+
+The journal is a directory of segment files named
+journal-<first sequence, 20 digits>.seg, all integers little endian:
+
+    header      magic b'SBJL', version u16, first sequence u64
+    records     one RECORD_DTYPE record per command
+
+Records have a fixed size, so the record with sequence s sits at offset
+HEADER + (s - first) * RECORD_DTYPE.itemsize of the segment with the
+largest first sequence not above s. The segment names are the index.
+
+Prices and quantities are in ticks and lots. The timestamp is the one
+the book gave a new order, and the clock time a cancel or modify was
+applied at. side and order_type hold the Side and OrderType values, 0
+where they do not apply. trader is the UUID of a client, zero for
+simulated orders.
+"""
+import logging
+import os
+import struct
+import threading
+import uuid
+from bisect import bisect_right
+from collections import deque
+
+import numpy as np
+
+from .side import (
+    Side
+)
+
+from .order import (
+    OrderType
+)
+
+MAGIC = b'SBJL'
+VERSION = 1
+
+# Record kinds
+NEW_ORDER = 1
+CANCEL = 2
+MODIFY = 3
+
+# Where a command came from
+CLIENT = 0
+SIMULATION = 1
+
+_HEADER = struct.Struct('<4sHQ')
+
+logger = logging.getLogger(__name__)
+
+RECORD_DTYPE = np.dtype([('sequence', '<u8'),
+                         ('timestamp', '<i8'),
+                         ('order_id', '<i8'),
+                         ('price', '<i8'),
+                         ('quantity', '<i8'),
+                         ('kind', 'u1'),
+                         ('source', 'u1'),
+                         ('side', 'i1'),
+                         ('order_type', 'i1'),
+                         ('trader', 'V16'),
+                         ('instrument', 'S16')])
+
+# Records read from disk at a time
+_CHUNK = 65536
+
+_NO_TRADER = bytes(16)
+_SIDES = (None, Side.B, Side.S)
+_ORDER_TYPES = (None, OrderType.Limit, OrderType.Market)
+
+
+def _segment_name(first_sequence):
+    return f'journal-{first_sequence:020d}.seg'
+
+
+def list_segments(directory):
+    """
+    Returns (first sequence, path) of every segment in the directory,
+    oldest first.
+    """
+    segments = []
+    for name in os.listdir(directory):
+        if name.startswith('journal-') and name.endswith('.seg'):
+            segments.append((int(name[8:-4]), os.path.join(directory, name)))
+    segments.sort()
+    return segments
+
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        data = f.read(_HEADER.size)
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, first_sequence = _HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a journal segment.')
+    if version != VERSION:
+        raise ValueError(f'Journal version {version} is not supported, expected {VERSION}.')
+    return first_sequence
+
+
+def _segment_length(path):
+    return max(os.path.getsize(path) - _HEADER.size, 0) // RECORD_DTYPE.itemsize
+
+
+def check_symbol(symbol):
+    """
+    Raises ValueError if the symbol does not fit the instrument field of a
+    record.
+    """
+    if len(symbol.encode('utf-8')) > RECORD_DTYPE['instrument'].itemsize:
+        raise ValueError(f"Symbol {symbol} is longer than {RECORD_DTYPE['instrument'].itemsize} bytes "
+                         f"and can not be journaled.")
+
+
+class Journal(object):
+    """
+    Append-only binary journal of every command applied to the books.
+
+    The matching path only appends a tuple to an in-memory deque, it never
+    waits for the disk. A writer thread takes all pending records every
+    max_latency seconds, numbers them, writes them in one go and fsyncs
+    once for the whole group (group commit). A command is on disk at most
+    max_latency seconds after it was applied.
+
+    A segment is closed after segment_records records and a new one is
+    started. Opening an existing journal continues its sequence numbers in
+    a new segment, a torn record at the end of the last segment is cut
+    off first.
+
+    If writing fails the writer thread stops, error holds the exception
+    and every further record raises, so no command is acknowledged that
+    can not be journaled. The records still pending are lost.
+    """
+
+    def __init__(self, directory, max_latency=0.005, segment_records=1 << 20):
+        if max_latency <= 0:
+            raise ValueError(f'Journal max latency has to be positive, was {max_latency}.')
+        if segment_records <= 0:
+            raise ValueError(f'Records per journal segment have to be positive, was {segment_records}.')
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._max_latency = max_latency
+        self._segment_records = segment_records
+        self._pending = deque()
+        self._stop = threading.Event()
+        # A daemon, so a crashed exchange that never calls close can still exit
+        self._thread = threading.Thread(target=self._write, name='journal', daemon=True)
+        self._file = None
+        self._segment_length = 0 # records in the open segment
+        self._symbols = {} # symbol : utf-8 bytes
+        self.next_sequence = self._recover()
+        self.records = 0
+        self.commits = 0
+        self.max_group = 0
+        self.segments = 0
+        self.lost = 0 # records dropped when the writer failed
+        self.error = None # exception the writer failed with
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def _recover(self):
+        segments = list_segments(self._directory)
+        if not segments:
+            return 0
+        first_sequence, path = segments[-1]
+        if _read_header(path) is None:
+            # Torn header, the new segment takes its name
+            return first_sequence
+        length = _segment_length(path)
+        with open(path, 'r+b') as f:
+            # A torn record of a crashed writer is cut off
+            f.truncate(_HEADER.size + length * RECORD_DTYPE.itemsize)
+        return first_sequence + length
+
+    def start(self):
+        self._thread.start()
+
+    def close(self):
+        """
+        Writes the pending records and stops the writer thread.
+        """
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def check(self):
+        """
+        Raises a RuntimeError if the writer failed.
+        """
+        if self.error is not None:
+            raise RuntimeError(f'The journal writer failed, {self.lost} records were lost.') from self.error
+
+    def new_order(self, source, order, quantity):
+        """
+        Journals an order in the process_order format once the book gave it
+        its order_id and timestamp. quantity is the quantity the order was
+        entered with, before matching.
+        """
+        if self.error is not None:
+            self.check()
+        self._pending.append((NEW_ORDER, source, order['instrument'], order['timestamp'], order['order_id'],
+                              order['side'], order['order_type'], order.get('price') or 0, quantity,
+                              order.get('trader_id')))
+
+    def cancel(self, source, order, timestamp):
+        """
+        Journals the cancel of an order, order is the canceled Order or a
+        copy of it.
+        """
+        if self.error is not None:
+            self.check()
+        self._pending.append((CANCEL, source, order.instrument, timestamp, order.order_id, order.side, None,
+                              order.price, order.quantity, order.trader_id))
+
+    def modify(self, source, update, timestamp):
+        """
+        Journals an order update in the modify_order format.
+        """
+        if self.error is not None:
+            self.check()
+        self._pending.append((MODIFY, source, update['instrument'], timestamp, update['order_id'],
+                              update['side'], update['order_type'], update['price'], update['quantity'],
+                              update.get('trader_id')))
+
+    def _write(self):
+        pending = self._pending
+        batch = []
+        try:
+            while True:
+                stopped = self._stop.wait(self._max_latency)
+                batch = [pending.popleft() for _ in range(len(pending))]
+                if batch:
+                    self._commit(batch)
+                if stopped:
+                    break
+        except Exception as exc:
+            self.error = exc
+            # Appends racing with the failure are dropped with the rest
+            self.lost = len(batch) + len(pending)
+            pending.clear()
+            logger.exception(f'Journal writer failed, {self.lost} records were lost. '
+                             f'No further commands are accepted.')
+        finally:
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+                self._file = None
+
+    def _commit(self, batch):
+        count = len(batch)
+        sequence = self.next_sequence
+        kinds, sources, instruments, timestamps, order_ids, sides, order_types, prices, quantities, traders = \
+            zip(*batch)
+
+        # Filled column by column, the per record work is only the lookups
+        data = np.empty(count, dtype=RECORD_DTYPE)
+        data['sequence'] = np.arange(sequence, sequence + count, dtype=np.uint64)
+        data['timestamp'] = timestamps
+        data['order_id'] = order_ids
+        data['price'] = prices
+        data['quantity'] = quantities
+        data['kind'] = kinds
+        data['source'] = sources
+        data['side'] = [1 if side is Side.B else 2 if side is Side.S else 0 for side in sides]
+        data['order_type'] = [1 if order_type is OrderType.Limit else 2 if order_type is OrderType.Market else 0
+                              for order_type in order_types]
+        data['trader'] = [_NO_TRADER if trader_id is None else trader_id.bytes for trader_id in traders]
+        symbols = self._symbols
+        data['instrument'] = [symbols.get(instrument) or symbols.setdefault(instrument, instrument.encode('utf-8'))
+                              for instrument in instruments]
+        sequence += count
+
+        written = 0
+        while written < count:
+            if self._file is None or self._segment_length == self._segment_records:
+                self._rotate(self.next_sequence + written)
+            chunk = data[written:written + self._segment_records - self._segment_length]
+            self._file.write(chunk.tobytes())
+            self._segment_length += len(chunk)
+            written += len(chunk)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        self.next_sequence = sequence
+        self.records += count
+        self.commits += 1
+        self.max_group = max(self.max_group, count)
+
+    def _rotate(self, first_sequence):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        self._file = open(os.path.join(self._directory, _segment_name(first_sequence)), 'wb')
+        self._file.write(_HEADER.pack(MAGIC, VERSION, first_sequence))
+        self._segment_length = 0
+        self.segments += 1
+        # The new directory entry has to be durable as well
+        fd = os.open(self._directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def stats(self):
+        return {'records': self.records,
+                'commits': self.commits,
+                'max_group': self.max_group,
+                'segments': self.segments,
+                'backlog': len(self._pending),
+                'lost': self.lost}
+
+
+def read_journal(directory, start=0):
+    """
+    Yields the journaled commands with a sequence number of at least start
+    as (sequence, timestamp, kind, source, instrument, order_id, side,
+    order_type, price, quantity, trader_id) tuples, in sequence order.
+
+    The first segment and the offset of the start record in it are
+    computed from the segment names, nothing before start is read.
+    """
+    segments = list_segments(directory)
+    firsts = [first_sequence for first_sequence, _ in segments]
+    index = max(bisect_right(firsts, start) - 1, 0)
+    for first_sequence, path in segments[index:]:
+        if _read_header(path) is None:
+            continue
+        length = _segment_length(path)
+        position = max(start - first_sequence, 0)
+        while position < length:
+            count = min(_CHUNK, length - position)
+            records = np.fromfile(path, RECORD_DTYPE, count, offset=_HEADER.size + position * RECORD_DTYPE.itemsize)
+            for (sequence, timestamp, order_id, price, quantity, kind, source, side, order_type, trader,
+                 instrument) in records.tolist():
+                yield (sequence, timestamp, kind, source, instrument.decode('utf-8'), order_id, _SIDES[side],
+                       _ORDER_TYPES[order_type], price, quantity,
+                       uuid.UUID(bytes=trader) if trader != _NO_TRADER else None)
+            position += count
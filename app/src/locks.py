@@ -0,0 +1,58 @@
+import threading
+import time
+
+
+class InstrumentedLock(object):
+    """
+    threading.Lock that measures how long threads wait for it.
+
+    An acquire first tries the lock without blocking, only when that fails
+    the acquire is counted as contended and the blocking wait is timed.
+    Uncontended acquires therefore cost one extra try and no clock reads.
+    The counters are updated while the lock is held.
+    """
+    __slots__ = ('name', '_lock', 'acquisitions', 'contentions', 'wait_ns', 'max_wait_ns')
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.contentions = 0
+        self.wait_ns = 0
+        self.max_wait_ns = 0
+
+    def acquire(self):
+        if self._lock.acquire(False):
+            self.acquisitions += 1
+            return True
+        start = time.perf_counter_ns()
+        self._lock.acquire()
+        wait = time.perf_counter_ns() - start
+        self.acquisitions += 1
+        self.contentions += 1
+        self.wait_ns += wait
+        if wait > self.max_wait_ns:
+            self.max_wait_ns = wait
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._lock.release()
+
+    def stats(self):
+        return {'acquisitions': self.acquisitions,
+                'contentions': self.contentions,
+                'wait_ns': self.wait_ns,
+                'max_wait_ns': self.max_wait_ns}
+
+    def __str__(self):
+        return f'{self.name}: {self.stats()}'
@@ -2,9 +2,9 @@ import socket
 import threading
 import json
 import uuid
-import time
 import jsonschema
 from copy import deepcopy
+from queue import Empty
 
 import src.handshake as handshake
 import src.messaging as messaging
@@ -12,6 +12,9 @@ import src.messaging as messaging
 from .side import (
     side_to_str
 )
+from .clock import (
+    wire_timestamp
+)
 from src.connection import (
     ClientConnection
 )
@@ -55,20 +58,21 @@ def accept_new_market_data_clients(config, state):
     print(f'Stopped to accept new MD clients.')
 
 
-def _create_add_message_from_order(order):
+def _create_add_message_from_order(order, scale):
     """
     Creates add message from an order
-    :param order:
+    :param order: resting order (ticks and lots)
+    :param scale: TickScale of the book the order rests in
     :return:
     """
     message = {}
     message.update({"message-type": "A"})
     message.update({"instrument": order.instrument})
     message.update({"order-id": order.order_id})
-    message.update({"price": int(order.price)})
-    message.update({"quantity": int(order.quantity)})
+    message.update({"price": scale.to_price(order.price)})
+    message.update({"quantity": scale.to_quantity(order.quantity)})
     message.update({"side": side_to_str(order.side)})
-    message.update({"timestamp": order.timestamp})
+    message.update({"timestamp": wire_timestamp(order.timestamp)})
     message.update({"snapshot": 1})
     return message
 
@@ -79,41 +83,46 @@ def _send_order_book_snapshot(state, client, symbol):
     to the subscriber.
 
     """
-    state.lock.acquire()
-
     # Try to find order book corresponding to symbol
     try:
-        lob = state.get_current_lob_state(symbol)
+        state.submit(symbol, _execute_snapshot, _respond_snapshot, symbol, client)
     except KeyError as exc:
-        state.lock.release()
         # TODO: create error message
         return
 
-    messages = []
-    # Send sell orders
-    if (lob.asks is not None) and (len(lob.asks) > 0):
-        for price, order_list in reversed(lob.asks.price_map.items()):
-            head_order = order_list.get_head_order()
-            for _ in range(0, order_list.length):
-                messages.append(_create_add_message_from_order(head_order))
-                head_order = head_order.next_order
 
-    # Send buy orders
-    if (lob.bids is not None) and (len(lob.bids) > 0):
-        for price, order_list in reversed(lob.bids.price_map.items()):
-            head_order = order_list.get_head_order()
-            for _ in range(0, order_list.length):
-                messages.append(_create_add_message_from_order(head_order))
-                head_order = head_order.next_order
+class _Snapshot(object):
+    '''Order book snapshot of one subscriber, sent by the feed thread in its place among the book events'''
+    __slots__ = ('client', 'symbol', 'messages')
+
+    def __init__(self, client, symbol, messages):
+        self.client = client
+        self.symbol = symbol
+        self.messages = messages
+
+
+def _execute_snapshot(state, lob, command):
+    # Sell orders first, then buy orders
+    return [_create_add_message_from_order(order, lob.scale) for order in lob.snapshot_orders()]
 
-    for message in messages:
-        message = json.dumps(message)
-        messaging.send_data(client.socket, message, client.encoding)
-        time.sleep(0.0001)
 
-    client.snapshot_sent = True
+def _respond_snapshot(state, lob, command, messages):
+    # Responses of a book run in sequence order and put the book events on
+    # the event queue, so the snapshot lands behind every event it already
+    # contains and ahead of every event it does not
+    state.event_queue.put(_Snapshot(command.client, command.payload, messages))
 
-    state.lock.release()
+
+def _print_order_book(state, lob, command):
+    lob.print()
+
+
+def _send_snapshot(snapshot):
+    client = snapshot.client
+    for message in snapshot.messages:
+        messaging.send_data(client.socket, json.dumps(message), client.encoding)
+    # Book events of the symbol are sent to the client from here on
+    client.snapshots.add(snapshot.symbol)
 
 
 def handle_market_data_subscription(state, client):
@@ -185,51 +194,56 @@ market_data_message_handlers = {
 
 def public_market_data_feed(config, state):
     """
-    Publishes market data events to subscribers
+    Publishes market data events to subscribers, and prints the book of
+    every event with display style BOOK.
     """
+    print_book = config.display == 'BOOK'
 
     # Sleep until the next market event
     while not state.stopper.is_set():
 
-        state.lock.acquire()
-        while not state.event_queue.empty():
-
-            # Get next event
-            event = state.event_queue.get()
-
-            # TODO: ugly
-            if isinstance(event, dict):
-                symbol = event['instrument']
-                message_type = event['message-type']
-            else:
-                symbol = event.instrument
-                message_type = event.message_type
-
-            for client in state.get_market_data_clients():
-                if client.handshaken and client.snapshot_sent:
-                    subscriptions = client.subscriptions
-                    if symbol in subscriptions:
-                        topics = client.subscriptions[symbol]
-                        if message_type in ['A', 'X', 'M']:
-                            if 'orderBookL2' in topics:
-                                if not isinstance(event, dict):
-                                    message = event.get_message()
-                                    messaging.send_data(client.socket, message, client.encoding)
-                                else:
-                                    message = json.dumps(event)
-                                    messaging.send_data(client.socket, message, client.encoding)
-
-                        elif message_type in ['E']:
-                            if 'trade' in topics:
-                                if not isinstance(event, dict):
-                                    message = event.get_message()
-                                    messaging.send_data(client.socket, message, client.encoding)
-                                else:
-                                    message = json.dumps(event)
-                                    messaging.send_data(client.socket, message, client.encoding)
-
-            state.get_current_lob_state(event['instrument']).print()
-
-        state.lock.release()
+        # Get next event, waking up now and then to check the stopper
+        try:
+            event = state.event_queue.get(timeout=0.1)
+        except Empty:
+            continue
+
+        if isinstance(event, _Snapshot):
+            _send_snapshot(event)
+            continue
+
+        # TODO: ugly
+        if isinstance(event, dict):
+            symbol = event['instrument']
+            message_type = event['message-type']
+        else:
+            symbol = event.instrument
+            message_type = event.message_type
+
+        for client in state.get_market_data_clients():
+            if client.handshaken:
+                subscriptions = client.subscriptions
+                if symbol in subscriptions:
+                    topics = client.subscriptions[symbol]
+                    if message_type in ['A', 'X', 'M']:
+                        if 'orderBookL2' in topics and symbol in client.snapshots:
+                            if not isinstance(event, dict):
+                                message = event.get_message()
+                                messaging.send_data(client.socket, message, client.encoding)
+                            else:
+                                message = json.dumps(event)
+                                messaging.send_data(client.socket, message, client.encoding)
+
+                    elif message_type in ['E']:
+                        if 'trade' in topics:
+                            if not isinstance(event, dict):
+                                message = event.get_message()
+                                messaging.send_data(client.socket, message, client.encoding)
+                            else:
+                                message = json.dumps(event)
+                                messaging.send_data(client.socket, message, client.encoding)
+
+        if print_book:
+            state.submit(symbol, _print_order_book)
 
     print('Market data dispatching stopped.')
@@ -0,0 +1,109 @@
+import logging
+import threading
+from collections import namedtuple
+
+from .ringbuffer import (
+    RingBuffer
+)
+
+# execute(state, lob, command) runs on the thread that owns the book and
+# returns a result, respond(state, lob, command, result) sends the messages
+# for it. Results must not reference orders resting in the book. If
+# execute raises, fail(state, lob, command, error) answers the caller
+# instead of respond.
+Command = namedtuple('Command', ['execute', 'respond', 'payload', 'client', 'fail'], defaults=[None])
+
+logger = logging.getLogger(__name__)
+
+MATCHING_MODES = ('locked', 'single-writer')
+
+# Most commands taken from the ring in one go
+BATCH_SIZE = 256
+
+
+class MatchingEngine(object):
+    """
+    Single writer of one OrderBook.
+
+    Producers publish immutable Commands into the command ring. The
+    matching thread is the only thread that touches the book, it takes
+    the commands in batches, executes them and publishes
+    (sequence, command, result, failed) records into the result ring. The
+    responder thread reads the result ring and sends the order entry and
+    market data messages, so socket writes never stall matching. A command
+    whose execute raised is logged and answered with its fail callback.
+    """
+
+    def __init__(self, state, symbol, ring_size=4096, wait_strategy='block'):
+        self._state = state
+        self._symbol = symbol
+        self._lob = state.get_current_lob_state(symbol)
+        self.commands = RingBuffer(ring_size, wait_strategy)
+        self.results = RingBuffer(ring_size, wait_strategy)
+        self._matching_thread = threading.Thread(target=self._match, name=f'matching-{symbol}')
+        self._responder_thread = threading.Thread(target=self._respond, name=f'responder-{symbol}')
+        self.processed = 0
+        self.batches = 0
+
+    @property
+    def symbol(self):
+        return self._symbol
+
+    def start(self):
+        self._matching_thread.start()
+        self._responder_thread.start()
+
+    def join(self):
+        self._matching_thread.join()
+        self._responder_thread.join()
+
+    def submit(self, command):
+        """
+        Publishes a command, returns its sequence number.
+        """
+        return self.commands.publish(command)
+
+    def _match(self):
+        state = self._state
+        lob = self._lob
+        commands = self.commands
+        results = self.results
+        while not state.stopper.is_set():
+            sequence, batch = commands.poll(BATCH_SIZE, 0.1)
+            for command in batch:
+                try:
+                    result = command.execute(state, lob, command)
+                except Exception as exc:
+                    logger.exception(f'Command {sequence} failed on book {self._symbol}.')
+                    if command.fail is not None:
+                        results.publish((sequence, command, exc, True))
+                else:
+                    if command.respond is not None:
+                        results.publish((sequence, command, result, False))
+                sequence += 1
+            if batch:
+                self.processed += len(batch)
+                self.batches += 1
+        commands.close()
+        results.close()
+
+    def _respond(self):
+        state = self._state
+        lob = self._lob
+        results = self.results
+        # Results of commands matched before the stop are still sent
+        while self._matching_thread.is_alive() or len(results) > 0:
+            _, batch = results.poll(BATCH_SIZE, 0.1)
+            for sequence, command, result, failed in batch:
+                try:
+                    if failed:
+                        command.fail(state, lob, command, result)
+                    else:
+                        command.respond(state, lob, command, result)
+                except Exception:
+                    logger.exception(f'Response to command {sequence} failed on book {self._symbol}.')
+
+    def stats(self):
+        return {'processed': self.processed,
+                'batches': self.batches,
+                'backlog': len(self.commands)}
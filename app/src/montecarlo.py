@@ -0,0 +1,283 @@
+"""
+Monte Carlo runs of the market simulation for calibration.
+
+A session runs the event generators of simulation.py on one standalone
+OrderBook in virtual time, as fast as the events can be applied, and
+keeps only summary statistics: event and trade counts, traded volume,
+spread and depth sampled every sample_interval simulated seconds and the
+mid price path at the same samples. Sessions run in a pool of worker
+processes and every worker sends back one small summary per session,
+never the events, so a worker needs the memory of one book and one mid
+path whatever the number of sessions.
+"""
+import math
+import multiprocessing
+import os
+import random
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from .orderbook import (
+    OrderBook
+)
+
+from .clock import (
+    VirtualClock
+)
+
+from .event import (
+    EventTypes
+)
+
+from .event_generator import (
+    EventSchedule
+)
+
+from .simulation import (
+    create_generators
+)
+
+SessionSpec = namedtuple('SessionSpec', ['seed', 'duration', 'sample_interval', 'add_rate', 'cancel_rate',
+                                         'market_rate', 'best_bid', 'best_ask', 'levels', 'orders', 'volume',
+                                         'backend'],
+                         defaults=[1.0, 1.10, 1.0, 0.5, 9999, 10000, 20, 10, 1, 'tree'])
+SessionSpec.__doc__ = '''One simulated session. duration and sample_interval are simulated
+seconds, the rates those of create_generators and the initial book is
+levels levels of orders orders of volume lots from best_bid and best_ask
+out, as main.py builds it.'''
+
+# Per session statistics aggregated over the sessions
+SESSION_STATISTICS = ['events', 'limit_orders', 'cancels', 'market_orders', 'trades', 'traded_volume',
+                      'mean_spread', 'max_spread', 'mean_bid_depth', 'mean_ask_depth', 'one_sided',
+                      'mid_change', 'mid_volatility', 'events_per_second']
+
+
+class _Session(object):
+    '''The part of GlobalState the event generators use, for one standalone book.'''
+
+    journal = None
+
+    def __init__(self, book, clock):
+        self._book = book
+        self.clock = clock
+
+    def get_current_lob_state(self, symbol):
+        return self._book
+
+
+def run_session(spec):
+    """
+    Runs one session and returns its summary as a dict with a value for
+    each of SESSION_STATISTICS, the spec and the mid price path as a NumPy
+    array with a sample per sample_interval, NaN while a side was empty.
+    """
+    np.random.seed(spec.seed)
+    random.seed(spec.seed)
+    clock = VirtualClock(0)
+    book = OrderBook(backend=spec.backend, clock=clock)
+    orders = [(spec.volume, None)] * spec.orders
+    book.bulk_load([(price, orders) for price in range(spec.best_bid, spec.best_bid - spec.levels, -1)],
+                   [(price, orders) for price in range(spec.best_ask, spec.best_ask + spec.levels)], '0')
+    session = _Session(book, clock)
+
+    schedule = EventSchedule(create_generators('0', 1, spec.add_rate, spec.cancel_rate, spec.market_rate))
+
+    end = int(spec.duration * 1e9)
+    interval = int(spec.sample_interval * 1e9)
+    if interval <= 0:
+        raise ValueError(f'Sample interval has to be positive, was {spec.sample_interval}.')
+    mids = np.full(end // interval + 1, np.nan)
+    counts = {EventTypes.ADD: 0, EventTypes.CANCEL: 0, EventTypes.MARKET_ORDER: 0}
+    trades = 0
+    traded_volume = 0
+    spread_total = 0
+    spread_max = 0
+    spreads = 0
+    bid_depth = 0
+    ask_depth = 0
+    sample = 0
+    next_sample = 0
+
+    start = time.perf_counter()
+    while True:
+        due, _ = schedule.peek()
+
+        # Samples of the book in the state before the event
+        while next_sample <= due and next_sample <= end:
+            best_bid = book.get_best_bid()
+            best_ask = book.get_best_ask()
+            if best_bid is not None and best_ask is not None:
+                spread = best_ask - best_bid
+                spread_total += spread
+                spread_max = max(spread_max, spread)
+                spreads += 1
+                mids[sample] = (best_bid + best_ask) / 2
+            bids, asks = book.get_depth(as_arrays=True)
+            bid_depth += int(bids[1].sum())
+            ask_depth += int(asks[1].sum())
+            sample += 1
+            next_sample += interval
+        if due > end:
+            break
+
+        result = schedule.step(session, book)
+        if result is not None:
+            event, outcome = result
+            counts[event.event_type] += 1
+            if event.event_type == EventTypes.MARKET_ORDER:
+                fills, quantity = outcome.summary()
+                trades += fills
+                traded_volume += quantity
+    seconds = time.perf_counter() - start
+
+    events = sum(counts.values())
+    valid = mids[np.isfinite(mids)]
+    returns = np.diff(mids)
+    returns = returns[np.isfinite(returns)]
+    return {'spec': spec,
+            'events': events,
+            'limit_orders': counts[EventTypes.ADD],
+            'cancels': counts[EventTypes.CANCEL],
+            'market_orders': counts[EventTypes.MARKET_ORDER],
+            'trades': trades,
+            'traded_volume': traded_volume,
+            'mean_spread': spread_total / spreads if spreads else math.nan,
+            'max_spread': spread_max if spreads else math.nan,
+            'mean_bid_depth': bid_depth / sample,
+            'mean_ask_depth': ask_depth / sample,
+            'one_sided': sample - spreads, # samples with an empty side
+            'mid_change': float(valid[-1] - valid[0]) if len(valid) else math.nan,
+            'mid_volatility': float(returns.std()) if len(returns) > 1 else math.nan,
+            'events_per_second': events / seconds if seconds else 0,
+            'mid_path': mids}
+
+
+class RunningStatistics(object):
+    """
+    Count, mean, standard deviation, minimum and maximum of a stream of
+    values in constant memory (Welford). NaNs are left out.
+    """
+    __slots__ = ('count', 'mean', '_m2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        if value != value:
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+class MonteCarloSummary(object):
+    """
+    Aggregate of session summaries. Every statistic of SESSION_STATISTICS
+    gets a RunningStatistics over the sessions, the mid price paths are
+    aggregated per sample as the change from the first mid of the session,
+    so memory only grows with the longest path.
+    """
+
+    def __init__(self):
+        self.sessions = 0
+        self.statistics = {name: RunningStatistics() for name in SESSION_STATISTICS}
+        self._path_count = np.zeros(0, dtype=np.int64)
+        self._path_sum = np.zeros(0)
+        self._path_squares = np.zeros(0)
+
+    def add(self, summary):
+        self.sessions += 1
+        for name, statistics in self.statistics.items():
+            statistics.add(summary[name])
+
+        path = summary['mid_path']
+        valid = np.isfinite(path)
+        if not valid.any():
+            return
+        if len(path) > len(self._path_sum):
+            grow = len(path) - len(self._path_sum)
+            self._path_count = np.concatenate([self._path_count, np.zeros(grow, dtype=np.int64)])
+            self._path_sum = np.concatenate([self._path_sum, np.zeros(grow)])
+            self._path_squares = np.concatenate([self._path_squares, np.zeros(grow)])
+        change = np.where(valid, path - path[valid][0], 0.0)
+        self._path_count[:len(path)] += valid
+        self._path_sum[:len(path)] += change
+        self._path_squares[:len(path)] += change * change
+
+    def mid_path(self):
+        """
+        Returns the mean and standard deviation of the mid change per
+        sample over the sessions, as NumPy arrays.
+        """
+        count = np.maximum(self._path_count, 1)
+        mean = self._path_sum / count
+        variance = np.maximum(self._path_squares / count - mean * mean, 0.0)
+        return mean, np.sqrt(variance)
+
+    def __str__(self):
+        lines = [f'{self.sessions} sessions',
+                 f"{'statistic':<20}{'mean':>14}{'std':>14}{'min':>14}{'max':>14}"]
+        for name, statistics in self.statistics.items():
+            lines.append(f'{name:<20}{statistics.mean:>14.4g}{statistics.std:>14.4g}'
+                         f'{statistics.min:>14.4g}{statistics.max:>14.4g}')
+        return '\n'.join(lines)
+
+
+def make_specs(sessions, seed, duration, sample_interval=1.0, add_rate=1.10, cancel_rate=1.0, market_rate=0.5,
+               **kwargs):
+    """
+    Returns the specs of sessions sessions with seeds counted up from
+    seed. A rate given as a (low, high) pair is drawn uniformly per
+    session, the draws are reproducible from seed. kwargs go into every
+    SessionSpec.
+    """
+    rng = np.random.RandomState(seed)
+
+    def draw(rate):
+        if isinstance(rate, tuple):
+            low, high = rate
+            if not 0 < low <= high:
+                raise ValueError(f'Rate range has to be positive and ordered, was {rate}.')
+            return float(rng.uniform(low, high))
+        if rate <= 0:
+            raise ValueError(f'Rate has to be positive, was {rate}.')
+        return rate
+
+    return [SessionSpec(seed + i, duration, sample_interval, draw(add_rate), draw(cancel_rate), draw(market_rate),
+                        **kwargs)
+            for i in range(sessions)]
+
+
+def run_monte_carlo(specs, processes=None, callback=None, sessions_per_worker=None):
+    """
+    Runs the sessions in a pool of processes, by default one per CPU, and
+    returns their MonteCarloSummary. Summaries are aggregated as the
+    sessions finish, callback(summary) is called for each one.
+    sessions_per_worker restarts a worker after that many sessions, to
+    hand memory back to the system.
+    """
+    processes = processes or os.cpu_count()
+    if processes <= 0:
+        raise ValueError(f'Number of processes has to be positive, was {processes}.')
+    aggregate = MonteCarloSummary()
+    # Fresh interpreters, as for the sharded engine
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes, maxtasksperchild=sessions_per_worker) as pool:
+        for summary in pool.imap_unordered(run_session, specs):
+            aggregate.add(summary)
+            if callback is not None:
+                callback(summary)
+    return aggregate
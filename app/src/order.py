@@ -1,5 +1,5 @@
-from decimal import * 
 import time, random
+from itertools import repeat
 from enum import Enum
 
 
@@ -20,16 +20,24 @@ def order_type_to_str(order_type):
 class Order(object):
     """
     Orders represent the core piece of the exchange. Every bid/ask is an Order.
-    Orders are doubly linked and have helper functions (next_order, prev_order)
-    to help the exchange fullfill orders with quantities larger than a single
-    existing Order.
+    Orders are doubly linked (next_order, prev_order) to help the exchange
+    fullfill orders with quantities larger than a single existing Order.
+
+    Orders are slotted and recycled through an OrderPool, so assign() is
+    used to (re)initialize an order in place.
     """
+    __slots__ = ('timestamp', 'quantity', 'price', 'order_id', 'trader_id',
+                 'side', 'instrument', 'next_order', 'prev_order', 'order_list')
+
     def __init__(self, quote, order_list):
+        self.assign(quote, order_list)
+
+    def assign(self, quote, order_list):
 
         self.timestamp = quote['timestamp']  # integer representing the timestamp of order creation
-        self.quantity = Decimal(quote['quantity'])  # decimal representing amount of thing - can be partial amounts
-        self.price = Decimal(quote['price'])  # decimal representing price (currency)
-        self.order_id = int(quote['order_id'])
+        self.quantity = quote['quantity']  # integer representing amount of thing in lots
+        self.price = quote['price']  # integer representing price in ticks
+        self.order_id = quote['order_id']
         self.trader_id = quote.get('trader_id', None)
         self.side = quote['side']
         self.instrument = quote['instrument']
@@ -39,13 +47,6 @@ class Order(object):
         self.prev_order = None
         self.order_list = order_list
 
-    # helper functions to get Orders in linked list
-    def next_order(self):
-        return self.next_order
-
-    def prev_order(self):
-        return self.prev_order
-
     def update_quantity(self, new_quantity, new_timestamp):
         if new_quantity > self.quantity and self.order_list.tail_order != self:
             # check to see that the order is not the last order in list and the quantity is more
@@ -57,3 +58,65 @@ class Order(object):
     def __str__(self):
         return "{}@{}/{} - {}".format(self.quantity, self.price,
                                       self.order_id, self.timestamp)
+
+
+class OrderPool(object):
+    """
+    Free-list of Order objects shared by the two OrderTrees of an OrderBook.
+
+    The pool is pre-warmed with `size` orders so that steady state add/cancel
+    traffic reuses existing objects instead of allocating new ones. Orders
+    released while the free-list is full are left to the garbage collector.
+    Hits and misses are counted to help sizing the pool.
+    """
+    __slots__ = ('_free', '_size', 'hits', 'misses')
+
+    def __init__(self, size=0):
+        if size < 0:
+            raise ValueError(f'Pool size can not be negative, was {size}.')
+        self._size = size
+        self._free = [Order.__new__(Order) for _ in range(size)]
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._free)
+
+    @property
+    def size(self):
+        return self._size
+
+    def acquire(self, quote, order_list):
+        if self._free:
+            self.hits += 1
+            order = self._free.pop()
+            order.assign(quote, order_list)
+            return order
+        self.misses += 1
+        return Order(quote, order_list)
+
+    def acquire_many(self, count):
+        '''Hands out count blank Orders for a bulk load, the caller sets every field.'''
+        free = self._free
+        hits = min(count, len(free))
+        orders = free[len(free) - hits:]
+        del free[len(free) - hits:]
+        orders.extend(map(Order.__new__, repeat(Order, count - hits)))
+        self.hits += hits
+        self.misses += count - hits
+        return orders
+
+    def release(self, order):
+        # Data fields are left intact since callers may still read
+        # the removed order, only the links are dropped.
+        order.next_order = None
+        order.prev_order = None
+        order.order_list = None
+        if len(self._free) < self._size:
+            self._free.append(order)
+
+    def stats(self):
+        return {'size': self._size,
+                'free': len(self._free),
+                'hits': self.hits,
+                'misses': self.misses}
@@ -20,6 +20,14 @@ from src.soe import (
     MessageFactory
 )
 
+from src.shard import (
+    OrderRecord
+)
+
+from src.journal import (
+    CLIENT
+)
+
 
 class OrderRequestHandler:
 
@@ -161,36 +169,50 @@ def is_owner(order, client):
     return order.order_id in client.orders
 
 
-def _handle_order_entry_cancel_order(state, client, order):
-    """
-    Handles cancel order requests
-    """
-    state.lock.acquire()
+def _execute_cancel_order(state, lob, command):
+    order_in_book = lob.cancel(command.payload.order_id)
+    if order_in_book is None:
+        return None
+    journal = state.journal
+    if journal is not None:
+        journal.cancel(CLIENT, order_in_book, state.clock.now())
+    # The order goes back to the pool, the response gets a copy
+    return OrderRecord(order_in_book)
 
-    lob = state.get_current_lob_state(order.instrument)
 
-    if not is_owner(order, client):
-        state.lock.release()
-        return
+def _reject_failed_cancel_order(state, lob, command, error):
+    client = command.client
+    message = OrderEntryMessageFactory.cancel_rejected_message(command.payload, 'Cancel could not be processed.',
+                                                               state.clock)
+    messaging.send_data(client.socket, json.dumps(message), client.encoding)
+
 
-    order_in_book = lob.get_order(order.order_id)
+def _respond_cancel_order(state, lob, command, order_in_book):
+    client = command.client
 
     if order_in_book is None:
         # TODO: send order cancel rejected
-        state.lock.release()
         return
-    else:
-        lob.cancel_order(order_in_book.side, order.order_id)
-        client.order_set_as_canceled(order)
 
-        messaging.send_data(
-            client.socket,
-            OrderEntryMessageFactory.canceled_message(order_in_book, 'Client request.'),
-            client.encoding)
+    client.order_set_as_canceled(command.payload)
 
-        state.event_queue.put(OrderEntryMessageFactory.remove_message(order_in_book))
+    messaging.send_data(
+        client.socket,
+        json.dumps(OrderEntryMessageFactory.canceled_message(order_in_book, 'Client request.', lob.scale)),
+        client.encoding)
+
+    state.event_queue.put(OrderEntryMessageFactory.remove_message(order_in_book, lob.scale))
+
+
+def _handle_order_entry_cancel_order(state, client, order):
+    """
+    Handles cancel order requests
+    """
+    if not is_owner(order, client):
+        return
 
-    state.lock.release()
+    state.submit(order.instrument, _execute_cancel_order, _respond_cancel_order, order, client,
+                 _reject_failed_cancel_order)
 
 
 def _find_order_book(state, client, order):
@@ -201,21 +223,38 @@ def _find_order_book(state, client, order):
         order_book = state.get_current_lob_state(order.instrument)
         success = True
     except KeyError as keyError:
-        message = OrderEntryMessageFactory.rejected_message(order, "Invalid symbol.")
+        message = OrderEntryMessageFactory.rejected_message(order, "Invalid symbol.", state.clock)
         messaging.send_data(client.socket, message, client.encoding)
 
     return order_book, success
 
 
-def _handle_modify_order(client, order, order_book):
+def _is_valid_order_size(client, order, order_book):
+    """
+    Rejects orders whose price or quantity can not be represented
+    in the integer ticks and lots of the order book.
+    """
+    scale = order_book.scale
+    if not scale.is_valid_price(order.price):
+        reason = "Price is not a multiple of the tick size."
+    elif not scale.is_valid_quantity(order.quantity):
+        reason = "Quantity is not a multiple of the lot size."
+    else:
+        return True
+
+    message = OrderEntryMessageFactory.rejected_message(order, reason, order_book.clock)
+    messaging.send_data(client.socket, json.dumps(message), client.encoding)
+
+    return False
+
+
+def _handle_modify_order(client, order):
 
     messaging.send_data(
         client.socket,
         OrderEntryMessageFactory.accepted_message(order.to_lob_format()),
         client.encoding)
 
-    order_book.modify_order(order.order_id, order.to_lob_format(), None)
-
     # Save order to clients open orders
     client.orders[order.order_id] = order
 
@@ -235,48 +274,42 @@ def can_modify_order(request, order_book):
     return order != None
 
 
-def _handle_transaction_messages(state, client, order_in_book, transactions):
+def _handle_transaction_messages(state, client, order_book, order_in_book, transactions):
 
-    # Generate trade messages
-    aggressor_messages, passive_messages = transactions.get_trade_messages()
+    # Serialize all trade messages in one pass
+    encoded = transactions.encode()
 
     # Send order executed message(s) to the passive side of the transaction
-    for passive_trader_id, msg in passive_messages:
+    for passive_trader_id, msg in encoded.passive_reports:
         # If passive_trader_id is None the order was simulated and no message will be sent.
         if passive_trader_id is not None:
-            passive_side_client = state.get_order_client_nts(passive_trader_id)
+            passive_side_client = state.get_order_client(passive_trader_id)
             if passive_side_client is not None:
                 messaging.send_data(
                     passive_side_client.socket,
-                    json.dumps(msg),
+                    msg,
                     passive_side_client.encoding)
 
     # Send order executed message(s) to the aggressing side of the transaction (client)
-    for msg in aggressor_messages:
-        messaging.send_data(client.socket, json.dumps(msg), client.encoding)
+    for msg in encoded.aggressor_reports:
+        messaging.send_data(client.socket, msg, client.encoding)
 
     # Publish trade(s) via the public market data feed
-    for msg in aggressor_messages:
+    for msg in encoded.trade_prints:
         state.event_queue.put(msg)
 
     # Publish remove and modify messages via the public market data feed
-    remove_and_modify_messages = transactions.get_remove_and_modify_messages()
-    for msg in remove_and_modify_messages:
+    for msg in encoded.book_deltas:
         state.event_queue.put(msg)
 
     # Publish potential add message via the public market data feed
     if order_in_book['quantity'] > 0:
-        state.event_queue.put(MessageFactory(order_in_book))
-
+        state.event_queue.put(OrderEntryMessageFactory.book_add_message(order_in_book, order_book.scale))
 
-def _handle_insert_new_order(state, client, order, order_book):
 
-    # Insert the order to the book
-    transactions, order_in_book, cancels = order_book.process_order(
-        order.to_lob_format(), False, False)
+def _handle_insert_new_order(state, client, order, order_book, result):
 
-    if cancels:
-        _handle_self_match_prevention_cancels(state, client, cancels)
+    transactions, order_in_book, cancels = result
 
     order.order_id = order_in_book['order_id']
     order.timestamp = order_in_book['timestamp']
@@ -286,26 +319,41 @@ def _handle_insert_new_order(state, client, order, order_book):
     accepted_message = OrderEntryMessageFactory.accepted_message(order)
     messaging.send_data(client.socket, json.dumps(accepted_message) , client.encoding)
 
+    # Reports of orders canceled or decremented by self-match prevention follow the accept
+    if cancels:
+        _handle_self_match_prevention_cancels(state, client, cancels, order_book.scale)
+
     # If the new order was matched immediately
     if not transactions.is_empty():
-        _handle_transaction_messages(state, client, order_in_book, transactions)
-    else:
-        add_messge = OrderEntryMessageFactory.add_message(order)
-        state.event_queue.put(add_messge)
+        _handle_transaction_messages(state, client, order_book, order_in_book, transactions)
+    elif order_in_book['quantity'] > 0:
+        # Self-match prevention may have decremented the order, the resting quantity is published
+        add_message = OrderEntryMessageFactory.book_add_message(order_in_book, order_book.scale)
+        state.event_queue.put(add_message)
 
 
-def _handle_self_match_prevention_cancels(state, client, cancels):
+def _handle_self_match_prevention_cancels(state, client, cancels, scale):
 
     for cancel in cancels:
 
-        cancel_message = OrderEntryMessageFactory.canceled_message(
-            cancel,
-            'Order canceled due to automatic Self-Match-Prevention.'
-        )
+        if cancel.remaining_quantity > 0:
+            cancel_message = OrderEntryMessageFactory.decremented_message(
+                cancel,
+                'Order decremented due to automatic Self-Match-Prevention.',
+                scale
+            )
+        else:
+            cancel_message = OrderEntryMessageFactory.canceled_message(
+                cancel,
+                'Order canceled due to automatic Self-Match-Prevention.',
+                scale
+            )
 
         messaging.send_data(client.socket, json.dumps(cancel_message), client.encoding)
 
-        state.event_queue.put(cancel_message)
+        # The incoming order was never in the public book
+        if not cancel.aggressor:
+            state.event_queue.put(cancel_message)
 
 
 def _handle_order_entry_add_or_modify_order(state, client, order):
@@ -315,19 +363,53 @@ def _handle_order_entry_add_or_modify_order(state, client, order):
     TODO: rejection of order logic?
 
     """
-    state.lock.acquire()
-
     order_book, success = _find_order_book(state, client, order)
 
     if not success:
         return
 
-    if can_modify_order(order, order_book):
-        _handle_modify_order(client, order, order_book)
-    else:
-        _handle_insert_new_order(state, client, order, order_book)
+    if not _is_valid_order_size(client, order, order_book):
+        return
 
-    state.lock.release()
+    state.submit(order.instrument, _execute_add_or_modify_order, _respond_add_or_modify_order, order, client,
+                 _reject_failed_order)
+
+
+def _execute_add_or_modify_order(state, lob, command):
+    """
+    Modifies the order if it is in the book, otherwise inserts it.
+
+    :return: None for a modify, else the result of process_order
+    """
+    order = command.payload
+    journal = state.journal
+    if can_modify_order(order, lob):
+        update = order.to_lob_format(lob.scale)
+        lob.modify_order(order.order_id, update, None)
+        if journal is not None:
+            journal.modify(CLIENT, update, state.clock.now())
+        return None
+    lob_order = order.to_lob_format(lob.scale)
+    quantity = lob_order['quantity']
+    result = lob.process_order(lob_order, False, False)
+    if journal is not None:
+        # The order of the result has the order_id and timestamp of the book
+        journal.new_order(CLIENT, result[1], quantity)
+    return result
+
+
+def _reject_failed_order(state, lob, command, error):
+    client = command.client
+    message = OrderEntryMessageFactory.rejected_message(command.payload, 'Order could not be processed.',
+                                                        state.clock)
+    messaging.send_data(client.socket, json.dumps(message), client.encoding)
+
+
+def _respond_add_or_modify_order(state, lob, command, result):
+    if result is None:
+        _handle_modify_order(command.client, command.payload)
+    else:
+        _handle_insert_new_order(state, command.client, command.payload, lob, result)
 
 
 def _handle_order_entry_configuration(state, request):
@@ -1,8 +1,5 @@
 import json
 
-from datetime import datetime
-from decimal import Decimal
-
 from src.side import (
     side_to_str
 )
@@ -11,23 +8,27 @@ from src.order import (
     order_type_to_str
 )
 
+from src.ticks import (
+    UNIT_SCALE
+)
 
-def unix_time_millis(dt):
-    epoch = datetime.utcfromtimestamp(0)
-    return int((dt - epoch).total_seconds() * 1000000.0)
+from src.clock import (
+    DEFAULT_CLOCK,
+    wire_timestamp
+)
 
 
 class OrderEntryMessageFactory:
 
     @staticmethod
-    def rejected_message(order, reason):
+    def rejected_message(order, reason, clock=DEFAULT_CLOCK):
 
         msg = {'message-type': 'R',
                'instrument': order.instrument,
                'side': side_to_str(order.side),
                'quantity': int(order.quantity),
-               'price': float(order.price),
-               'timestamp': unix_time_millis(datetime.now()),
+               'price': None if order.price is None else float(order.price),
+               'timestamp': wire_timestamp(clock.now()),
                'order-type': order_type_to_str(order.order_type),
                'reason': reason
                }
@@ -35,15 +36,45 @@ class OrderEntryMessageFactory:
         return msg
 
     @staticmethod
-    def canceled_message(order, reason):
+    def cancel_rejected_message(cancel, reason, clock=DEFAULT_CLOCK):
+
+        msg = {'message-type': 'R',
+               'instrument': cancel.instrument,
+               'order-id': cancel.order_id,
+               'timestamp': wire_timestamp(clock.now()),
+               'reason': reason
+               }
+
+        return msg
+
+    @staticmethod
+    def canceled_message(order, reason, scale=UNIT_SCALE):
 
         msg = {'message-type': 'X',
                'order-id': order.order_id,
                'instrument': order.instrument,
                'side': side_to_str(order.side),
-               'quantity': int(order.quantity),
-               'price': float(order.price),
-               'timestamp': str(order.timestamp),
+               'quantity': scale.to_quantity(order.quantity),
+               'price': float(scale.to_price(order.price)),
+               'timestamp': str(wire_timestamp(order.timestamp)),
+               'reason': reason
+               }
+
+        return msg
+
+    @staticmethod
+    def decremented_message(cancel, reason, scale=UNIT_SCALE):
+        """
+        Creates a modify message for an order whose quantity was reduced
+        without a trade, quantity is what is left of the order.
+        """
+        msg = {'message-type': 'M',
+               'order-id': cancel.order_id,
+               'instrument': cancel.instrument,
+               'side': side_to_str(cancel.side),
+               'quantity': scale.to_quantity(cancel.remaining_quantity),
+               'price': scale.to_price(cancel.price),
+               'timestamp': str(wire_timestamp(cancel.timestamp)),
                'reason': reason
                }
 
@@ -59,21 +90,21 @@ class OrderEntryMessageFactory:
                'quantity': int(order.quantity),
                'price': float(order.price),
                'order-id': order.order_id,
-               'timestamp': str(order.timestamp)
+               'timestamp': str(wire_timestamp(order.timestamp))
                }
 
         return msg
 
     @staticmethod
-    def remove_message(cancel):
+    def remove_message(cancel, scale=UNIT_SCALE):
 
         msg = {'message-type': 'X',
                'order-id': cancel.order_id,
                'instrument': cancel.instrument,
                'order-type': 'LMT',
                'side': side_to_str(cancel.side),
-               'price': int(cancel.price),
-               'timestamp': cancel.timestamp
+               'price': scale.to_price(cancel.price),
+               'timestamp': wire_timestamp(cancel.timestamp)
                }
 
         return msg
@@ -85,10 +116,28 @@ class OrderEntryMessageFactory:
                'order-id': order.order_id,
                'instrument': order.instrument,
                'order-type': 'LMT',
-               'quantity': int(Decimal(order.quantity)),
+               'quantity': int(order.quantity),
                'price': int(order.price),
                'side': side_to_str(order.side),
-               'timestamp': order.timestamp,
+               'timestamp': wire_timestamp(order.timestamp),
+               'snapshot': 0
+               }
+
+        return msg
+
+    @staticmethod
+    def book_add_message(order, scale=UNIT_SCALE):
+        """
+        Creates add message from an order in the OrderBook format
+        (ticks and lots).
+        """
+        msg = {'message-type': 'A',
+               'instrument': order['instrument'],
+               'order-id': order['order_id'],
+               'price': scale.to_price(order['price']),
+               'quantity': scale.to_quantity(order['quantity']),
+               'side': side_to_str(order['side']),
+               'timestamp': wire_timestamp(order['timestamp']),
                'snapshot': 0
                }
 
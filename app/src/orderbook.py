@@ -1,19 +1,27 @@
+import gc
 import sys
 import math
-from datetime import datetime
 from collections import deque # a faster insert/pop queue
+from itertools import chain
 from six.moves import cStringIO as StringIO
-
-from decimal import (
-    Decimal
-)
+import numpy as np
 
 from .order import (
     OrderType
 )
 
 from .ordertree import (
-    OrderTree
+    OrderTree,
+    make_columns,
+    columns_from_levels
+)
+
+from .priceladder import (
+    PriceLadder
+)
+
+from .orderstore import (
+    ArrayOrderTree
 )
 
 from .side import (
@@ -21,54 +29,190 @@ from .side import (
     get_opposite_side
 )
 
+from .ticks import (
+    TickScale
+)
+
+from .clock import (
+    DEFAULT_CLOCK
+)
+
+from .order_entry_messaging import (
+    OrderEntryMessageFactory
+)
+
 from .transaction import (
-    PassiveParty,
-    AggressingParty,
-    Transaction,
     TransactionList,
-    SelfMatchCancel
+    SelfMatchCancel,
+    Fill,
+    LevelFill
 )
 
-epoch = datetime.utcfromtimestamp(0)
+# Price level containers an OrderBook can be built on
+BOOK_BACKENDS = {
+    'tree': OrderTree,
+    'ladder': PriceLadder,
+    'array': ArrayOrderTree
+}
 
+# How cancels take an order out of its price level
+CANCEL_MODES = ['eager', 'lazy']
 
-def unix_time_millis(dt):
-    return int((dt - epoch).total_seconds() * 1000000.0)
+# What happens when an order would trade against an order of the same trader
+SMP_MODES = ['cancel-resting', 'cancel-aggressor', 'cancel-both', 'decrement-and-cancel']
+
+
+class BatchResult(object):
+    """
+    Combined result of OrderBook.process_orders.
+
+    outcomes has one (trades, order, smp_cancels) tuple per command in
+    batch order, the same triple process_order returns. For cancels the
+    order is the command completed with the fields of the canceled order,
+    or None if the order was not found.
+
+    market_data holds the public market data deltas of the whole batch
+    in the order they happened.
+    """
+
+    def __init__(self):
+        self.outcomes = []
+        self.market_data = []
+
+    def __len__(self):
+        return len(self.outcomes)
 
 
 class OrderBook(object):
 
-    def __init__(self, tick_size=0.0001):
+    def __init__(self, tick_size=1, lot_size=1, backend='tree', pool_size=0, depth_levels=10,
+                 cancel_mode='eager', clock=None, smp_mode='cancel-resting', strict=False):
+        if backend not in BOOK_BACKENDS:
+            raise ValueError(f"Book backend has to be one of {list(BOOK_BACKENDS)}, was {backend}.")
+        if cancel_mode not in CANCEL_MODES:
+            raise ValueError(f"Cancel mode has to be one of {CANCEL_MODES}, was {cancel_mode}.")
+        if smp_mode not in SMP_MODES:
+            raise ValueError(f"Self-match prevention mode has to be one of {SMP_MODES}, was {smp_mode}.")
+        if cancel_mode == 'lazy' and backend == 'array':
+            raise ValueError("Lazy cancels are not supported by the array backend.")
         self.tape = deque(maxlen=None)  # Index[0] is most recent trade
-        self.bids = OrderTree()
-        self.asks = OrderTree()
+        # Both sides draw their orders from the same pre-warmed pool and
+        # register them in one order_id : (side, order) index
+        tree_class = BOOK_BACKENDS[backend]
+        self.order_pool = tree_class.create_pool(pool_size)
+        self.order_index = tree_class.create_index(self.order_pool)
+        self.bids = tree_class(self.order_pool, Side.B, self.order_index)
+        self.asks = tree_class(self.order_pool, Side.S, self.order_index)
+        # Aggregated top levels, patched by the trees on every level change
+        self.bids.attach_depth_view(depth_levels)
+        self.asks.attach_depth_view(depth_levels)
+        # Lazy cancels tombstone orders, the matching loop skips the tombstones
+        self.lazy_cancel = cancel_mode == 'lazy'
+        if self.lazy_cancel:
+            self.bids.enable_lazy_cancel()
+            self.asks.enable_lazy_cancel()
         self.last_tick = None
         self.last_timestamp = 0
-        self.tick_size = tick_size
+        # Prices and quantities inside the book are integer ticks and lots,
+        # the scale converts them to wire units at the gateways.
+        self.scale = TickScale(tick_size, lot_size)
+        self.smp_mode = smp_mode
+        # Timestamps are integer nanoseconds from an injectable clock
+        self.clock = clock if clock is not None else DEFAULT_CLOCK
         self.time = 0
         self.next_order_id = 0
+        # Debug mode, every fill is checked by the Transaction setters
+        self.strict = strict
 
     def update_time(self):
-        self.time = unix_time_millis(datetime.now())
+        self.time = self.clock.now()
 
     def increment_next_order_id(self):
         self.next_order_id += 1
 
     def process_order(self, order, from_data, verbose):
 
+        self.update_time()
+        return self._process_order(order, from_data, verbose)
+
+    def process_orders(self, batch, lock=None):
+        """
+        Processes a sequence of order commands with a single timestamp
+        and, if a lock is given, a single lock hold.
+
+        New orders use the process_order format. Cancels use the format
+        of Cancel.to_lob_format, i.e. {'type': 'cancel', 'order_id': ...}.
+
+        :param batch: sequence of order commands
+        :param lock: optional lock held while the batch is processed
+        :return: BatchResult
+        """
+        if lock is None:
+            return self._process_orders(batch)
+        with lock:
+            return self._process_orders(batch)
+
+    def _process_orders(self, batch):
+
+        result = BatchResult()
+        scale = self.scale
+        market_data = result.market_data
+
+        self.update_time()
+
+        for command in batch:
+
+            if command.get('type') == 'cancel':
+                trades = TransactionList(scale)
+                order = self.cancel(command['order_id'])
+                if order is None:
+                    result.outcomes.append((trades, None, []))
+                    continue
+                command.update({'instrument': order.instrument,
+                                'side': order.side,
+                                'price': order.price,
+                                'quantity': order.quantity,
+                                'timestamp': self.time})
+                market_data.append(OrderEntryMessageFactory.remove_message(order, scale))
+                result.outcomes.append((trades, command, []))
+                continue
+
+            trades, order, smp_cancels = self._process_order(command, False, False)
+            result.outcomes.append((trades, order, smp_cancels))
+
+            for cancel in smp_cancels:
+                if cancel.aggressor:
+                    continue # never rested in the book
+                if cancel.remaining_quantity > 0:
+                    market_data.append(OrderEntryMessageFactory.decremented_message(
+                        cancel, 'Order decremented due to automatic Self-Match-Prevention.', scale))
+                else:
+                    market_data.append(OrderEntryMessageFactory.canceled_message(
+                        cancel, 'Order canceled due to automatic Self-Match-Prevention.', scale))
+
+            if not trades.is_empty():
+                aggressor_messages, _ = trades.get_trade_messages()
+                market_data += aggressor_messages
+                market_data += trades.get_remove_and_modify_messages()
+
+            if order['order_type'] == OrderType.Limit and order['quantity'] > 0:
+                market_data.append(OrderEntryMessageFactory.book_add_message(order, scale))
+
+        return result
+
+    def _process_order(self, order, from_data, verbose):
+
         order['order_id'] = self.next_order_id
         self.increment_next_order_id()
 
         order_type = order['order_type']
 
-        self.update_time()
         order['timestamp'] = self.time
 
         if order_type == OrderType.Market:
             trades, smp_cancels = self.process_market_order(order, verbose)
 
         elif order_type == OrderType.Limit:
-            order['price'] = Decimal(order['price'])
             trades, order_in_book, smp_cancels = self.process_limit_order(order, from_data, verbose)
         else:
             sys.exit("order_type for process_order() is neither 'market' or 'limit'")
@@ -77,7 +221,7 @@ class OrderBook(object):
 
     def process_limit_order(self, order, from_data, verbose):
 
-        trades = TransactionList()
+        trades = TransactionList(self.scale)
         smp_cancels = []
         quantity_to_trade = order['quantity']
         side = order['side']
@@ -85,15 +229,18 @@ class OrderBook(object):
 
         if side == Side.B:
 
-            while self.asks and price >= self.asks.min_price() and quantity_to_trade > 0:
+            best_price, best_price_asks = self.asks.best()
+            while best_price_asks is not None and price >= best_price and quantity_to_trade > 0:
 
-                best_price_asks = self.asks.min_price_list()
-                quantity_to_trade, new_trades, smp_cancels = self.process_order_list(
+                quantity_to_trade, new_trades, new_smp_cancels = self.process_order_list(
                     side, best_price_asks, quantity_to_trade, order, verbose)
+                smp_cancels += new_smp_cancels
 
-                if not new_trades.is_empty():
+                if new_trades:
                     trades.add_transactions(new_trades)
 
+                best_price, best_price_asks = self.asks.best()
+
             # Update order quantity
             order['quantity'] = quantity_to_trade
 
@@ -103,15 +250,18 @@ class OrderBook(object):
 
         elif side == Side.S:
 
-            while self.bids and price <= self.bids.max_price() and quantity_to_trade > 0:
+            best_price, best_price_bids = self.bids.best()
+            while best_price_bids is not None and price <= best_price and quantity_to_trade > 0:
 
-                best_price_bids = self.bids.max_price_list()
-                quantity_to_trade, new_trades, smp_cancels = self.process_order_list(
+                quantity_to_trade, new_trades, new_smp_cancels = self.process_order_list(
                     side, best_price_bids, quantity_to_trade, order, verbose)
+                smp_cancels += new_smp_cancels
 
-                if not new_trades.is_empty():
+                if new_trades:
                     trades.add_transactions(new_trades)
 
+                best_price, best_price_bids = self.bids.best()
+
             # Update order quantity
             order['quantity'] = quantity_to_trade
 
@@ -127,13 +277,22 @@ class OrderBook(object):
     def process_order_list(self, side, order_list, quantity_still_to_trade, quote, verbose):
         """
         Takes an OrderList (stack of orders at one price) and an incoming order and matches
-        appropriate trades given the order's quantity.
-
+        appropriate trades given the order's quantity. Returns the quantity left to trade,
+        the list of Fills and the self-match prevention cancels.
         """
         trades = []
         smp_cancels = []
-        trade_list = TransactionList()
         quantity_to_trade = quantity_still_to_trade
+        book_side = self.asks if side == Side.B else self.bids
+        passive_side = get_opposite_side(side)
+        aggressor_id = quote['order_id']
+        order_type = quote['order_type']
+
+        # Self match prevention only compares trader ids while the
+        # aggressor's trader has an order resting at this level
+        aggressor_trader_id = quote.get('trader_id', None)
+        level_price = order_list.get_head_order().price if len(order_list) > 0 else None
+        smp_check = aggressor_trader_id is not None and book_side.has_trader_orders(aggressor_trader_id, level_price)
 
         # Match trades
         while len(order_list) > 0 and quantity_to_trade > 0:
@@ -141,139 +300,196 @@ class OrderBook(object):
             # Passive order that is first in time priority
             head_order = order_list.get_head_order()
 
-            # Self match prevention check
-            aggressor_trader_id = quote.get('trader_id', None)
-            if aggressor_trader_id is None:
-                self_match = False
-            else:
-                self_match = head_order.trader_id == aggressor_trader_id
+            if self.lazy_cancel and head_order.order_list is None:
+                # Tombstone of a lazily canceled order, drop it on the way
+                book_side.release_tombstone(order_list, head_order)
+                continue
 
-            if self_match:
-                # Cancel resting order from this price level and continue
-                # matching against other orders
-                if side == Side.B:
-                    self.asks.remove_order_by_id(head_order.order_id)
-                else:
-                    self.bids.remove_order_by_id(head_order.order_id)
-
-                # TODO: Create function for this
-                cancel = SelfMatchCancel()
-                cancel.order_id = head_order.order_id
-                cancel.side = head_order.side
-                cancel.quantity = head_order.quantity
-                cancel.price = head_order.price
-                cancel.trader_id = head_order.trader_id
-                cancel.timestamp = self.time
-                cancel.instrument = head_order.instrument
-                smp_cancels.append(cancel)
+            if smp_check and head_order.trader_id == aggressor_trader_id:
+                quantity_to_trade = self._prevent_self_match(
+                    book_side, head_order, quantity_to_trade, quote, smp_cancels)
+                smp_check = book_side.has_trader_orders(aggressor_trader_id, level_price)
 
             else:
 
                 traded_price = head_order.price
                 counter_party = head_order.order_id
                 passive_trader_id = head_order.trader_id
-                new_book_quantity = None
+                instrument = head_order.instrument
+                new_book_quantity = 0
 
                 # Head order is NOT fully consumed
                 if quantity_to_trade < head_order.quantity:
                     traded_quantity = quantity_to_trade
                     # Do the transaction
                     new_book_quantity = head_order.quantity - quantity_to_trade
-                    head_order.update_quantity(new_book_quantity, head_order.timestamp)
+                    book_side.update_order_quantity(head_order, new_book_quantity, head_order.timestamp)
                     quantity_to_trade = 0
 
                 # Both orders are fully consumed
                 elif quantity_to_trade == head_order.quantity:
                     traded_quantity = quantity_to_trade
-                    if side == Side.B:
-                        self.asks.remove_order_by_id(head_order.order_id)
-                    else:
-                        self.bids.remove_order_by_id(head_order.order_id)
+                    book_side.remove_order_by_id(head_order.order_id)
                     quantity_to_trade = 0
 
                 # quantity to trade is larger than the head order
                 else:
                     traded_quantity = head_order.quantity
-                    if side == Side.B:
-                        self.asks.remove_order_by_id(head_order.order_id)
-                    else:
-                        self.bids.remove_order_by_id(head_order.order_id)
+                    book_side.remove_order_by_id(head_order.order_id)
                     quantity_to_trade -= traded_quantity
 
-                # TODO: Create function for this
-                """
-                Aggressing party:
-                
-                The side of the transaction is being determined by the original side
-                of the aggressing party.
-                """
-                aggressor = AggressingParty()
-                aggressor.id = quote['order_id']
-                aggressor.side = side
-                aggressor.order_type = quote['order_type']
-                aggressor.trader_id = aggressor_trader_id
-
-                # TODO: Create function for this
-                """
-                Passive party:
-                """
-                passive = PassiveParty()
-                passive.id = counter_party
-                passive.order_id = head_order.order_id
-                passive.quantity_remaining = new_book_quantity
-                passive.side = get_opposite_side(side)
-                passive.trader_id = passive_trader_id
-
-                # TODO: Create function for this
-                transaction = Transaction()
-                transaction.aggressor = aggressor
-                transaction.passive = passive
-                transaction.timestamp = self.time
-                transaction.traded_price = traded_price
-                transaction.traded_quantity = traded_quantity
-                transaction.instrument = head_order.instrument
-
-                trades.append(transaction)
-
-        trade_list.add_transactions(trades)
-
-        return quantity_to_trade, trade_list, smp_cancels
+                # The side of the transaction is the side of the aggressing party
+                fill = Fill(self.time, traded_price, traded_quantity, instrument, aggressor_id, side,
+                            order_type, aggressor_trader_id, counter_party, passive_side,
+                            passive_trader_id, new_book_quantity)
+                if self.strict:
+                    fill.validate()
+                trades.append(fill)
+
+        return quantity_to_trade, trades, smp_cancels
+
+    def _prevent_self_match(self, book_side, resting_order, quantity_to_trade, quote, smp_cancels):
+        """
+        Resolves a would-be trade between two orders of the same trader
+        according to smp_mode and returns the quantity the aggressor has
+        left to trade.
+
+        cancel-resting cancels the resting order and the aggressor goes on
+        matching. cancel-aggressor cancels what is left of the aggressor.
+        cancel-both does both. decrement-and-cancel takes the smaller of
+        the two quantities off both orders, canceling the ones that reach 0.
+        """
+        mode = self.smp_mode
+        resting_quantity = resting_order.quantity
+
+        if mode == 'decrement-and-cancel':
+            decrement = min(resting_quantity, quantity_to_trade)
+        elif mode == 'cancel-aggressor':
+            decrement = 0
+        else:
+            decrement = resting_quantity
+
+        if decrement > 0:
+            cancel = SelfMatchCancel(resting_order.order_id, resting_order.side, decrement, resting_order.price,
+                                     self.time, resting_order.trader_id, resting_order.instrument,
+                                     resting_quantity - decrement)
+            if decrement < resting_quantity:
+                book_side.update_order_quantity(resting_order, resting_quantity - decrement, resting_order.timestamp)
+            else:
+                book_side.remove_order_by_id(resting_order.order_id)
+            smp_cancels.append(cancel)
+
+        if mode == 'cancel-resting':
+            return quantity_to_trade
+
+        if mode == 'decrement-and-cancel':
+            canceled = min(resting_quantity, quantity_to_trade)
+        else:
+            canceled = quantity_to_trade
+        price = quote.get('price')
+        smp_cancels.append(SelfMatchCancel(quote['order_id'], quote['side'], canceled,
+                                           resting_order.price if price is None else price,
+                                           self.time, quote.get('trader_id'), quote['instrument'],
+                                           quantity_to_trade - canceled, True))
+        return quantity_to_trade - canceled
 
     def process_market_order(self, quote, verbose):
 
-        trades = TransactionList()
+        trades = TransactionList(self.scale)
+        smp_cancels = []
         quantity_to_trade = quote['quantity']
         side = quote['side']
 
         # Match trades using price time priority rule
         if side == Side.B:
+            if quote.get('trader_id', None) is None:
+                quantity_to_trade = self._sweep_levels(self.asks, False, quantity_to_trade, quote, trades)
             while quantity_to_trade > 0 and self.asks:
-                best_price_asks = self.asks.min_price_list()
-                quantity_to_trade, new_trades, smp_cancels = self.process_order_list(
+                best_price_asks = self.asks.best()[1]
+                quantity_to_trade, new_trades, new_smp_cancels = self.process_order_list(
                     Side.B, best_price_asks, quantity_to_trade, quote, verbose)
-                if new_trades is not None:
+                smp_cancels += new_smp_cancels
+                if new_trades:
                     trades.add_transactions(new_trades)
 
         elif side == Side.S:
+            if quote.get('trader_id', None) is None:
+                quantity_to_trade = self._sweep_levels(self.bids, True, quantity_to_trade, quote, trades)
             while quantity_to_trade > 0 and self.bids:
-                best_price_bids = self.bids.max_price_list()
-                quantity_to_trade, new_trades, smp_cancels = self.process_order_list(
+                best_price_bids = self.bids.best()[1]
+                quantity_to_trade, new_trades, new_smp_cancels = self.process_order_list(
                     Side.S, best_price_bids, quantity_to_trade, quote, verbose)
-                if new_trades is not None:
+                smp_cancels += new_smp_cancels
+                if new_trades:
                     trades.add_transactions(new_trades)
         else:
             sys.exit('process_market_order() recieved neither "bid" nor "ask"')
 
         return trades, smp_cancels
 
+    def _sweep_levels(self, tree, from_highest, quantity_to_trade, quote, trades):
+        """
+        Fast path for market orders that take out whole price levels.
+
+        The levels the quantity consumes completely are found from the
+        cumulative level volume and removed from the tree in bulk. Each of
+        them is recorded as a single LevelFill, the partially filled last
+        level is left to the regular order by order matching.
+
+        Only used for orders without trader id, for which self-match
+        prevention never applies.
+        """
+        n_levels, swept_quantity = tree.count_consumed_levels(quantity_to_trade, from_highest)
+        if n_levels == 0:
+            return quantity_to_trade
+
+        aggressor_id = quote['order_id']
+        aggressor_side = quote['side']
+        order_type = quote['order_type']
+        passive_side = get_opposite_side(aggressor_side)
+        instrument = quote['instrument']
+        fills = []
+        for price, volume, orders in tree.remove_best_levels(n_levels, from_highest):
+            fill = LevelFill(aggressor_id, aggressor_side, order_type, passive_side,
+                             self.time, price, volume, instrument, orders)
+            if self.strict:
+                fill.validate()
+            fills.append(fill)
+        trades.add_transactions(fills)
+
+        return quantity_to_trade - swept_quantity
+
     def get_order(self, order_id):
 
-        if self.bids.order_exists(order_id):
-            return self.bids.get_order(order_id)
-        elif self.asks.order_exists(order_id):
-            return self.asks.get_order(order_id)
-        else:
+        entry = self.order_index.get(order_id)
+        if entry is None:
             return None
+        side, order = entry
+        tree = self.bids if side == Side.B else self.asks
+        return tree.as_order(order)
+
+    def cancel(self, order_id):
+        """
+        Cancels a resting order by id alone.
+
+        :param order_id: id of the order to cancel
+        :return: the canceled order, or None if no such order rests in the book
+        """
+        self.update_time()
+        entry = self.order_index.get(order_id)
+        if entry is None:
+            return None
+        side, order = entry
+        tree = self.bids if side == Side.B else self.asks
+        return tree.cancel_order(order)
+
+    def compact(self):
+        """
+        Releases the tombstones left by lazy cancels on both sides, e.g. from
+        a periodic task. Without lazy cancels there is nothing to do.
+        """
+        self.bids.compact()
+        self.asks.compact()
 
     def cancel_order(self, side, order_id, time=None):
         if time:
@@ -282,10 +498,10 @@ class OrderBook(object):
             self.update_time()
         if side == Side.B:
             if self.bids.order_exists(order_id):
-                self.bids.remove_order_by_id(order_id)
+                self.bids.cancel_order(self.bids.order_map[order_id])
         elif side == Side.S:
             if self.asks.order_exists(order_id):
-                self.asks.remove_order_by_id(order_id)
+                self.asks.cancel_order(self.asks.order_map[order_id])
         else:
             raise ValueError('Side has to be "bid" nor "ask"')
 
@@ -309,9 +525,108 @@ class OrderBook(object):
         else:
             sys.exit('modify_order() given neither "bid" nor "ask"')
 
-    def get_volume_at_price(self, side, price):
+    def get_order_ids_at_price(self, side, price):
+        """
+        Returns the ids of the orders resting at price in time priority,
+        an empty list if there is no such level.
+        """
+        tree = self.bids if side == Side.B else self.asks
+        if not tree.price_exists(price):
+            return []
+        return [order.order_id for order in tree.get_price_list(price)]
 
-        price = Decimal(price)
+    def snapshot_orders(self):
+        """
+        Returns every resting order, asks and then bids, both from the
+        highest price down and in time priority within a level.
+        """
+        orders = []
+        for tree in (self.asks, self.bids):
+            for price, order_list in tree.price_levels(reverse=True):
+                orders.extend(order_list)
+        return orders
+
+    def export_state(self):
+        """
+        Returns the state a checkpoint needs to rebuild the book as
+        (next_order_id, time, bids, asks). bids and asks hold (price,
+        orders) pairs, best price first, where orders lists (order_id,
+        quantity, timestamp, trader_id) tuples in time priority.
+        """
+        sides = []
+        for tree, reverse in ((self.bids, True), (self.asks, False)):
+            sides.append([(price, [(order.order_id, order.quantity, order.timestamp, order.trader_id)
+                                   for order in order_list])
+                          for price, order_list in tree.price_levels(reverse)
+                          if len(order_list) > 0]) # levels of tombstones only are left out
+        return self.next_order_id, self.time, sides[0], sides[1]
+
+    def import_state(self, next_order_id, time, bids, asks, instrument):
+        """
+        Loads the state returned by export_state into an empty book. The
+        levels are bulk loaded as they are, without matching.
+        """
+        self.import_columns(next_order_id, time, columns_from_levels(bids), columns_from_levels(asks), instrument)
+
+    def import_columns(self, next_order_id, time, bids, asks, instrument):
+        """
+        Same as import_state with bids and asks given as OrderColumns, e.g.
+        straight from the order records of a checkpoint.
+        """
+        self._load_levels(bids, asks, instrument)
+        self.next_order_id = next_order_id
+        self.time = time
+
+    def bulk_load(self, bids, asks, instrument):
+        """
+        Adds resting orders to an empty book without matching, e.g. to
+        build the initial book.
+
+        bids and asks are sequences of (price, orders) pairs, best price
+        first, where orders lists (quantity, trader_id) tuples in time
+        priority. The two sides must not cross. The orders are stamped with
+        the current time and get order ids in the order asks first and
+        then bids, best level first.
+
+        :return: number of loaded orders
+        """
+        self.update_time()
+        order_id = self.next_order_id
+        loaded = {}
+        for side, levels in ((Side.S, asks), (Side.B, bids)):
+            levels = list(levels)
+            quantities, owners = list(zip(*chain.from_iterable(orders for _, orders in levels))) or [(), ()]
+            loaded[side] = make_columns([price for price, _ in levels], [len(orders) for _, orders in levels],
+                                        np.arange(order_id, order_id + len(quantities)), quantities,
+                                        np.full(len(quantities), self.time), owners)
+            order_id += len(quantities)
+        self._load_levels(loaded[Side.B], loaded[Side.S], instrument)
+        count = order_id - self.next_order_id
+        self.next_order_id = order_id
+        return count
+
+    def _load_levels(self, bids, asks, instrument):
+        # Both sides are checked before either is changed
+        if self.order_index:
+            raise ValueError("Orders can only be bulk loaded into an empty book.")
+        self.bids.check_levels(bids)
+        self.asks.check_levels(asks)
+        if len(bids.prices) and len(asks.prices) and bids.prices[0] >= asks.prices[0]:
+            raise ValueError(f"Bulk loaded levels cross, best bid {bids.prices[0]} and best ask {asks.prices[0]}.")
+        if len(np.intersect1d(bids.order_ids, asks.order_ids, assume_unique=True)):
+            raise ValueError("Order ids of a bulk load have to be unique.")
+        # Every new order stays reachable, collections during the load
+        # would only walk the growing book over and over
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            self.asks.bulk_load(asks, instrument, checked=True)
+            self.bids.bulk_load(bids, instrument, checked=True)
+        finally:
+            if collecting:
+                gc.enable()
+
+    def get_volume_at_price(self, side, price):
 
         if side == Side.B:
             volume = 0
@@ -326,14 +641,30 @@ class OrderBook(object):
         else:
             sys.exit('get_volume_at_price() given neither "bid" nor "ask"')
 
+    def get_depth(self, as_arrays=False):
+        """
+        Returns the aggregated top levels of the book as a (bids, asks) pair,
+        best level first.
+
+        By default each side is a list of (price, volume, order count) tuples.
+        With as_arrays set each side is a (prices, volumes, counts) tuple of
+        NumPy int64 arrays.
+        """
+        if as_arrays:
+            return self.bids.depth_view.get_arrays(), self.asks.depth_view.get_arrays()
+        return self.bids.depth_view.get(), self.asks.depth_view.get()
+
+    def get_pool_stats(self):
+        return self.order_pool.stats()
+
     def get_best_bid(self):
-        return self.bids.max_price()
+        return self.bids.best()[0]
 
     def get_worst_bid(self):
         return self.bids.min_price()
 
     def get_best_ask(self):
-        return self.asks.min_price()
+        return self.asks.best()[0]
 
     def get_worst_ask(self):
         return self.asks.max_price()
@@ -344,14 +675,16 @@ class OrderBook(object):
 
         tempfile.write("--- [Asks] ---\n")
         if self.asks != None and len(self.asks) > 0:
-            for price, order_list in reversed(self.asks.price_map.items()):
-                tempfile.write(f'{price} - {order_list.volume}\n')
+            for price, order_list in self.asks.price_levels(reverse=True):
+                if len(order_list) > 0:
+                    tempfile.write(f'{price} - {order_list.volume}\n')
 
         tempfile.write("\n")
         tempfile.write("--- [Bids] ---\n")
         if self.bids != None and len(self.bids) > 0:
-            for price, order_list in reversed(self.bids.price_map.items()):
-                tempfile.write(f'{price} - {order_list.volume}\n')
+            for price, order_list in self.bids.price_levels(reverse=True):
+                if len(order_list) > 0:
+                    tempfile.write(f'{price} - {order_list.volume}\n')
 
         tempfile.write("\n")
         print(tempfile.getvalue())
@@ -360,11 +693,11 @@ class OrderBook(object):
         tempfile = StringIO()
         tempfile.write("***Bids***\n")
         if self.bids != None and len(self.bids) > 0:
-            for key, value in reversed(self.bids.price_map.items()):
+            for key, value in self.bids.price_levels(reverse=True):
                 tempfile.write('%s' % value)
         tempfile.write("\n***Asks***\n")
         if self.asks != None and len(self.asks) > 0:
-            for key, value in self.asks.price_map.items():
+            for key, value in self.asks.price_levels():
                 tempfile.write('%s' % value)
 
         if self.tape != None and len(self.tape) > 0:
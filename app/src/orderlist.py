@@ -6,6 +6,10 @@ class OrderList(object):
     Order, we may need multiple Orders to fullfill a transaction. The
     OrderList makes this easy to do. OrderList is naturally arranged by time.
     Orders at the front of the list have priority.
+
+    With lazy cancels an OrderList can also hold tombstones: canceled Orders
+    (order_list set to None) that stay linked until the level is compacted.
+    length and volume only count live Orders and iteration skips tombstones.
     '''
 
     def __init__(self):
@@ -13,6 +17,7 @@ class OrderList(object):
         self.tail_order = None # last order in the list
         self.length = 0 # number of Orders in the list
         self.volume = 0 # sum of Order quantity in the list AKA share volume
+        self.tombstones = 0 # number of canceled Orders still linked in the list
         self.last = None # helper for iterating
 
     def __len__(self):
@@ -28,6 +33,8 @@ class OrderList(object):
         Set self.last as the next order. If there is no next order, stop
         iterating through list.
         '''
+        while self.last != None and self.last.order_list is None:
+            self.last = self.last.next_order # skip tombstones
         if self.last == None:
             raise StopIteration
         else:
@@ -41,7 +48,7 @@ class OrderList(object):
         return self.head_order
 
     def append_order(self, order):
-        if len(self) == 0:
+        if self.tail_order is None:
             order.next_order = None
             order.prev_order = None
             self.head_order = order
@@ -57,24 +64,30 @@ class OrderList(object):
     def remove_order(self, order):
         self.volume -= order.quantity
         self.length -= 1
-        if len(self) == 0: # if there are no more Orders, stop/return
-            return
+        self.unlink_order(order)
 
+    def unlink_order(self, order):
+        '''Takes an Order out of the links without touching the counters.'''
         # Remove an Order from the OrderList. First grab next / prev order
-        # from the Order we are removing. Then relink everything. Finally
-        # remove the Order.
+        # from the Order we are removing. Then relink everything.
         next_order = order.next_order
         prev_order = order.prev_order
-        if next_order != None and prev_order != None:
-            next_order.prev_order = prev_order
+        if prev_order != None:
             prev_order.next_order = next_order
-        elif next_order != None: # There is no previous order
-            next_order.prev_order = None
+        else: # There is no previous order
             self.head_order = next_order # The next order becomes the first order in the OrderList after this Order is removed
-        elif prev_order != None: # There is no next order
-            prev_order.next_order = None
+        if next_order != None:
+            next_order.prev_order = prev_order
+        else: # There is no next order
             self.tail_order = prev_order # The previous order becomes the last order in the OrderList after this Order is removed
 
+    def tombstone_order(self, order):
+        '''Cancels an Order in O(1) by marking it, the links are fixed up on compaction.'''
+        self.volume -= order.quantity
+        self.length -= 1
+        self.tombstones += 1
+        order.order_list = None
+
     def move_to_tail(self, order):
         '''After updating the quantity of an existing Order, move it to the tail of the OrderList
 
@@ -0,0 +1,627 @@
+import numpy as np
+
+from .ordertree import OrderTree
+from .side import Side
+
+_NO_SLOT = -1
+_SIDES = (None, Side.B, Side.S)
+_EMPTY = np.iinfo(np.int64).min # key of an empty SlotIndex position
+_HASH = 0x9E3779B97F4A7C15 # 2**64 / golden ratio, spreads sequential order ids
+_MASK64 = (1 << 64) - 1
+
+
+class OrderStore(object):
+    '''Struct-of-arrays storage for the resting orders of one OrderBook
+
+    Every order occupies a slot, and the order fields live in preallocated
+    NumPy arrays indexed by that slot. Free slots are kept on a stack. The
+    arrays double in size when the stack runs empty. Trader ids are stored
+    as indices into a small table so the arrays stay numeric. The
+    instrument is the same for every order of a book and is stored once.
+
+    The store is shared by the bid and ask ArrayOrderTree of a book, the same
+    way an OrderPool is shared by two OrderTrees.
+    '''
+
+    def __init__(self, capacity=1024):
+        if capacity <= 0:
+            raise ValueError(f'Store capacity has to be positive, was {capacity}.')
+        self._capacity = 0
+        self.order_id = np.empty(0, dtype=np.int64)
+        self.price = np.empty(0, dtype=np.int64)
+        self.quantity = np.empty(0, dtype=np.int64)
+        self.timestamp = np.empty(0, dtype=np.int64)
+        self.side = np.empty(0, dtype=np.int8)
+        self.trader = np.empty(0, dtype=np.int32)
+        self.next = np.empty(0, dtype=np.int32)
+        self.prev = np.empty(0, dtype=np.int32)
+        self._free = np.empty(0, dtype=np.int32)
+        self._top = 0 # Number of slots on the free stack
+
+        self._traders = [None] # trader index -> trader id, index 0 is a simulated order
+        self._trader_index = {None: 0}
+        self.instrument = None
+
+        self.grows = 0
+        self._resize(capacity)
+
+    def __len__(self):
+        return self._capacity - self._top
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def _resize(self, capacity):
+        old = self._capacity
+        for name in ('order_id', 'price', 'quantity', 'timestamp', 'side', 'trader', 'next', 'prev'):
+            array = getattr(self, name)
+            resized = np.empty(capacity, dtype=array.dtype)
+            resized[:old] = array
+            setattr(self, name, resized)
+
+        # New slots are pushed so that the lowest slot is popped first
+        free = np.empty(capacity, dtype=np.int32)
+        free[:self._top] = self._free[:self._top]
+        free[self._top:self._top + capacity - old] = np.arange(capacity - 1, old - 1, -1, dtype=np.int32)
+        self._free = free
+        self._top += capacity - old
+        self._capacity = capacity
+
+    def trader_index(self, trader_id):
+        index = self._trader_index.get(trader_id)
+        if index is None:
+            index = len(self._traders)
+            self._traders.append(trader_id)
+            self._trader_index[trader_id] = index
+        return index
+
+    def trader_id(self, slot):
+        return self._traders[self.trader.item(slot)]
+
+    def allocate(self, quote):
+        if self._top == 0:
+            self.grows += 1
+            self._resize(2 * self._capacity)
+        self._top -= 1
+        slot = self._free.item(self._top)
+
+        self.order_id[slot] = quote['order_id']
+        self.price[slot] = quote['price']
+        self.quantity[slot] = quote['quantity']
+        self.timestamp[slot] = quote['timestamp']
+        self.side[slot] = quote['side'].value
+        self.trader[slot] = self.trader_index(quote.get('trader_id', None))
+        self.next[slot] = _NO_SLOT
+        self.prev[slot] = _NO_SLOT
+        if self.instrument is None:
+            self.instrument = quote['instrument']
+        return slot
+
+    def allocate_many(self, count):
+        '''Takes count slots off the free stack in the order allocate would, the caller fills them.'''
+        while self._top < count:
+            self.grows += 1
+            self._resize(2 * self._capacity)
+        self._top -= count
+        return self._free[self._top:self._top + count][::-1].copy()
+
+    def release(self, slot):
+        # Fields are left intact, views of a removed order stay readable
+        # until the slot is handed out again.
+        self._free[self._top] = slot
+        self._top += 1
+
+    def release_many(self, slots):
+        self._free[self._top:self._top + len(slots)] = slots
+        self._top += len(slots)
+
+    def stats(self):
+        return {'capacity': self._capacity,
+                'free': self._top,
+                'grows': self.grows}
+
+    def nbytes(self):
+        arrays = (self.order_id, self.price, self.quantity, self.timestamp,
+                  self.side, self.trader, self.next, self.prev, self._free)
+        return sum(array.nbytes for array in arrays)
+
+
+class SlotIndex(object):
+    '''order_id : slot map of an OrderStore in open addressing form
+
+    Keys and slots live in two NumPy arrays of a power of two length that
+    is kept at most half full. An order id is hashed by Fibonacci hashing,
+    so the sequential ids of a book spread over the table, and collisions
+    are resolved by linear probing. Removal shifts the following entries
+    of the probe run back instead of leaving tombstones. A position costs
+    12 bytes against well over 100 for the dict entries and tuples of the
+    object backends.
+
+    One index serves both sides of a book. Like the dict index of an
+    OrderTree, get returns (side, slot) pairs, the side is read from the
+    store. Order ids have to be integers above the int64 minimum.
+    '''
+
+    def __init__(self, store, capacity=1024):
+        if capacity <= 0:
+            raise ValueError(f'Index capacity has to be positive, was {capacity}.')
+        self._store = store
+        self._count = 0
+        self._allocate(1 << max(capacity - 1, 1).bit_length())
+
+    def _allocate(self, capacity):
+        self._keys = np.full(capacity, _EMPTY, dtype=np.int64)
+        self._slots = np.empty(capacity, dtype=np.int32)
+        self._mask = capacity - 1
+        self._shift = 64 - (capacity.bit_length() - 1)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return iter(self.entries()[0].tolist())
+
+    def entries(self):
+        '''Returns the order ids and their slots as two arrays, in no particular order.'''
+        live = self._keys != _EMPTY
+        return self._keys[live], self._slots[live]
+
+    def __contains__(self, order_id):
+        return self._find(order_id) >= 0
+
+    @property
+    def capacity(self):
+        return len(self._keys)
+
+    def _find(self, order_id):
+        '''Returns the position of order_id, -1 if it is not in the index.'''
+        keys = self._keys
+        mask = self._mask
+        position = ((order_id * _HASH) & _MASK64) >> self._shift
+        while True:
+            key = keys.item(position)
+            if key == order_id:
+                return position
+            if key == _EMPTY:
+                return -1
+            position = (position + 1) & mask
+
+    def slot(self, order_id):
+        '''Returns the slot of order_id, _NO_SLOT if it is not in the index.'''
+        position = self._find(order_id)
+        return _NO_SLOT if position < 0 else self._slots.item(position)
+
+    def get(self, order_id, default=None):
+        slot = self.slot(order_id)
+        if slot == _NO_SLOT:
+            return default
+        return _SIDES[self._store.side.item(slot)], slot
+
+    def put(self, order_id, slot):
+        '''Maps order_id, which must not be in the index, to slot.'''
+        if 2 * (self._count + 1) > len(self._keys):
+            self._grow(self._count + 1)
+        keys = self._keys
+        mask = self._mask
+        position = ((order_id * _HASH) & _MASK64) >> self._shift
+        while keys.item(position) != _EMPTY:
+            position = (position + 1) & mask
+        keys[position] = order_id
+        self._slots[position] = slot
+        self._count += 1
+
+    def put_many(self, order_ids, slots):
+        '''Maps order ids, none of them in the index yet, to slots
+
+        Ids whose home position is free and not wanted by another id of the
+        call are written with array operations, the rest are probed one by
+        one.
+        '''
+        order_ids = np.asarray(order_ids, dtype=np.int64)
+        slots = np.asarray(slots, dtype=np.int32)
+        if 2 * (self._count + len(order_ids)) > len(self._keys):
+            self._grow(self._count + len(order_ids))
+        positions = ((order_ids.view(np.uint64) * np.uint64(_HASH)) >> np.uint64(self._shift)).astype(np.int64)
+        direct = np.zeros(len(order_ids), dtype=bool)
+        direct[np.unique(positions, return_index=True)[1]] = True
+        direct &= self._keys[positions] == _EMPTY
+        self._keys[positions[direct]] = order_ids[direct]
+        self._slots[positions[direct]] = slots[direct]
+        self._count += int(direct.sum())
+        for order_id, slot in zip(order_ids[~direct].tolist(), slots[~direct].tolist()):
+            self.put(order_id, slot)
+
+    def _grow(self, count):
+        capacity = len(self._keys)
+        while 2 * count > capacity:
+            capacity *= 2
+        order_ids, slots = self.entries()
+        self._allocate(capacity)
+        self._count = 0
+        self.put_many(order_ids, slots)
+
+    def remove(self, order_id):
+        '''Removes order_id and returns its slot, raises KeyError if it is not in the index.'''
+        position = self._find(order_id)
+        if position < 0:
+            raise KeyError(order_id)
+        keys = self._keys
+        slots = self._slots
+        mask = self._mask
+        shift = self._shift
+        slot = slots.item(position)
+        # Entries after the hole that may live in it move back
+        hole = position
+        while True:
+            position = (position + 1) & mask
+            key = keys.item(position)
+            if key == _EMPTY:
+                break
+            home = ((key * _HASH) & _MASK64) >> shift
+            if (position - home) & mask >= (position - hole) & mask:
+                keys[hole] = key
+                slots[hole] = slots.item(position)
+                hole = position
+        keys[hole] = _EMPTY
+        self._count -= 1
+        return slot
+
+    def nbytes(self):
+        return self._keys.nbytes + self._slots.nbytes
+
+
+class SideSlots(object):
+    '''The order_map of one ArrayOrderTree, the entries of a SlotIndex on its side'''
+    __slots__ = ('_index', '_store', '_side')
+
+    def __init__(self, index, store, side):
+        self._index = index
+        self._store = store
+        self._side = None if side is None else side.value
+
+    def slot(self, order_id):
+        '''Returns the slot of order_id, _NO_SLOT if it is not on this side.'''
+        slot = self._index.slot(order_id)
+        if slot != _NO_SLOT and self._side is not None and self._store.side.item(slot) != self._side:
+            return _NO_SLOT
+        return slot
+
+    def _entries(self):
+        order_ids, slots = self._index.entries()
+        if self._side is not None:
+            order_ids = order_ids[self._store.side[slots] == self._side]
+        return order_ids
+
+    def __iter__(self):
+        return iter(self._entries().tolist())
+
+    def __len__(self):
+        return len(self._entries())
+
+    def __contains__(self, order_id):
+        return self.slot(order_id) != _NO_SLOT
+
+    def __getitem__(self, order_id):
+        slot = self.slot(order_id)
+        if slot == _NO_SLOT:
+            raise KeyError(order_id)
+        return slot
+
+
+class OrderView(object):
+    '''Read access to one slot of an OrderStore with the attributes of an Order'''
+    __slots__ = ('_tree', '_slot')
+
+    def __init__(self, tree, slot):
+        self._tree = tree
+        self._slot = slot
+
+    @property
+    def slot(self):
+        return self._slot
+
+    @property
+    def order_id(self):
+        return self._tree.store.order_id.item(self._slot)
+
+    @property
+    def price(self):
+        return self._tree.store.price.item(self._slot)
+
+    @property
+    def quantity(self):
+        return self._tree.store.quantity.item(self._slot)
+
+    @property
+    def timestamp(self):
+        return self._tree.store.timestamp.item(self._slot)
+
+    @property
+    def side(self):
+        return _SIDES[self._tree.store.side.item(self._slot)]
+
+    @property
+    def trader_id(self):
+        return self._tree.store.trader_id(self._slot)
+
+    @property
+    def instrument(self):
+        return self._tree.store.instrument
+
+    @property
+    def next_order(self):
+        slot = self._tree.store.next.item(self._slot)
+        return None if slot == _NO_SLOT else OrderView(self._tree, slot)
+
+    @property
+    def prev_order(self):
+        slot = self._tree.store.prev.item(self._slot)
+        return None if slot == _NO_SLOT else OrderView(self._tree, slot)
+
+    @property
+    def order_list(self):
+        return self._tree.get_price_list(self.price)
+
+    def update_quantity(self, new_quantity, new_timestamp):
+        self._tree.update_slot_quantity(self._slot, new_quantity, new_timestamp)
+
+    def __eq__(self, other):
+        return isinstance(other, OrderView) and other._slot == self._slot and other._tree is self._tree
+
+    def __hash__(self):
+        return hash(self._slot)
+
+    def __str__(self):
+        return "{}@{}/{} - {}".format(self.quantity, self.price,
+                                      self.order_id, self.timestamp)
+
+
+class SlotOrderList(object):
+    '''
+    The FIFO of one price level as a head/tail pair of OrderStore slots.
+    The links between orders live in the next/prev arrays of the store.
+    '''
+    __slots__ = ('_tree', 'head', 'tail', 'length', 'volume')
+
+    def __init__(self, tree):
+        self._tree = tree
+        self.head = _NO_SLOT # first slot in the list
+        self.tail = _NO_SLOT # last slot in the list
+        self.length = 0 # number of orders in the list
+        self.volume = 0 # sum of order quantity in the list
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        tree = self._tree
+        next_slots = tree.store.next
+        slot = self.head
+        while slot != _NO_SLOT:
+            yield OrderView(tree, slot)
+            slot = next_slots.item(slot)
+
+    def slots(self):
+        next_slots = self._tree.store.next
+        slot = self.head
+        while slot != _NO_SLOT:
+            yield slot
+            slot = next_slots.item(slot)
+
+    def get_head_order(self):
+        if self.head == _NO_SLOT:
+            return None
+        return OrderView(self._tree, self.head)
+
+    @property
+    def head_order(self):
+        return self.get_head_order()
+
+    @property
+    def tail_order(self):
+        if self.tail == _NO_SLOT:
+            return None
+        return OrderView(self._tree, self.tail)
+
+    def append_slot(self, slot):
+        store = self._tree.store
+        store.next[slot] = _NO_SLOT
+        if self.length == 0:
+            store.prev[slot] = _NO_SLOT
+            self.head = slot
+        else:
+            store.prev[slot] = self.tail
+            store.next[self.tail] = slot
+        self.tail = slot
+        self.length += 1
+        self.volume += store.quantity.item(slot)
+
+    def remove_slot(self, slot):
+        store = self._tree.store
+        self.volume -= store.quantity.item(slot)
+        self.length -= 1
+
+        next_slot = store.next.item(slot)
+        prev_slot = store.prev.item(slot)
+        if prev_slot != _NO_SLOT:
+            store.next[prev_slot] = next_slot
+        else:
+            self.head = next_slot
+        if next_slot != _NO_SLOT:
+            store.prev[next_slot] = prev_slot
+        else:
+            self.tail = prev_slot
+
+    def move_to_tail(self, slot):
+        if slot == self.tail:
+            return
+        self.remove_slot(slot)
+        self.append_slot(slot)
+
+    def __str__(self):
+        return ''.join("%s\n" % str(order) for order in self)
+
+
+class ArrayOrderTree(OrderTree):
+    '''An OrderTree whose orders live in an OrderStore instead of Order objects
+
+    Price levels are still kept in a SortedDict, but each level is a
+    SlotOrderList. The book index is a SlotIndex shared by both sides and
+    order_map is the part of it on this side, both map order_id to a store
+    slot. get_order and the price level iterators hand out OrderView
+    objects, so the OrderBook matching code runs unchanged on top of it.
+
+    The backend trades speed for memory. Every field access is a NumPy
+    scalar read or write, a few times the cost of an Order attribute, so
+    it matches slower than the object backends while a resting order
+    costs about a fifth of the memory (benchmarks.order_store_memory).
+    '''
+
+    def __init__(self, pool=None, side=None, index=None):
+        store = pool if pool is not None else OrderStore()
+        OrderTree.__init__(self, store, side, index if index is not None else SlotIndex(store))
+        self.store = store
+        self.order_map = SideSlots(self.index, store, side)
+
+    def __len__(self):
+        return self.num_orders
+
+    @staticmethod
+    def create_pool(size):
+        return OrderStore(size if size > 0 else 1024)
+
+    @staticmethod
+    def create_index(pool):
+        # Sized to stay under half full with a full store
+        return SlotIndex(pool, 2 * pool.capacity)
+
+    def _new_order_list(self):
+        return SlotOrderList(self)
+
+    def get_order(self, order_id):
+        return OrderView(self, self.order_map[order_id])
+
+    def insert_order(self, quote):
+        slot = self.order_map.slot(quote['order_id'])
+        if slot != _NO_SLOT:
+            self.remove_order(slot)
+        self.num_orders += 1
+        price = quote['price']
+        order_list = self.price_map.get(price)
+        if order_list is None:
+            order_list = self.create_price(price)
+        slot = self.store.allocate(quote)
+        order_list.append_slot(slot)
+        self.index.put(quote['order_id'], slot)
+        self._track_trader(quote.get('trader_id', None), price)
+        self.volume += quote['quantity']
+        self._level_changed(price, order_list)
+
+    def _build_levels(self, columns, instrument):
+        '''Writes all orders of the load into the store at once and links each level with array operations.'''
+        n_orders = len(columns.order_ids)
+        if n_orders == 0:
+            return []
+        store = self.store
+        slots = store.allocate_many(n_orders)
+        if store.instrument is None:
+            store.instrument = instrument
+
+        store.order_id[slots] = columns.order_ids
+        store.price[slots] = np.repeat(columns.prices, columns.counts)
+        store.quantity[slots] = columns.quantities
+        store.timestamp[slots] = columns.timestamps
+        store.side[slots] = self.side.value
+        traders = np.array([store.trader_index(trader_id) for trader_id in columns.trader_ids], dtype=np.int32)
+        store.trader[slots] = traders[columns.traders]
+
+        # Within a level every slot links to its neighbours, the level ends link to nothing
+        ends = np.cumsum(columns.counts)
+        starts = ends - columns.counts
+        next_slots = np.empty(n_orders, dtype=np.int32)
+        next_slots[:-1] = slots[1:]
+        next_slots[ends - 1] = _NO_SLOT
+        prev_slots = np.empty(n_orders, dtype=np.int32)
+        prev_slots[1:] = slots[:-1]
+        prev_slots[starts] = _NO_SLOT
+        store.next[slots] = next_slots
+        store.prev[slots] = prev_slots
+
+        self.index.put_many(columns.order_ids, slots)
+
+        volumes = np.add.reduceat(columns.quantities, starts).tolist()
+        price_lists = []
+        for price, head, tail, length, volume in zip(columns.prices.tolist(), slots[starts].tolist(),
+                                                     slots[ends - 1].tolist(), columns.counts.tolist(), volumes):
+            order_list = self._new_order_list()
+            order_list.head = head
+            order_list.tail = tail
+            order_list.length = length
+            order_list.volume = volume
+            price_lists.append((price, order_list))
+        self.num_orders += n_orders
+        self.volume += sum(volumes)
+        return price_lists
+
+    def update_order(self, order_update):
+        slot = self.order_map[order_update['order_id']]
+        if order_update['price'] != self.store.price.item(slot):
+            # Price changed. Remove order and update tree.
+            self.remove_order_by_id(order_update['order_id'])
+            self.insert_order(order_update)
+        else:
+            # Quantity changed. Price is the same.
+            self.update_slot_quantity(slot, order_update['quantity'], order_update['timestamp'])
+
+    def update_order_quantity(self, order, new_quantity, new_timestamp):
+        self.update_slot_quantity(order.slot, new_quantity, new_timestamp)
+
+    def update_slot_quantity(self, slot, new_quantity, new_timestamp):
+        store = self.store
+        quantity = store.quantity.item(slot)
+        order_list = self.price_map[store.price.item(slot)]
+        if new_quantity > quantity:
+            # Increasing the quantity loses time priority
+            order_list.move_to_tail(slot)
+        order_list.volume += new_quantity - quantity
+        self.volume += new_quantity - quantity
+        store.quantity[slot] = new_quantity
+        store.timestamp[slot] = new_timestamp
+        self._level_changed(store.price.item(slot), order_list)
+
+    def _drain_level(self, order_list):
+        store = self.store
+        slots = np.fromiter(order_list.slots(), dtype=np.int32, count=len(order_list))
+        order_ids = store.order_id[slots].tolist()
+        traders = store.trader[slots]
+        trader_ids = [None] * len(slots)
+        if traders.any():
+            trader_ids = [store.trader_id(slot) for slot in slots.tolist()]
+            price = store.price.item(slots[0])
+            for trader_id in trader_ids:
+                self._untrack_trader(trader_id, price)
+        remove = self.index.remove
+        for order_id in order_ids:
+            remove(order_id)
+        store.release_many(slots)
+        return list(zip(order_ids, trader_ids, store.quantity[slots].tolist()))
+
+    def as_order(self, slot):
+        return OrderView(self, slot)
+
+    def remove_order(self, slot):
+        self.num_orders -= 1
+        store = self.store
+        self.index.remove(store.order_id.item(slot))
+        price = store.price.item(slot)
+        self._untrack_trader(store.trader_id(slot), price)
+        self.volume -= store.quantity.item(slot)
+        order_list = self.price_map[price]
+        order_list.remove_slot(slot)
+        if len(order_list) == 0:
+            self.remove_price(price)
+        else:
+            self._level_changed(price, order_list)
+        store.release(slot)
+        return OrderView(self, slot)
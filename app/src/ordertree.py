@@ -1,6 +1,63 @@
+from collections import namedtuple
+from itertools import chain, islice, repeat
+import numpy as np
 from sortedcontainers import SortedDict
 from .orderlist import OrderList
-from .order import Order
+from .order import OrderPool
+from .side import Side
+from .depth import DepthView
+
+OrderColumns = namedtuple('OrderColumns', ['prices', 'counts', 'order_ids', 'quantities', 'timestamps', 'traders',
+                                           'trader_ids'])
+OrderColumns.__doc__ = '''Resting orders of one book side in columns, the input of a bulk load.
+prices and counts hold the price and the number of orders of every
+level, best price first. order_ids, quantities, timestamps and traders
+hold one entry per order, level by level and in time priority within a
+level. All of them are int64 NumPy arrays. traders indexes trader_ids,
+a list whose first entry is None for simulated orders.'''
+
+
+def _int_column(values, name):
+    column = np.asarray(values)
+    if len(column) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if column.dtype.kind not in 'iu':
+        raise TypeError(f'{name} have to be integers, got {column.dtype}.')
+    return column.astype(np.int64, copy=False)
+
+
+def make_columns(prices, counts, order_ids, quantities, timestamps, owners):
+    """
+    Builds OrderColumns from sequences of integers and the trader id, or
+    None, of every order. The trader ids are turned into codes.
+    """
+    trader_ids = [None]
+    trader_ids.extend(set(owners).difference([None]))
+    if len(trader_ids) > 1:
+        trader_index = {trader_id: i for i, trader_id in enumerate(trader_ids)}
+        traders = np.fromiter(map(trader_index.__getitem__, owners), np.int64, len(owners))
+    else:
+        traders = np.zeros(len(owners), dtype=np.int64)
+    return OrderColumns(_int_column(prices, 'Prices'),
+                        _int_column(counts, 'Counts'),
+                        _int_column(order_ids, 'Order ids'),
+                        _int_column(quantities, 'Quantities'),
+                        _int_column(timestamps, 'Timestamps'),
+                        traders,
+                        trader_ids)
+
+
+def columns_from_levels(levels):
+    """
+    Turns (price, orders) pairs, where orders lists (order_id, quantity,
+    timestamp, trader_id) tuples, into OrderColumns.
+    """
+    levels = list(levels)
+    order_ids, quantities, timestamps, owners = \
+        list(zip(*chain.from_iterable(orders for _, orders in levels))) or [(), (), (), ()]
+    return make_columns([price for price, _ in levels], [len(orders) for _, orders in levels],
+                        order_ids, quantities, timestamps, owners)
+
 
 class OrderTree(object):
     '''A red-black tree used to store OrderLists in price order
@@ -9,31 +66,121 @@ class OrderTree(object):
     Keeping the information in a red black tree makes it easier/faster to detect a match.
     '''
 
-    def __init__(self):
+    def __init__(self, pool=None, side=None, index=None):
+        self.pool = pool if pool is not None else OrderPool() # Recycles Order objects, shared by both sides of a book
+        self.index = index if index is not None else {} # order_id : (side, Order object), shared by both sides of a book
+        self.side = side # Side.B keeps bids (best is the highest price), Side.S keeps asks
         self.price_map = SortedDict() # Dictionary containing price : OrderList object
         self.prices = self.price_map.keys()
+        # Lowest and highest level, maintained on create_price / remove_price
+        self._min_price = None
+        self._min_list = None
+        self._max_price = None
+        self._max_list = None
         self.order_map = {} # Dictionary containing order_id : Order object
+        self.trader_levels = {} # (trader_id, price) : number of the trader's Orders resting at the price
         self.volume = 0 # Contains total quantity from all Orders in tree
         self.num_orders = 0 # Contains count of Orders in tree
         self.depth = 0 # Number of different prices in tree (http://en.wikipedia.org/wiki/Order_book_(trading)#Book_depth)
+        self.depth_view = None # Optional aggregated top-N levels, kept up to date on every level change
+        self.lazy_cancel = False # Cancels leave tombstones that are pruned later, see enable_lazy_cancel
+        self.compact_threshold = 0
+        self.tombstones = 0 # Number of canceled Orders still linked in the tree
+        self._dirty = set() # Prices of levels that may hold tombstones
 
     def __len__(self):
         return len(self.order_map)
 
+    @staticmethod
+    def create_pool(size):
+        '''Creates the per-book order storage shared by the bid and ask trees.'''
+        return OrderPool(size)
+
+    @staticmethod
+    def create_index(pool):
+        '''Creates the order_id : (side, order_map entry) index shared by the bid and ask trees.'''
+        return {}
+
+    def attach_depth_view(self, levels):
+        self.depth_view = DepthView(self, levels)
+        return self.depth_view
+
+    def enable_lazy_cancel(self, compact_threshold=1024):
+        '''Switches cancel_order to tombstoning
+
+        A canceled Order is only marked and the level counters are fixed up,
+        the Order stays linked in its OrderList. Tombstones are unlinked when
+        the matching loop reaches them, when their level becomes the best or
+        worst level, or by compact(). compact() runs on its own once there are
+        more than compact_threshold tombstones and more tombstones than live
+        Orders, so the work is amortized over the cancels.
+        '''
+        self.lazy_cancel = True
+        self.compact_threshold = compact_threshold
+
+    def _level_changed(self, price, order_list):
+        if self.depth_view is not None:
+            if len(order_list) == 0:
+                # Only tombstones left, the level is waiting for compaction
+                self.depth_view.remove(price)
+            else:
+                self.depth_view.update(price, order_list.volume, len(order_list))
+
+    def _track_trader(self, trader_id, price):
+        if trader_id is not None:
+            key = (trader_id, price)
+            self.trader_levels[key] = self.trader_levels.get(key, 0) + 1
+
+    def _untrack_trader(self, trader_id, price):
+        if trader_id is not None:
+            key = (trader_id, price)
+            count = self.trader_levels[key] - 1
+            if count:
+                self.trader_levels[key] = count
+            else:
+                del self.trader_levels[key]
+
+    def has_trader_orders(self, trader_id, price):
+        '''True if the trader has an order resting at price, used for self-match prevention.'''
+        return (trader_id, price) in self.trader_levels
+
     def get_price_list(self, price):
         return self.price_map[price]
 
     def get_order(self, order_id):
         return self.order_map[order_id]
 
+    def as_order(self, order):
+        '''Turns an order_map / index entry into an Order.'''
+        return order
+
+    def _new_order_list(self):
+        return OrderList()
+
     def create_price(self, price):
         self.depth += 1 # Add a price depth level to the tree
-        new_list = OrderList()
+        new_list = self._new_order_list()
         self.price_map[price] = new_list
+        if self._min_price is None or price < self._min_price:
+            self._min_price = price
+            self._min_list = new_list
+        if self._max_price is None or price > self._max_price:
+            self._max_price = price
+            self._max_list = new_list
+        return new_list
 
     def remove_price(self, price):
         self.depth -= 1 # Remove a price depth level
         del self.price_map[price]
+        if self.depth == 0:
+            self._min_price = self._min_list = None
+            self._max_price = self._max_list = None
+        elif price == self._min_price:
+            self._min_price, self._min_list = self.price_map.peekitem(0)
+        elif price == self._max_price:
+            self._max_price, self._max_list = self.price_map.peekitem(-1)
+        if self.depth_view is not None:
+            self.depth_view.remove(price)
 
     def price_exists(self, price):
         return price in self.price_map
@@ -45,57 +192,315 @@ class OrderTree(object):
         if self.order_exists(quote['order_id']):
             self.remove_order_by_id(quote['order_id'])
         self.num_orders += 1
-        if quote['price'] not in self.price_map:
-            self.create_price(quote['price']) # If price not in Price Map, create a node in RBtree
-        order = Order(quote, self.price_map[quote['price']]) # Create an order
-        self.price_map[order.price].append_order(order) # Add the order to the OrderList in Price Map
+        if self.price_exists(quote['price']):
+            order_list = self.get_price_list(quote['price'])
+        else:
+            order_list = self.create_price(quote['price']) # If price not in Price Map, create a node in RBtree
+        order = self.pool.acquire(quote, order_list) # Create an order
+        order_list.append_order(order) # Add the order to the OrderList in Price Map
         self.order_map[order.order_id] = order
+        self.index[order.order_id] = (self.side, order)
+        self._track_trader(order.trader_id, order.price)
         self.volume += order.quantity
+        self._level_changed(order.price, order_list)
+
+    def check_levels(self, columns):
+        '''Validates the OrderColumns of a bulk_load without changing the tree
+
+        Raises ValueError unless the tree is empty, the prices are strictly
+        sorted best first, every level has orders, every quantity is positive
+        and no order id is used twice or already in the book.
+        '''
+        if self.depth or self.num_orders:
+            raise ValueError("Levels can only be bulk loaded into an empty tree.")
+        prices = columns.prices
+        steps = np.diff(prices)
+        unsorted = np.flatnonzero(steps >= 0 if self.side == Side.B else steps <= 0)
+        if len(unsorted):
+            i = unsorted[0]
+            raise ValueError(f"Levels have to be sorted best price first, {prices[i + 1]} came after {prices[i]}.")
+        empty = np.flatnonzero(columns.counts <= 0)
+        if len(empty):
+            raise ValueError(f"Level {prices[empty[0]]} has no orders.")
+        order_ids = columns.order_ids
+        if int(columns.counts.sum()) != len(order_ids):
+            raise ValueError(f"Levels hold {columns.counts.sum()} orders, the columns {len(order_ids)}.")
+        not_positive = np.flatnonzero(columns.quantities <= 0)
+        if len(not_positive):
+            i = not_positive[0]
+            raise ValueError(f"Quantity of order {order_ids[i]} has to be positive, was {columns.quantities[i]}.")
+        order_ids = np.sort(order_ids)
+        if (order_ids[1:] == order_ids[:-1]).any() or \
+                (len(self.index) and any(map(self.index.__contains__, order_ids.tolist()))):
+            raise ValueError("Order ids of a bulk load have to be unique.")
+
+    def bulk_load(self, columns, instrument, checked=False):
+        '''Fills an empty tree with the resting orders of OrderColumns, without matching
+
+        Each level is linked up as a complete OrderList and the price index
+        is built once from all levels. checked skips check_levels for
+        callers that already ran it.
+        '''
+        if not checked:
+            self.check_levels(columns)
+        price_lists = self._build_levels(columns, instrument)
+        if self.side == Side.B:
+            price_lists.reverse()
+        self._install_levels(price_lists)
+        self._track_levels(columns)
+        if self.depth_view is not None:
+            self.depth_view.invalidate()
+
+    def _build_levels(self, columns, instrument):
+        '''Turns OrderColumns into (price, OrderList) pairs, best price first.'''
+        side = self.side
+        order_ids = columns.order_ids.tolist()
+        orders = self.pool.acquire_many(len(order_ids))
+        fields = zip(orders, order_ids, columns.quantities.tolist(), columns.timestamps.tolist(),
+                     map(columns.trader_ids.__getitem__, columns.traders.tolist()))
+        counts = columns.counts.tolist()
+        volumes = np.add.reduceat(columns.quantities, np.cumsum(counts) - counts).tolist() if counts else []
+        price_lists = []
+        for price, count, volume in zip(columns.prices.tolist(), counts, volumes):
+            order_list = self._new_order_list()
+            previous = None
+            for order, order_id, quantity, timestamp, trader_id in islice(fields, count):
+                order.order_id = order_id
+                order.side = side
+                order.price = price
+                order.quantity = quantity
+                order.timestamp = timestamp
+                order.trader_id = trader_id
+                order.instrument = instrument
+                order.order_list = order_list
+                order.prev_order = previous
+                order.next_order = None
+                if previous is None:
+                    order_list.head_order = order
+                else:
+                    previous.next_order = order
+                previous = order
+            order_list.tail_order = previous
+            order_list.length = count
+            order_list.volume = volume
+            price_lists.append((price, order_list))
+        self.order_map.update(zip(order_ids, orders))
+        self.index.update(zip(order_ids, zip(repeat(side), orders)))
+        self.num_orders += len(order_ids)
+        self.volume += sum(volumes)
+        return price_lists
+
+    def _track_levels(self, columns):
+        '''Counts the bulk loaded orders of every trader per price, as _track_trader does one by one.'''
+        owned = np.flatnonzero(columns.traders)
+        if len(owned) == 0:
+            return
+        traders = columns.traders[owned]
+        prices = np.repeat(columns.prices, columns.counts)[owned]
+        ordered = np.lexsort((prices, traders))
+        traders = traders[ordered]
+        prices = prices[ordered]
+        starts = np.ones(len(ordered), dtype=bool)
+        starts[1:] = (traders[1:] != traders[:-1]) | (prices[1:] != prices[:-1])
+        starts = np.flatnonzero(starts)
+        counts = np.diff(np.append(starts, len(ordered)))
+        trader_ids = columns.trader_ids
+        trader_levels = self.trader_levels
+        for trader, price, count in zip(traders[starts].tolist(), prices[starts].tolist(), counts.tolist()):
+            key = (trader_ids[trader], price)
+            trader_levels[key] = trader_levels.get(key, 0) + count
+
+    def _install_levels(self, price_lists):
+        '''Puts (price, OrderList) pairs in ascending price order into the empty price index.'''
+        self.price_map.update(price_lists)
+        self.depth = len(price_lists)
+        if price_lists:
+            self._min_price, self._min_list = price_lists[0]
+            self._max_price, self._max_list = price_lists[-1]
 
     def update_order(self, order_update):
         order = self.order_map[order_update['order_id']]
-        original_quantity = order.quantity
         if order_update['price'] != order.price:
             # Price changed. Remove order and update tree.
-            order_list = self.price_map[order.price]
-            order_list.remove_order(order)
-            if len(order_list) == 0:  # If there is nothing else in the OrderList, remove the price from RBtree
-                self.remove_price(order.price)
+            self.remove_order_by_id(order.order_id)
             self.insert_order(order_update)
         else:
             # Quantity changed. Price is the same.
-            order.update_quantity(order_update['quantity'], order_update['timestamp'])
-        self.volume += order.quantity - original_quantity
+            self.update_order_quantity(order, order_update['quantity'], order_update['timestamp'])
+
+    def update_order_quantity(self, order, new_quantity, new_timestamp):
+        '''Changes the quantity of a resting order, e.g. after a partial fill.'''
+        self.volume += new_quantity - order.quantity
+        order.update_quantity(new_quantity, new_timestamp)
+        self._level_changed(order.price, order.order_list)
 
     def remove_order_by_id(self, order_id):
+        return self.remove_order(self.order_map[order_id])
+
+    def remove_order(self, order):
+        '''Removes an order given its order_map entry and returns the removed Order.
+
+        The Order goes back to the pool but keeps its fields, so it can still
+        be read until the next insert.
+        '''
         self.num_orders -= 1
-        order = self.order_map[order_id]
         self.volume -= order.quantity
-        order.order_list.remove_order(order)
-        if len(order.order_list) == 0:
-            self.remove_price(order.price)
-        del self.order_map[order_id]
+        self._untrack_trader(order.trader_id, order.price)
+        order_list = order.order_list
+        order_list.remove_order(order)
+        if len(order_list) == 0:
+            self._compact_level(order.price, order_list)
+            if self.tombstones:
+                self._prune_ends()
+        else:
+            self._level_changed(order.price, order_list)
+        del self.order_map[order.order_id]
+        del self.index[order.order_id]
+        self.pool.release(order)
+        return order
+
+    def cancel_order(self, order):
+        '''Cancels an order given its order_map entry and returns the canceled Order.
+
+        Same as remove_order unless lazy cancels are enabled, in which case the
+        Order is tombstoned in its OrderList. Its fields stay readable.
+        '''
+        if not self.lazy_cancel:
+            return self.remove_order(order)
+        price = order.price
+        order_list = order.order_list
+        self.num_orders -= 1
+        self.volume -= order.quantity
+        self._untrack_trader(order.trader_id, price)
+        order_list.tombstone_order(order)
+        del self.order_map[order.order_id]
+        del self.index[order.order_id]
+        self.tombstones += 1
+        self._dirty.add(price)
+        self._level_changed(price, order_list)
+        if len(order_list) == 0 and (price == self.min_price() or price == self.max_price()):
+            # The best and worst levels always have live orders
+            self._compact_level(price, order_list)
+            self._prune_ends()
+        if self.tombstones > self.compact_threshold and self.tombstones > self.num_orders:
+            self.compact()
+        return order
+
+    def release_tombstone(self, order_list, order):
+        '''Unlinks a tombstone from its OrderList and returns it to the pool.'''
+        order_list.unlink_order(order)
+        order_list.tombstones -= 1
+        self.tombstones -= 1
+        self.pool.release(order)
+
+    def _compact_level(self, price, order_list):
+        '''Releases the tombstones of a level and removes the level if no live Order is left.'''
+        order = order_list.head_order
+        while order_list.tombstones:
+            next_order = order.next_order
+            if order.order_list is None:
+                self.release_tombstone(order_list, order)
+            order = next_order
+        if len(order_list) == 0:
+            self.remove_price(price)
+
+    def _prune_ends(self):
+        # Levels holding only tombstones must not become the best or worst level
+        while self.depth > 0 and len(self.min_price_list()) == 0:
+            self._compact_level(self.min_price(), self.min_price_list())
+        while self.depth > 0 and len(self.max_price_list()) == 0:
+            self._compact_level(self.max_price(), self.max_price_list())
+
+    def compact(self):
+        '''Releases all tombstones and removes the levels they leave empty.'''
+        dirty = self._dirty
+        self._dirty = set()
+        for price in dirty:
+            if self.price_exists(price):
+                order_list = self.get_price_list(price)
+                if order_list.tombstones or len(order_list) == 0:
+                    self._compact_level(price, order_list)
+
+    def price_levels(self, reverse=False):
+        '''Iterates (price, OrderList) pairs in ascending price order, or descending if reverse is set.'''
+        if reverse:
+            return reversed(self.price_map.items())
+        return iter(self.price_map.items())
+
+    def count_consumed_levels(self, quantity, reverse=False):
+        '''Counts the best levels that quantity consumes completely
+
+        Levels are walked from the lowest price, or from the highest if reverse
+        is set, keeping the cumulative level volume. The walk stops at the first
+        level the quantity can not fully take out, so the cost is bounded by the
+        number of levels the order reaches.
+
+        Returns the number of levels and their total volume.
+        '''
+        count = 0
+        cumulative_volume = 0
+        for price, order_list in self.price_levels(reverse):
+            if cumulative_volume + order_list.volume > quantity:
+                break
+            cumulative_volume += order_list.volume
+            count += 1
+        return count, cumulative_volume
+
+    def remove_best_levels(self, count, reverse=False):
+        '''Removes the count best levels with all their orders in one go
+
+        Returns one (price, volume, orders) tuple per removed level, where orders
+        lists (order_id, trader_id, quantity) of every order in time priority.
+        The data is copied out since the removed orders return to the pool.
+        Levels holding only tombstones are removed but not returned.
+        '''
+        removed = []
+        for price, order_list in list(islice(self.price_levels(reverse), count)):
+            orders = self._drain_level(order_list)
+            self.num_orders -= order_list.length
+            self.volume -= order_list.volume
+            if orders:
+                removed.append((price, order_list.volume, orders))
+            self.remove_price(price)
+        if self.tombstones:
+            self._prune_ends()
+        return removed
+
+    def _drain_level(self, order_list):
+        orders = []
+        order_map = self.order_map
+        index = self.index
+        release = self.pool.release
+        order = order_list.head_order
+        while order is not None:
+            next_order = order.next_order
+            if order.order_list is not None: # tombstones are only released
+                orders.append((order.order_id, order.trader_id, order.quantity))
+                self._untrack_trader(order.trader_id, order.price)
+                del order_map[order.order_id]
+                del index[order.order_id]
+            release(order)
+            order = next_order
+        self.tombstones -= order_list.tombstones
+        return orders
+
+    def best(self):
+        '''Returns the best price and its OrderList in O(1), or (None, None) if the tree is empty
+
+        The best price is the highest one for bids and the lowest one for asks.
+        '''
+        if self.side == Side.B:
+            return self._max_price, self._max_list
+        return self._min_price, self._min_list
 
     def max_price(self):
-        if self.depth > 0:
-            return self.prices[-1]
-        else:
-            return None
+        return self._max_price
 
     def min_price(self):
-        if self.depth > 0:
-            return self.prices[0]
-        else:
-            return None
+        return self._min_price
 
     def max_price_list(self):
-        if self.depth > 0:
-            return self.get_price_list(self.max_price())
-        else:
-            return None
+        return self._max_list
 
     def min_price_list(self):
-        if self.depth > 0:
-            return self.get_price_list(self.min_price())
-        else:
-            return None
+        return self._min_list
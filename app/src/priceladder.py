@@ -0,0 +1,265 @@
+from itertools import chain
+from .ordertree import OrderTree
+from .side import Side
+
+# Largest number of slots a ladder grows to, 8 MB of slots per side
+MAX_LADDER_SIZE = 1 << 20
+
+
+class PriceLadder(OrderTree):
+    '''A dense array of OrderLists indexed by tick offset from a base price
+
+    Alternative to the SortedDict backed OrderTree for books that live in a
+    bounded price band. Creating or removing a level is a single slot write and
+    the lowest and highest occupied slots are tracked incrementally, so
+    min_price() and max_price() never search. When a price falls outside the
+    array the ladder is recentred around the occupied band, and grown if the
+    band does not fit, up to max_size slots. Levels that still do not fit are
+    kept in the SortedDict price_map of the OrderTree, so a far away price
+    costs what it costs in the tree instead of memory for every tick up to it.
+    '''
+
+    def __init__(self, pool=None, side=None, index=None, size=1024, max_size=MAX_LADDER_SIZE):
+        if not 0 < size <= max_size:
+            raise ValueError(f'Ladder size has to be positive and at most {max_size}, was {size}.')
+        super().__init__(pool, side, index)
+        self.max_size = max_size
+        self._levels = [None] * size # OrderList or None for every tick in the band
+        self._base = None # Price of slot 0, set when the first level is created
+        self._low = -1 # Index of the lowest occupied slot
+        self._high = -1 # Index of the highest occupied slot
+        self._occupied = 0 # Number of occupied slots, depth less the levels in price_map
+
+    def get_price_list(self, price):
+        if self._base is not None:
+            index = price - self._base
+            if 0 <= index < len(self._levels):
+                order_list = self._levels[index]
+                if order_list is not None:
+                    return order_list
+        return self.price_map[price]
+
+    def price_exists(self, price):
+        if self._base is not None:
+            index = price - self._base
+            if 0 <= index < len(self._levels) and self._levels[index] is not None:
+                return True
+        return price in self.price_map
+
+    def create_price(self, price):
+        if self._base is None:
+            self._base = price - len(self._levels) // 2
+        index = price - self._base
+        if not 0 <= index < len(self._levels) and not self._recentre(price):
+            # Too far from the band for the array
+            self.depth += 1
+            new_list = self._new_order_list()
+            self.price_map[price] = new_list
+            return new_list
+        index = price - self._base
+
+        self.depth += 1
+        self._occupied += 1
+        new_list = self._new_order_list()
+        self._levels[index] = new_list
+
+        if self._occupied == 1:
+            self._low = index
+            self._high = index
+        elif index < self._low:
+            self._low = index
+        elif index > self._high:
+            self._high = index
+        return new_list
+
+    def remove_price(self, price):
+        index = -1 if self._base is None else price - self._base
+        levels = self._levels
+        if not (0 <= index < len(levels)) or levels[index] is None:
+            del self.price_map[price]
+            self.depth -= 1
+            if self.depth_view is not None:
+                self.depth_view.remove(price)
+            return
+        self.depth -= 1
+        self._occupied -= 1
+        levels[index] = None
+        if self.depth_view is not None:
+            self.depth_view.remove(price)
+
+        if self._occupied == 0:
+            self._low = -1
+            self._high = -1
+            return
+
+        # Walk inwards to the next occupied slot. The walk is bounded by the
+        # width of the occupied band.
+        if index == self._low:
+            low = index + 1
+            while levels[low] is None:
+                low += 1
+            self._low = low
+        elif index == self._high:
+            high = index - 1
+            while levels[high] is None:
+                high -= 1
+            self._high = high
+
+    def _size_for(self, span):
+        '''Returns the array size for a band of span ticks, None if it is over max_size.'''
+        if span > self.max_size:
+            return None
+        size = len(self._levels)
+        while size < 2 * span:
+            size *= 2
+        return min(size, self.max_size)
+
+    def _install_levels(self, price_lists):
+        '''Sizes the empty ladder around the loaded band and fills its slots.'''
+        if not price_lists:
+            return
+        self.depth = len(price_lists)
+        # The array takes the levels around the best price, up to max_size ticks
+        if self.side == Side.B:
+            high_price = price_lists[-1][0]
+            low_price = max(price_lists[0][0], high_price - self.max_size + 1)
+        else:
+            low_price = price_lists[0][0]
+            high_price = min(price_lists[-1][0], low_price + self.max_size - 1)
+        span = high_price - low_price + 1
+        size = self._size_for(span)
+
+        base = low_price - (size - span) // 2
+        levels = [None] * size
+        for price, order_list in price_lists:
+            if low_price <= price <= high_price:
+                levels[price - base] = order_list
+                self._occupied += 1
+            else:
+                self.price_map[price] = order_list
+        self._levels = levels
+        self._base = base
+        self._low = low_price - base
+        self._high = high_price - base
+
+    def _recentre(self, price):
+        '''Moves the occupied band and the new price into the middle of the array
+
+        Returns False and leaves the array as it is if the band and the price
+        span more than max_size ticks.
+        '''
+        levels = self._levels
+        if self._occupied > 0:
+            low_price = min(self._base + self._low, price)
+            high_price = max(self._base + self._high, price)
+        else:
+            low_price = high_price = price
+
+        span = high_price - low_price + 1
+        size = self._size_for(span)
+        if size is None:
+            return False
+
+        new_base = low_price - (size - span) // 2
+        new_levels = [None] * size
+        if self._occupied > 0:
+            shift = self._base - new_base
+            new_levels[self._low + shift:self._high + shift + 1] = levels[self._low:self._high + 1]
+            self._low += shift
+            self._high += shift
+
+        self._levels = new_levels
+        self._base = new_base
+        if self.price_map:
+            self._take_far_levels()
+        return True
+
+    def _take_far_levels(self):
+        '''Moves the levels of price_map that fall into the array into their slots.'''
+        high_price = self._base + len(self._levels) - 1
+        for price in list(self.price_map.irange(self._base, high_price)):
+            index = price - self._base
+            self._levels[index] = self.price_map.pop(price)
+            if self._occupied == 0:
+                self._low = self._high = index
+            else:
+                self._low = min(self._low, index)
+                self._high = max(self._high, index)
+            self._occupied += 1
+
+    def _ladder_levels(self, reverse):
+        if self._occupied == 0:
+            return iter(())
+        base = self._base
+        levels = self._levels
+        if reverse:
+            indices = range(self._high, self._low - 1, -1)
+        else:
+            indices = range(self._low, self._high + 1)
+        return ((base + i, levels[i]) for i in indices if levels[i] is not None)
+
+    def price_levels(self, reverse=False):
+        '''Iterates (price, OrderList) pairs in ascending price order, or descending if reverse is set.'''
+        if not self.price_map:
+            return self._ladder_levels(reverse)
+        # Levels of price_map lie outside the array, below or above it
+        base = self._base
+        price_map = self.price_map
+        below = price_map.irange(maximum=base, inclusive=(True, False), reverse=reverse)
+        above = price_map.irange(minimum=base, reverse=reverse)
+        if reverse:
+            return chain(((price, price_map[price]) for price in above), self._ladder_levels(True),
+                         ((price, price_map[price]) for price in below))
+        return chain(((price, price_map[price]) for price in below), self._ladder_levels(False),
+                     ((price, price_map[price]) for price in above))
+
+    def best(self):
+        '''Returns the best price and its OrderList, or (None, None) if the ladder is empty'''
+        if not self.price_map:
+            if self._occupied == 0:
+                return None, None
+            index = self._high if self.side == Side.B else self._low
+            return self._base + index, self._levels[index]
+        if self.side == Side.B:
+            return self.max_price(), self.max_price_list()
+        return self.min_price(), self.min_price_list()
+
+    def max_price(self):
+        if self.price_map:
+            price = self.price_map.keys()[-1]
+            if self._occupied == 0 or price > self._base + self._high:
+                return price
+        if self._occupied > 0:
+            return self._base + self._high
+        else:
+            return None
+
+    def min_price(self):
+        if self.price_map:
+            price = self.price_map.keys()[0]
+            if self._occupied == 0 or price < self._base + self._low:
+                return price
+        if self._occupied > 0:
+            return self._base + self._low
+        else:
+            return None
+
+    def max_price_list(self):
+        if self.price_map:
+            price, order_list = self.price_map.peekitem(-1)
+            if self._occupied == 0 or price > self._base + self._high:
+                return order_list
+        if self._occupied > 0:
+            return self._levels[self._high]
+        else:
+            return None
+
+    def min_price_list(self):
+        if self.price_map:
+            price, order_list = self.price_map.peekitem(0)
+            if self._occupied == 0 or price < self._base + self._low:
+                return order_list
+        if self._occupied > 0:
+            return self._levels[self._low]
+        else:
+            return None
@@ -0,0 +1,340 @@
+"""
+Headless replay of recorded order flow into OrderBooks, without sockets,
+threads or sleeps. Used to measure the matching engine on production
+shaped traffic and to compare the book backends.
+
+Two recordings are read, both as streams of constant memory:
+
+- the write-ahead journal (see journal.py), in ticks and lots
+
+- JSON lines of SOE order entry messages in wire units, one per line:
+
+    {"message-type": "A", "instrument": "0", "order-type": "LMT", "side": "B",
+     "quantity": 5, "price": 100, "trader-id": "<uuid>", "timestamp": 1600000000000000}
+    {"message-type": "X", "instrument": "0", "order-id": 12}
+
+  An "A" with an order-id modifies the order if it is in the book and
+  inserts it otherwise, as the gateway does. trader-id and timestamp (wire
+  microseconds) are optional, simulated orders have no trader. Lines of
+  other message types are skipped.
+
+Both readers yield (timestamp, kind, instrument, order_id, side,
+order_type, price, quantity, trader_id) tuples in ticks and lots, kind
+being one of the journal record kinds. timestamp and order_id may be None.
+"""
+import hashlib
+import json
+import time
+import uuid
+from itertools import islice
+
+from .orderbook import (
+    OrderBook
+)
+
+from .order import (
+    OrderType
+)
+
+from .clock import (
+    VirtualClock
+)
+
+from .ticks import (
+    UNIT_SCALE
+)
+
+from .soe import (
+    InboundNewOrder,
+    InboundCancelOrder
+)
+
+from .journal import (
+    NEW_ORDER,
+    CANCEL,
+    MODIFY,
+    read_journal
+)
+
+# Event types latencies are kept for
+EVENT_TYPES = ['limit', 'market', 'cancel', 'modify']
+
+
+def journal_events(directory, start=0):
+    """
+    Yields the commands of a journal from sequence start on.
+    """
+    for (_, timestamp, kind, _, instrument, order_id, side, order_type, price, quantity,
+         trader_id) in read_journal(directory, start):
+        yield timestamp, kind, instrument, order_id, side, order_type, price, quantity, trader_id
+
+
+def json_events(path, scale=UNIT_SCALE):
+    """
+    Yields the order entry messages of a JSON lines file, prices and
+    quantities converted with the scale.
+    """
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            request = json.loads(line)
+            message_type = request.pop('message-type', None)
+            timestamp = request.pop('timestamp', None)
+            if timestamp is not None:
+                timestamp = int(timestamp) * 1000
+            trader_id = request.pop('trader-id', None)
+
+            if message_type == 'A':
+                order_id = request.get('order-id')
+                order = InboundNewOrder.from_dict(request)
+                if trader_id is not None:
+                    order.trader_id = uuid.UUID(trader_id)
+                lob_order = order.to_lob_format(scale)
+                yield (timestamp, NEW_ORDER if order_id is None else MODIFY, lob_order['instrument'], order_id,
+                       lob_order['side'], lob_order['order_type'], lob_order['price'], lob_order['quantity'],
+                       lob_order['trader_id'])
+
+            elif message_type == 'X':
+                cancel = InboundCancelOrder.from_dict(request)
+                yield timestamp, CANCEL, cancel.instrument, cancel.order_id, None, None, None, None, None
+
+
+def open_recording(path, scale=UNIT_SCALE):
+    """
+    Events of a journal directory or of a JSON lines file.
+    """
+    if path.endswith('.jsonl') or path.endswith('.json'):
+        return json_events(path, scale)
+    return journal_events(path)
+
+
+class LatencyHistogram(object):
+    """
+    Log-linear histogram of nanosecond latencies.
+
+    Values below 32 ns have a bucket each, above that every power of two
+    is split into 16 buckets, so a percentile is off by less than 1/16 of
+    its value. Recording is a few integer operations and the memory is
+    fixed, however long the replay runs.
+    """
+    __slots__ = ('_counts', 'count', 'total', 'max')
+
+    _SUB_BITS = 4
+
+    def __init__(self):
+        self._counts = [0] * (64 << self._SUB_BITS)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, nanoseconds):
+        shift = nanoseconds.bit_length() - self._SUB_BITS - 1
+        if shift <= 0:
+            self._counts[nanoseconds] += 1
+        else:
+            self._counts[(shift << self._SUB_BITS) + (nanoseconds >> shift)] += 1
+        self.count += 1
+        self.total += nanoseconds
+        if nanoseconds > self.max:
+            self.max = nanoseconds
+
+    def _bucket_high(self, index):
+        # Largest value that falls into the bucket
+        shift = index >> self._SUB_BITS
+        if shift <= 1:
+            return index
+        shift -= 1
+        return ((index - (shift << self._SUB_BITS) + 1) << shift) - 1
+
+    def percentile(self, q):
+        """
+        Upper bound of the bucket holding the q-th percentile, q in [0, 100].
+        """
+        if self.count == 0:
+            return 0
+        if not 0 <= q <= 100:
+            raise ValueError(f'Percentile has to be in [0, 100], was {q}.')
+        rank = max(int(q / 100 * self.count + 0.5), 1)
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return min(self._bucket_high(index), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+
+def book_hash(books):
+    """
+    SHA-256 over the resting orders of a {symbol : OrderBook} dict. Only
+    prices, order ids, quantities and traders go in, so books that went
+    through the same commands on any backend hash the same.
+    """
+    digest = hashlib.sha256()
+    for symbol in sorted(books):
+        _, _, bids, asks = books[symbol].export_state()
+        digest.update(symbol.encode('utf-8'))
+        for side in (bids, asks):
+            digest.update(b'|')
+            for price, orders in side:
+                digest.update(repr((price, [(order_id, quantity, trader_id and trader_id.bytes)
+                                            for order_id, quantity, _, trader_id in orders])).encode('ascii'))
+    return digest.hexdigest()
+
+
+class ReplayReport(object):
+    """
+    Outcome of ReplayEngine.run.
+
+    seconds is the wall time of the whole replay including reading the
+    recording, the histograms only time the book calls.
+    """
+
+    def __init__(self, events, missed, seconds, histograms, book_hash):
+        self.events = events
+        self.missed = missed
+        self.seconds = seconds
+        self.histograms = histograms
+        self.book_hash = book_hash
+
+    @property
+    def events_per_second(self):
+        return self.events / self.seconds if self.seconds else 0
+
+    @property
+    def matching_events_per_second(self):
+        busy = sum(histogram.total for histogram in self.histograms.values())
+        return self.events / busy * 1e9 if busy else 0
+
+    def __str__(self):
+        lines = [f'{self.events} events in {self.seconds:.3f} s, {self.events_per_second:,.0f} events/s, '
+                 f'{self.matching_events_per_second:,.0f} events/s in the book, {self.missed} missed',
+                 f"{'type':<8}{'count':>10}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'p99.9':>10}{'max':>10}"]
+        for name, histogram in self.histograms.items():
+            if histogram.count == 0:
+                continue
+            lines.append(f'{name:<8}{histogram.count:>10}{histogram.mean:>10.0f}'
+                         + ''.join(f'{histogram.percentile(q):>10}' for q in (50, 90, 99, 99.9))
+                         + f'{histogram.max:>10}')
+        lines.append(f'book hash {self.book_hash}')
+        return '\n'.join(lines)
+
+
+class ReplayEngine(object):
+    """
+    Applies recorded events to OrderBooks as fast as they can be read.
+
+    Books are created on first use with the given OrderBook arguments, or
+    added beforehand with add_order_book, e.g. to seed the book a journal
+    was recorded on. All books run on one VirtualClock that is set to the
+    timestamp of every event, so the books give orders the timestamps they
+    had when they were recorded.
+
+    Order ids of the recording are used as they are while they agree with
+    the ids the replay books hand out. Where they differ, e.g. because a
+    recording starts on a different book, the recorded id is mapped to the
+    id of the replay until the order is canceled. A modify of an order that
+    is not in the book inserts it, as the gateway does. Cancels of orders
+    that are not in the book are counted as missed, on a replay of a
+    journal onto its original book there are none.
+    """
+
+    def __init__(self, **book_kwargs):
+        self.clock = VirtualClock()
+        self._book_kwargs = book_kwargs
+        self._books = {}
+        self._order_ids = {} # (instrument, recorded order_id) : order_id in the replay book
+        self.events = 0
+        self.missed = 0
+
+    def add_order_book(self, symbol, **kwargs):
+        arguments = dict(self._book_kwargs)
+        arguments.update(kwargs)
+        book = OrderBook(clock=self.clock, **arguments)
+        self._books[symbol] = book
+        return book
+
+    def get_order_book(self, symbol):
+        book = self._books.get(symbol)
+        if book is None:
+            book = self.add_order_book(symbol)
+        return book
+
+    def get_order_books(self):
+        return self._books
+
+    def run(self, events, limit=None):
+        """
+        Replays the events, at most limit of them, and returns a
+        ReplayReport.
+        """
+        if limit is not None:
+            events = islice(events, limit)
+        clock = self.clock
+        books = self._books
+        order_ids = self._order_ids
+        perf_counter_ns = time.perf_counter_ns
+        histograms = {name: LatencyHistogram() for name in EVENT_TYPES}
+        limit_histogram = histograms['limit']
+        market_histogram = histograms['market']
+        cancel_histogram = histograms['cancel']
+        modify_histogram = histograms['modify']
+        count = 0
+        missed = 0
+
+        start = time.perf_counter()
+        for timestamp, kind, instrument, order_id, side, order_type, price, quantity, trader_id in events:
+            count += 1
+            if timestamp is None:
+                clock.advance(1)
+            elif timestamp > clock.now():
+                clock.set(timestamp)
+            book = books.get(instrument)
+            if book is None:
+                book = self.get_order_book(instrument)
+            if order_id is not None and order_ids:
+                book_order_id = order_ids.get((instrument, order_id), order_id)
+            else:
+                book_order_id = order_id
+
+            if kind == MODIFY and book_order_id in book.order_index:
+                update = {'instrument': instrument, 'order_type': order_type, 'side': side,
+                          'quantity': quantity, 'price': price, 'trader_id': trader_id}
+                begin = perf_counter_ns()
+                book.modify_order(book_order_id, update, None)
+                modify_histogram.record(perf_counter_ns() - begin)
+
+            elif kind == CANCEL:
+                begin = perf_counter_ns()
+                canceled = book.cancel(book_order_id)
+                cancel_histogram.record(perf_counter_ns() - begin)
+                if canceled is None:
+                    missed += 1
+                elif book_order_id != order_id:
+                    del order_ids[(instrument, order_id)]
+
+            else:
+                # New orders, and modifies of orders that are gone are inserted
+                order = {'instrument': instrument, 'order_type': order_type, 'side': side,
+                         'quantity': quantity, 'trader_id': trader_id}
+                if order_type == OrderType.Limit:
+                    order['price'] = price
+                    histogram = limit_histogram
+                else:
+                    histogram = market_histogram
+                begin = perf_counter_ns()
+                book.process_order(order, False, False)
+                histogram.record(perf_counter_ns() - begin)
+                if (kind == NEW_ORDER and order_id is not None and order['order_id'] != order_id
+                        and order['order_id'] in book.order_index):
+                    order_ids[(instrument, order_id)] = order['order_id']
+        seconds = time.perf_counter() - start
+
+        self.events += count
+        self.missed += missed
+        return ReplayReport(count, missed, seconds, histograms, book_hash(books))
@@ -0,0 +1,177 @@
+import itertools
+import threading
+import time
+
+
+class BlockingWaitStrategy(object):
+    '''Waiting threads sleep on a condition until they are signaled
+
+    The condition lock is only taken by threads that have to sleep and by
+    signals while a thread sleeps. A waiter registers itself under the
+    lock before it checks ready() a last time, so a signal that sees no
+    waiter comes after a state change the waiter will see.
+    '''
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._waiters = 0 # threads in wait, only changed under the lock
+
+    def wait(self, ready, timeout):
+        if ready():
+            return True
+        with self._condition:
+            self._waiters += 1
+            try:
+                return self._condition.wait_for(ready, timeout)
+            finally:
+                self._waiters -= 1
+
+    def signal(self):
+        if self._waiters:
+            with self._condition:
+                self._condition.notify_all()
+
+
+class YieldingWaitStrategy(object):
+    '''Waiting threads poll and give up the GIL between polls'''
+
+    def wait(self, ready, timeout):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while not ready():
+            if deadline is not None and time.perf_counter() > deadline:
+                return False
+            time.sleep(0)
+        return True
+
+    def signal(self):
+        pass
+
+
+class BusySpinWaitStrategy(object):
+    '''Waiting threads poll without yielding, the lowest latency at the cost of a busy core'''
+
+    def wait(self, ready, timeout):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        spins = 0
+        while not ready():
+            spins += 1
+            if deadline is not None and spins & 0x3ff == 0 and time.perf_counter() > deadline:
+                return False
+        return True
+
+    def signal(self):
+        pass
+
+
+WAIT_STRATEGIES = {
+    'block': BlockingWaitStrategy,
+    'yield': YieldingWaitStrategy,
+    'spin': BusySpinWaitStrategy
+}
+
+
+class RingBuffer(object):
+    """
+    Preallocated ring of slots with sequence numbers, written by any number
+    of producers and read by a single consumer.
+
+    A producer claims the next sequence number, waits until the consumer
+    has freed the slot of that sequence, stores its item and marks the
+    slot with the sequence. The consumer reads the slots in sequence order
+    and stops at the first one that is not published yet. Claiming a
+    sequence is a single next() on an itertools.count, which is atomic
+    under the GIL, so no lock is taken on the item path. The wait strategy
+    decides how a consumer waits for items and a producer for free slots,
+    the blocking one only locks while a thread actually sleeps.
+    """
+
+    def __init__(self, size=1024, wait_strategy='block'):
+        if size <= 0 or size & (size - 1):
+            raise ValueError(f'Ring size has to be a positive power of two, was {size}.')
+        if wait_strategy not in WAIT_STRATEGIES:
+            raise ValueError(f'Wait strategy has to be one of {list(WAIT_STRATEGIES)}, was {wait_strategy}.')
+        self._size = size
+        self._mask = size - 1
+        self._slots = [None] * size
+        self._published = [-1] * size # sequence number stored in each slot
+        self._claim = itertools.count()
+        self._read = 0 # next sequence number of the consumer
+        self._wait = WAIT_STRATEGIES[wait_strategy]()
+        self._closed = False
+
+    def __len__(self):
+        # Items published and not read yet
+        count = 0
+        sequence = self._read
+        while count < self._size and self._published[sequence & self._mask] == sequence:
+            count += 1
+            sequence += 1
+        return count
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def cursor(self):
+        '''Sequence number the consumer reads next'''
+        return self._read
+
+    def publish(self, item):
+        """
+        Stores an item in the next slot, waiting while the ring is full.
+
+        :return: sequence number of the item, None if the ring was closed
+        """
+        sequence = next(self._claim)
+        if sequence - self._read >= self._size:
+            def has_space():
+                return sequence - self._read < self._size or self._closed
+            while not self._wait.wait(has_space, 0.1):
+                pass
+        if self._closed:
+            return None
+        index = sequence & self._mask
+        self._slots[index] = item
+        self._published[index] = sequence
+        self._wait.signal()
+        return sequence
+
+    def poll(self, max_items, timeout=None):
+        """
+        Reads up to max_items published items in sequence order, waiting up
+        to timeout seconds for the first one.
+
+        :return: (sequence number of the first item, list of items)
+        """
+        sequence = self._read
+        published = self._published
+        mask = self._mask
+        if published[sequence & mask] != sequence:
+            def has_item():
+                return published[sequence & mask] == sequence or self._closed
+            if not self._wait.wait(has_item, timeout) or published[sequence & mask] != sequence:
+                return sequence, []
+
+        slots = self._slots
+        items = []
+        end = sequence + max_items
+        next_sequence = sequence
+        while next_sequence < end and published[next_sequence & mask] == next_sequence:
+            index = next_sequence & mask
+            items.append(slots[index])
+            slots[index] = None
+            next_sequence += 1
+        self._read = next_sequence
+
+        # Wake producers waiting for a free slot
+        self._wait.signal()
+        return sequence, items
+
+    def close(self):
+        """
+        Releases waiting producers and the consumer, items published after
+        this are dropped.
+        """
+        self._closed = True
+        self._wait.signal()
@@ -0,0 +1,442 @@
+import itertools
+import logging
+import queue
+import threading
+import multiprocessing
+import weakref
+from collections import deque
+
+from .orderbook import (
+    OrderBook
+)
+
+from .ticks import (
+    TickScale
+)
+
+from .clock import (
+    DEFAULT_CLOCK
+)
+
+from .matching import (
+    Command
+)
+
+logger = logging.getLogger(__name__)
+
+# OrderBook methods a RemoteOrderBook forwards to its worker process
+_REMOTE_METHODS = {
+    'process_order',
+    'process_orders',
+    'cancel',
+    'cancel_order',
+    'modify_order',
+    'get_order',
+    'get_order_ids_at_price',
+    'snapshot_orders',
+    'export_state',
+    'import_state',
+    'import_columns',
+    'bulk_load',
+    'compact',
+    'get_best_bid',
+    'get_best_ask',
+    'get_depth',
+    'get_pool_stats',
+    'print'
+}
+
+# Most requests sent to a worker in one message
+BATCH_SIZE = 256
+
+
+class OrderRecord(object):
+    '''Copy of a resting order that can be sent between processes'''
+    __slots__ = ('order_id', 'price', 'quantity', 'timestamp', 'side', 'trader_id', 'instrument')
+
+    def __init__(self, order):
+        self.order_id = order.order_id
+        self.price = order.price
+        self.quantity = order.quantity
+        self.timestamp = order.timestamp
+        self.side = order.side
+        self.trader_id = order.trader_id
+        self.instrument = order.instrument
+
+
+def _detach(method, result):
+    # Orders are linked into their book, send copies of them instead
+    if method in ('get_order', 'cancel'):
+        return None if result is None else OrderRecord(result)
+    if method == 'snapshot_orders':
+        return [OrderRecord(order) for order in result]
+    return result
+
+
+class _JournalRecorder(object):
+    '''Stands in for the Journal in a worker, the calls are replayed into the real one by the parent'''
+
+    def __init__(self):
+        self.records = []
+
+    def new_order(self, source, order, quantity):
+        self.records.append(('new_order', (source, order, quantity)))
+
+    def cancel(self, source, order, timestamp):
+        self.records.append(('cancel', (source, OrderRecord(order), timestamp)))
+
+    def modify(self, source, update, timestamp):
+        self.records.append(('modify', (source, update, timestamp)))
+
+
+class _WorkerState(object):
+    '''The part of GlobalState a command executes against, in the worker process'''
+
+    def __init__(self, books, clock):
+        self._books = books
+        self.clock = clock
+        self.journal = None
+
+    def get_current_lob_state(self, symbol):
+        return self._books[symbol]
+
+
+def _serve(conn, book_args):
+    """
+    Worker process main loop. Owns the OrderBooks of its instruments and
+    answers every message, a list of requests, with the list of their
+    (status, result, journal records) replies until it receives None.
+    """
+    books = {instrument: OrderBook(**kwargs) for instrument, kwargs in book_args.items()}
+    # The books share the clock of the engine
+    clock = next(iter(books.values())).clock if books else DEFAULT_CLOCK
+    state = _WorkerState(books, clock)
+    resident = {} # key : payload kept between commands, see ShardedEngine.submit
+    while True:
+        requests = conn.recv()
+        if requests is None:
+            break
+        replies = []
+        for method, instrument, args in requests:
+            records = []
+            try:
+                if method == 'run':
+                    execute, key, payload = args
+                    if key is not None:
+                        if payload is None:
+                            payload = resident[key]
+                        else:
+                            resident[key] = payload
+                    state.journal = _JournalRecorder()
+                    records = state.journal.records
+                    result = execute(state, books[instrument], Command(execute, None, payload, None))
+                elif method == 'release':
+                    # The parent dropped the payload
+                    resident.pop(args[0], None)
+                    result = None
+                elif method == 'process_batches':
+                    batches, outcomes = args
+                    result = {}
+                    for symbol, batch in batches.items():
+                        batch_result = books[symbol].process_orders(batch)
+                        result[symbol] = batch_result if outcomes else batch_result.market_data
+                else:
+                    result = _detach(method, getattr(books[instrument], method)(*args))
+                replies.append(('ok', result, records))
+            except Exception as exc:
+                replies.append(('error', exc, records))
+        conn.send(replies)
+    conn.close()
+
+
+def _ignore_reply(status, result, records):
+    pass
+
+
+class _Reply(object):
+    '''Waits for the reply of one request'''
+    __slots__ = ('_done', '_status', '_result')
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._status = None
+        self._result = None
+
+    def set(self, status, result, records):
+        self._status = status
+        self._result = result
+        self._done.set()
+
+    def get(self):
+        self._done.wait()
+        if self._status == 'error':
+            raise self._result
+        return self._result
+
+
+class _Worker(object):
+    """
+    Parent side of a worker process.
+
+    Requests are queued and a sender thread writes everything queued, up
+    to BATCH_SIZE requests, to the pipe as one message without waiting for
+    the replies of earlier messages. A receiver thread reads the replies,
+    which come back in request order, and hands each one to the callback
+    of its request. The pipe round trip is paid once per message, not once
+    per request, and the worker never idles while requests are queued.
+    """
+
+    def __init__(self, context, book_args):
+        self.instruments = list(book_args)
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child_conn, book_args), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self._requests = queue.SimpleQueue()
+        self._in_flight = deque() # callbacks of the requests of each sent message, in send order
+        self._in_flight_lock = threading.Lock()
+        self._resident = weakref.WeakKeyDictionary() # payload : key it is kept under in the worker
+        self._keys = itertools.count()
+        self._sender = threading.Thread(target=self._send, name='shard-sender', daemon=True)
+        self._receiver = threading.Thread(target=self._receive, name='shard-receiver', daemon=True)
+        self._sender.start()
+        self._receiver.start()
+
+    def post(self, request, done):
+        '''Queues a request, done(status, result, journal records) is called with its reply.'''
+        self._requests.put((request, done))
+
+    def call(self, request):
+        '''Sends a request and waits for its result.'''
+        reply = _Reply()
+        self.post(request, reply.set)
+        return reply.get()
+
+    def _release(self, key):
+        # Called when a resident payload is collected in the parent, maybe on any thread
+        self._requests.put((('release', None, (key,)), _ignore_reply))
+
+    def stop(self):
+        self._requests.put(None)
+
+    def join(self):
+        self.process.join()
+        self._receiver.join()
+        self._sender.join()
+
+    def _send(self):
+        # A message is built and sent in _send_message, nothing of it is kept while waiting for the next
+        while self._send_message():
+            pass
+        self.conn.send(None)
+
+    def _send_message(self):
+        '''Sends the queued requests as one message, returns False once stopped.'''
+        requests = self._requests
+        items = [requests.get()]
+        while items[-1] is not None and len(items) < BATCH_SIZE:
+            try:
+                items.append(requests.get_nowait())
+            except queue.Empty:
+                break
+        stop = items[-1] is None
+        if stop:
+            items.pop()
+        if items:
+            message = []
+            dones = []
+            sent = [] # resident payloads sent for the first time
+            for (method, instrument, args), done in items:
+                if method == 'run':
+                    execute, payload = args
+                    key = None
+                    if getattr(payload, 'shard_resident', False):
+                        # Sent once, later commands only name it
+                        key = self._resident.get(payload)
+                        if key is not None:
+                            payload = None
+                        else:
+                            key = next(self._keys)
+                            self._resident[payload] = key
+                            weakref.finalize(payload, self._release, key)
+                            sent.append(payload)
+                    args = (execute, key, payload)
+                message.append((method, instrument, args))
+                dones.append(done)
+            # Queued before sending, the replies may come back before send returns
+            self._in_flight.append(dones)
+            try:
+                self.conn.send(message)
+            except Exception as exc:
+                logger.exception('Sending to the worker process failed.')
+                for payload in sent:
+                    # Never arrived, the next command sends it again
+                    self._resident.pop(payload, None)
+                with self._in_flight_lock:
+                    # The receiver fails what is left once the worker is gone
+                    failed = bool(self._in_flight) and self._in_flight[-1] is dones
+                    if failed:
+                        self._in_flight.pop()
+                if failed:
+                    for done in dones:
+                        done('error', exc, [])
+        return not stop
+
+    def _receive(self):
+        in_flight = self._in_flight
+        while True:
+            try:
+                replies = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            for done, (status, result, records) in zip(in_flight.popleft(), replies):
+                try:
+                    done(status, result, records)
+                except Exception:
+                    logger.exception('Handling a worker reply failed.')
+        # The worker is gone, nothing will answer the requests still in flight
+        with self._in_flight_lock:
+            unanswered = list(in_flight)
+            in_flight.clear()
+        for dones in unanswered:
+            for done in dones:
+                done('error', ConnectionError('Worker process exited.'), [])
+
+
+class RemoteOrderBook(object):
+    """
+    Stand-in for an OrderBook that lives in a worker process.
+
+    The OrderBook methods are forwarded over the worker's pipe, each call
+    waits for its reply. Orders come back as OrderRecord copies. scale and
+    clock are kept locally since the gateways only use them for message
+    formatting. The gateways and the simulator do not call the book
+    directly, GlobalState.submit runs their commands in the worker with
+    ShardedEngine.submit.
+    """
+
+    def __init__(self, worker, instrument, tick_size=1, lot_size=1, clock=None):
+        self._worker = worker
+        self.instrument = instrument
+        self.scale = TickScale(tick_size, lot_size)
+        self.clock = clock if clock is not None else DEFAULT_CLOCK
+
+    def __getattr__(self, name):
+        if name not in _REMOTE_METHODS:
+            raise AttributeError(name)
+
+        def call(*args):
+            return self._worker.call((name, self.instrument, args))
+        return call
+
+    def process_orders(self, batch, lock=None):
+        if lock is None:
+            return self._worker.call(('process_orders', self.instrument, (batch,)))
+        with lock:
+            return self._worker.call(('process_orders', self.instrument, (batch,)))
+
+
+class ShardedEngine(object):
+    """
+    Runs the OrderBooks in worker processes, one group of instruments per
+    worker, so that books of different instruments match in parallel
+    instead of sharing one interpreter.
+
+    Commands are routed to the worker owning the instrument over a
+    multiprocessing pipe, batched and pipelined as described in _Worker.
+    submit runs a command on its book in the worker, process_orders sends
+    the batches of all instruments before waiting for any result, so the
+    workers run concurrently.
+    """
+
+    def __init__(self, book_args, workers):
+        """
+        :param book_args: dict instrument : OrderBook keyword arguments,
+            including the clock the books share
+        :param workers: number of worker processes
+        """
+        if workers <= 0:
+            raise ValueError(f'Number of workers has to be positive, was {workers}.')
+        # Spawned, not forked, the parent already runs gateway threads
+        context = multiprocessing.get_context('spawn')
+        groups = [{} for _ in range(min(workers, len(book_args)))]
+        for i, (instrument, kwargs) in enumerate(book_args.items()):
+            groups[i % len(groups)][instrument] = kwargs
+
+        self._workers = [_Worker(context, group) for group in groups]
+        self._routes = {}
+        self._books = {}
+        for worker, group in zip(self._workers, groups):
+            for instrument, kwargs in group.items():
+                self._routes[instrument] = worker
+                self._books[instrument] = RemoteOrderBook(
+                    worker, instrument, kwargs.get('tick_size', 1), kwargs.get('lot_size', 1), kwargs.get('clock'))
+
+    @property
+    def workers(self):
+        return len(self._workers)
+
+    def has_book(self, instrument):
+        return instrument in self._routes
+
+    def get_books(self):
+        return dict(self._books)
+
+    def get_book(self, instrument):
+        return self._books[instrument]
+
+    def submit(self, instrument, execute, payload, done):
+        """
+        Runs execute(state, lob, command) on the book of the instrument in
+        its worker process, in submission order per worker, and calls
+        done(status, result, journal records) on the receiver thread once
+        the reply is back. status is 'ok', or 'error' with the exception
+        as result. The journal records are the (method, args) calls
+        execute made on state.journal.
+
+        execute has to be a module level function and payload picklable.
+        A payload whose class sets shard_resident is sent only once and
+        then lives in the worker, so its state carries over from one
+        command to the next there. The worker drops it once the payload
+        is garbage collected in the parent, so it has to support weak
+        references.
+        """
+        self._routes[instrument].post(('run', instrument, (execute, payload)), done)
+
+    def process_orders(self, batches, outcomes=True):
+        """
+        Processes one batch of commands per instrument.
+
+        Without outcomes only the market data deltas are sent back, which
+        is all the public feed needs and much cheaper to pickle than the
+        per-command trades.
+
+        :param batches: dict instrument : sequence of order commands
+        :param outcomes: send back whole BatchResults instead of market data
+        :return: dict instrument : BatchResult, or list of market data messages
+        """
+        per_worker = {}
+        for instrument, batch in batches.items():
+            per_worker.setdefault(self._routes[instrument], {})[instrument] = batch
+
+        replies = []
+        for worker, worker_batches in per_worker.items():
+            reply = _Reply()
+            worker.post(('process_batches', None, (worker_batches, outcomes)), reply.set)
+            replies.append(reply)
+        results = {}
+        error = None
+        for reply in replies:
+            try:
+                results.update(reply.get())
+            except Exception as exc:
+                error = exc
+        if error is not None:
+            raise error
+        return results
+
+    def close(self):
+        for worker in self._workers:
+            worker.stop()
+        for worker in self._workers:
+            worker.join()
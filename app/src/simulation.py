@@ -7,58 +7,60 @@ from src.side import (
 from src.event_generator import (
     EventTypes,
     EventGenerator,
-    event_generation_loop
+    event_scheduling_loop
 )
 
 
-def run_market_data_simulation(config, state):
+def create_generators(instrument, thread_id=1, add_rate=1.10, cancel_rate=1.0, market_rate=0.5):
+    """
+    Creates the event generators of one simulated instrument, ids are
+    counted up from thread_id. The rates are the events per second at the
+    first level, adds and cancels decay with the distance from the touch.
+    """
+    generators = []
 
-    # Create threads that create the market events
-    threads = []
-
-    # Create buy limit order add sampling threads
+    # Buy limit order adds
     n_levels = 15
-    thread_id = 1
-    instrument = "0"
     for level in range(1, n_levels + 1):
-        generator = EventGenerator(thread_id, instrument, EventTypes.ADD, Side.B, level, 1.10 * np.exp(-0.08*(level - 1)), 1)
-        kwargs = {'state': state, 'generator': generator}
-        state.add_simulation_thread(threading.Thread(target=event_generation_loop, kwargs=kwargs))
+        generators.append(EventGenerator(thread_id, instrument, EventTypes.ADD, Side.B, level, add_rate * np.exp(-0.08*(level - 1)), 1))
         thread_id += 1
 
-    # Create sell limit order add sampling threads
+    # Sell limit order adds
     for level in range(1, n_levels + 1):
-        generator = EventGenerator(thread_id, instrument, EventTypes.ADD, Side.S, level, 1.10 * np.exp(-0.08*(level - 1)), 1)
-        kwargs = {'state': state, 'generator': generator}
-        state.add_simulation_thread(threading.Thread(target=event_generation_loop, kwargs=kwargs))
+        generators.append(EventGenerator(thread_id, instrument, EventTypes.ADD, Side.S, level, add_rate * np.exp(-0.08*(level - 1)), 1))
         thread_id += 1
 
-    # Create buy limit order cancel sampling threads
+    # Buy limit order cancels
     for level in range(1, n_levels + 1):
-        generator = EventGenerator(thread_id, instrument, EventTypes.CANCEL, Side.B, level, 1.0 * np.exp(-0.10*(level - 1)), 1)
-        kwargs = {'state': state, 'generator': generator}
-        state.add_simulation_thread(threading.Thread(target=event_generation_loop, kwargs=kwargs))
+        generators.append(EventGenerator(thread_id, instrument, EventTypes.CANCEL, Side.B, level, cancel_rate * np.exp(-0.10*(level - 1)), 1))
         thread_id += 1
 
-    # Create sell limit order cancel sampling threads
+    # Sell limit order cancels
     for level in range(1, n_levels + 1):
-        generator = EventGenerator(thread_id, instrument, EventTypes.CANCEL, Side.S, level, 1.0 * np.exp(-0.10*(level - 1)), 1)
-        kwargs = {'state': state, 'generator': generator}
-        state.add_simulation_thread(threading.Thread(target=event_generation_loop, kwargs=kwargs))
+        generators.append(EventGenerator(thread_id, instrument, EventTypes.CANCEL, Side.S, level, cancel_rate * np.exp(-0.10*(level - 1)), 1))
         thread_id += 1
 
-    # Create a buy market order sampling thread
-    generator = EventGenerator(thread_id, instrument, EventTypes.MARKET_ORDER, Side.B, None, 0.5, None)
-    kwargs = {'state': state, 'generator': generator}
-    state.add_simulation_thread(threading.Thread(target=event_generation_loop, kwargs=kwargs))
+    # Buy market orders
+    generators.append(EventGenerator(thread_id, instrument, EventTypes.MARKET_ORDER, Side.B, None, market_rate, None))
     thread_id += 1
 
-    # Create a sell market order sampling thread
-    generator = EventGenerator(thread_id, instrument, EventTypes.MARKET_ORDER, Side.S, None, 0.5, None)
-    kwargs = {'state': state, 'generator': generator}
-    state.add_simulation_thread(threading.Thread(target=event_generation_loop, kwargs=kwargs))
+    # Sell market orders
+    generators.append(EventGenerator(thread_id, instrument, EventTypes.MARKET_ORDER, Side.S, None, market_rate, None))
     thread_id += 1
 
+    return generators
+
+
+def run_market_data_simulation(config, state, instruments=("0",)):
+
+    # The generators of all instruments share one scheduling thread
+    generators = []
+    for instrument in instruments:
+        generators.extend(create_generators(instrument, len(generators) + 1))
+
+    kwargs = {'state': state, 'generators': generators, 'speed': config.simulation_speed}
+    state.add_simulation_thread(threading.Thread(target=event_scheduling_loop, kwargs=kwargs))
+
     # Start the threads
     for thread in state.get_simulation_threads():
         thread.start()
@@ -1,8 +1,6 @@
 import json
 import uuid
 
-from decimal import Decimal
-
 from .side import (
     Side,
     side_to_str
@@ -13,6 +11,14 @@ from .order import (
     order_type_to_str
 )
 
+from .ticks import (
+    UNIT_SCALE
+)
+
+from .clock import (
+    wire_timestamp
+)
+
 _MESSAGE_TYPE_CONFIG = 'C'
 _MESSAGE_TYPE_NEW_ORDER = 'A'
 _MESSAGE_TYPE_CANCEL_ORDER = 'X'
@@ -173,12 +179,16 @@ class InboundNewOrder:
             setattr(order, key.replace('-', '_'), value)
         return order
 
-    def to_lob_format(self):
+    def to_lob_format(self, scale=UNIT_SCALE):
+        """
+        Transforms the order into the OrderBook format. Wire prices
+        and quantities are converted into integer ticks and lots.
+        """
         result = {}
         result.update({'order_type': self.order_type})
         result.update({'side': self.side})
-        result.update({'quantity': Decimal(self.quantity)})
-        result.update({'price': self.price})
+        result.update({'quantity': scale.to_lots(self.quantity)})
+        result.update({'price': scale.to_ticks(self.price)})
         result.update({'order_id': self.order_id})
         result.update({'trader_id': self.trader_id})
         result.update({'instrument': self.instrument})
@@ -200,7 +210,7 @@ class InboundNewOrder:
         msg.update({'quantity': int(self.quantity)})
         msg.update({'price': int(self.price)})
         msg.update({'side': side_to_str(self.side)})
-        msg.update({'timestamp': str(self.timestamp)})
+        msg.update({'timestamp': str(wire_timestamp(self.timestamp))})
         msg.update({'snapshot': 0})
 
         return msg
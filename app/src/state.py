@@ -1,25 +1,77 @@
+import logging
 import threading
+from functools import partial
 from queue import Queue
 from copy import deepcopy
 from .orderbook import OrderBook
+from .clock import RealTimeClock
+from .shard import ShardedEngine
+from .locks import InstrumentedLock
+from .journal import (
+    Journal,
+    check_symbol
+)
+from .matching import (
+    Command,
+    MatchingEngine
+)
 
+logger = logging.getLogger(__name__)
 
-class GlobalState:
 
-    def __init__(self, config):
+class GlobalState:
+    """
+    Order books, clients and threads of the exchange.
+
+    Every order book has its own lock, and the order client and market data
+    client registries have one lock each, so activity on one book does not
+    block the other books or the client bookkeeping. Locks are taken in
+    this order and released in reverse:
+
+        1. book locks, by symbol when more than one book is needed
+        2. the order client registry lock
+        3. the market data client registry lock
+
+    A book lock is never acquired while a registry lock is held. The event
+    queue is a thread-safe Queue and needs no lock. get_lock_stats reports
+    the wait time of every lock.
+
+    Work on a book is handed to submit. Once start_matching has run, each
+    book has a single-writer MatchingEngine and submit publishes the work
+    into its command ring instead of running it under the book lock. The
+    work on a sharded book runs in its worker process.
+    Once start_journal has run, the commands are also written to a
+    write-ahead journal.
+    """
+
+    def __init__(self, config, clock=None):
         self._cfg = config
 
-        # OrderBooks
+        # Engine clock shared by the books, the simulator and the gateways
+        self._clock = clock if clock is not None else RealTimeClock()
+
+        # OrderBooks, or RemoteOrderBooks when sharded over worker processes
         self._order_books = {}
+        self._engine = None
         #self._lob = OrderBook()
 
         self._event_queue = Queue()
         self._stop_event = threading.Event()
-        self._lock = threading.Lock()
+
+        # symbol : lock guarding that OrderBook
+        self._book_locks = {}
+
+        # symbol : MatchingEngine, empty while the books are locked
+        self._matching_engines = {}
+
+        # Write-ahead journal of the commands applied to the books, if enabled
+        self._journal = None
 
         self._order_clients = {}
+        self._order_clients_lock = InstrumentedLock('order-clients')
 
         self._market_data_clients = []
+        self._market_data_clients_lock = InstrumentedLock('market-data-clients')
 
         self._simulation_threads = []
         self._order_client_threads = []
@@ -36,22 +88,191 @@ class GlobalState:
         return self._cfg
 
     @property
-    def lock(self):
-        return self._lock
+    def clock(self):
+        return self._clock
+
+    def get_book_lock(self, symbol):
+        """
+        Returns the lock guarding the order book of the symbol.
+        """
+        if symbol not in self._book_locks:
+            raise KeyError(f"Symbol {symbol} not found!")
+        return self._book_locks[symbol]
+
+    def get_lock_stats(self):
+        """
+        Returns the wait time statistics of every lock by lock name.
+        """
+        locks = list(self._book_locks.values()) + [self._order_clients_lock, self._market_data_clients_lock]
+        return {lock.name: lock.stats() for lock in locks}
 
     @property
     def event_queue(self):
         return self._event_queue
 
-    def add_order_book(self, symbol):
-
+    def add_order_book(self, symbol, tick_size=1, lot_size=1, backend='tree', pool_size=0, depth_levels=10,
+                       cancel_mode='eager', smp_mode='cancel-resting', strict=False):
+        """
+        Adds a new order book. The backend selects the price level
+        container: 'tree' (SortedDict), 'ladder' (dense price array) or
+        'array' (SortedDict with the orders kept in NumPy arrays).
+        pool_size orders are pre-allocated for the book and depth_levels
+        aggregated price levels are maintained per side. cancel_mode is
+        'eager' or 'lazy' (tombstoned cancels) and smp_mode selects the
+        self-match prevention. strict checks every fill, for debugging.
+        """
         if symbol not in self._order_books:
-            self._order_books.update({symbol: OrderBook()})
+            self._order_books.update({symbol: OrderBook(tick_size, lot_size, backend, pool_size, depth_levels,
+                                                          cancel_mode, self._clock, smp_mode, strict)})
+            self._book_locks[symbol] = InstrumentedLock(f'book-{symbol}')
         else:
             raise ValueError(f"Symbol: {symbol} already exists.")
 
+    def add_sharded_order_books(self, book_args, workers):
+        """
+        Adds order books that run in worker processes. book_args maps each
+        symbol to the keyword arguments of add_order_book, the symbols are
+        spread over the given number of workers. The books are reached
+        through RemoteOrderBook proxies with the OrderBook interface.
+        """
+        if self._engine is not None:
+            raise ValueError("Sharded order books were already added.")
+        for symbol in book_args:
+            if symbol in self._order_books:
+                raise ValueError(f"Symbol: {symbol} already exists.")
+        args = {symbol: dict(kwargs, clock=self._clock) for symbol, kwargs in book_args.items()}
+        self._engine = ShardedEngine(args, workers)
+        self._order_books.update(self._engine.get_books())
+        for symbol in book_args:
+            self._book_locks[symbol] = InstrumentedLock(f'book-{symbol}')
+
+    @property
+    def engine(self):
+        return self._engine
+
+    def start_matching(self, ring_size=4096, wait_strategy='block'):
+        """
+        Starts a single-writer matching thread for every order book in this
+        process. From then on only that thread touches the book. Sharded
+        books already have a single writer, their worker process.
+        """
+        if self._matching_engines:
+            raise ValueError("Matching threads were already started.")
+        for symbol in self._order_books:
+            if self._engine is None or not self._engine.has_book(symbol):
+                self._matching_engines[symbol] = MatchingEngine(self, symbol, ring_size, wait_strategy)
+        for engine in self._matching_engines.values():
+            engine.start()
+
+    def get_matching_engines(self):
+        return self._matching_engines
+
+    def start_journal(self, directory, max_latency=0.005, segment_records=1 << 20):
+        """
+        Starts journaling every command applied to the books into the
+        directory, see Journal. Commands before this call, like the initial
+        book, are not journaled.
+        """
+        if self._journal is not None:
+            raise ValueError("The journal was already started.")
+        for symbol in self._order_books:
+            check_symbol(symbol)
+        self._journal = Journal(directory, max_latency, segment_records)
+        self._journal.start()
+        return self._journal
+
+    @property
+    def journal(self):
+        return self._journal
+
+    def submit(self, symbol, execute, respond=None, payload=None, client=None, fail=None):
+        """
+        Runs execute(state, lob, command) on the book of the symbol and then
+        respond(state, lob, command, result), either on the matching and
+        responder threads of the book, in the worker process of a sharded
+        book and on its receiver thread, or right away under the book lock.
+        For a sharded book only execute and payload go to the worker, see
+        ShardedEngine.submit.
+
+        If execute raises, the error is logged and passed to
+        fail(state, lob, command, error). Without fail it is raised to the
+        caller under the book lock, and only logged otherwise.
+
+        Once the journal writer failed no command is accepted, it is failed
+        the same way right away.
+        """
+        lob = self.get_current_lob_state(symbol)
+        command = Command(execute, respond, payload, client, fail)
+        journal = self._journal
+        if journal is not None and journal.error is not None:
+            try:
+                journal.check()
+            except RuntimeError as exc:
+                if fail is None:
+                    raise
+                logger.error(f'Command rejected on book {symbol}.', exc_info=exc)
+                fail(self, lob, command, exc)
+                return
+        engine = self._matching_engines.get(symbol)
+        if engine is not None:
+            engine.submit(command)
+            return
+        if self._engine is not None and self._engine.has_book(symbol):
+            self._engine.submit(symbol, execute, payload, partial(self._complete_remote, symbol, lob, command))
+            return
+
+        lock = self.get_book_lock(symbol)
+        lock.acquire()
+        try:
+            try:
+                result = execute(self, lob, command)
+            except Exception as exc:
+                if fail is None:
+                    raise
+                logger.exception(f'Command failed on book {symbol}.')
+                fail(self, lob, command, exc)
+                return
+            if respond is not None:
+                respond(self, lob, command, result)
+        finally:
+            lock.release()
+
+    def _complete_remote(self, symbol, lob, command, status, result, records):
+        # The journal calls of the command in the worker, in book order
+        journal = self._journal
+        if journal is not None:
+            try:
+                for method, args in records:
+                    getattr(journal, method)(*args)
+            except RuntimeError as exc:
+                # Applied in the worker, but not journaled, so not acknowledged
+                status, result = 'error', exc
+        try:
+            if status == 'error':
+                logger.error(f'Command failed on book {symbol}.', exc_info=result)
+                if command.fail is not None:
+                    command.fail(self, lob, command, result)
+            elif command.respond is not None:
+                command.respond(self, lob, command, result)
+        except Exception:
+            logger.exception(f'Response to a command failed on book {symbol}.')
+
+    def close(self):
+        for engine in self._matching_engines.values():
+            engine.join()
+        if self._journal is not None:
+            # After the matching threads, their last commands are written too
+            self._journal.close()
+        if self._engine is not None:
+            self._engine.close()
+
     def get_market_data_clients(self):
-        return self._market_data_clients
+        """
+        Returns a copy of the market data clients, so it can be iterated
+        without holding the registry lock.
+        """
+        with self._market_data_clients_lock:
+            return list(self._market_data_clients)
 
     def add_simulation_thread(self, thread):
         self._simulation_threads.append(thread)
@@ -76,32 +297,29 @@ class GlobalState:
 
     def add_order_client(self, trader_id, client):
 
-        self._lock.acquire()
-        self._order_clients.update({trader_id: client})
-        self._lock.release()
+        with self._order_clients_lock:
+            self._order_clients.update({trader_id: client})
 
     def remove_order_client(self, trader_id):
 
-        self._lock.acquire()
-        del self._order_clients[trader_id]
-        self._lock.release()
+        with self._order_clients_lock:
+            del self._order_clients[trader_id]
 
-    def get_order_client_nts(self, trader_id):
-        if trader_id in self._order_clients:
-            client = self._order_clients[trader_id]
-            return client
-        else:
+    def get_order_client(self, trader_id):
+        with self._order_clients_lock:
+            client = self._order_clients.get(trader_id, None)
+        if client is None:
             print(f"TraderId: {trader_id} not found from OrderClients!")
-            return None
+        return client
 
     def add_market_data_client(self, client):
 
-        #with self._lock:
+        with self._market_data_clients_lock:
             self._market_data_clients.append(client)
 
     def remove_market_data_client(self, client):
 
-        with self._lock:
+        with self._market_data_clients_lock:
             self._market_data_clients.remove(client)
 
     def get_current_lob_state(self, symbol):
@@ -117,7 +335,5 @@ class GlobalState:
         return self._order_books
 
     def add_to_event_queue(self, event):
-
-        with self._lock:
-            self._event_queue.put(event)
+        self._event_queue.put(event)
 
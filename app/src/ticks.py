@@ -0,0 +1,68 @@
+def _integral(value, name):
+    '''value as an int, ValueError if it is not a whole number.'''
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    try:
+        integral = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f'{name} has to be an integer, was {value!r}.')
+    if isinstance(value, bool) or integral != value:
+        raise ValueError(f'{name} has to be an integer, was {value!r}.')
+    return integral
+
+
+class TickScale:
+    """
+    Converts between wire prices / quantities and the integer
+    ticks / lots stored inside the OrderBook.
+
+    Everything behind the order entry and market data gateways
+    works in plain integers. Only the wire encoders and decoders
+    use the scale to convert at the edge.
+    """
+    __slots__ = ('_tick_size', '_lot_size')
+
+    def __init__(self, tick_size=1, lot_size=1):
+        if not isinstance(tick_size, int) or tick_size <= 0:
+            raise ValueError(f'Tick size has to be a positive <int>, was {tick_size}.')
+        if not isinstance(lot_size, int) or lot_size <= 0:
+            raise ValueError(f'Lot size has to be a positive <int>, was {lot_size}.')
+        self._tick_size = tick_size
+        self._lot_size = lot_size
+
+    @property
+    def tick_size(self):
+        return self._tick_size
+
+    @property
+    def lot_size(self):
+        return self._lot_size
+
+    def is_valid_price(self, price):
+        return price is None or price % self._tick_size == 0
+
+    def is_valid_quantity(self, quantity):
+        return quantity % self._lot_size == 0
+
+    def to_ticks(self, price):
+        if price is None:
+            return None
+        ticks, remainder = divmod(_integral(price, 'Price'), self._tick_size)
+        if remainder:
+            raise ValueError(f'Price {price} is not a multiple of tick size {self._tick_size}.')
+        return ticks
+
+    def to_price(self, ticks):
+        return ticks * self._tick_size
+
+    def to_lots(self, quantity):
+        lots, remainder = divmod(_integral(quantity, 'Quantity'), self._lot_size)
+        if remainder:
+            raise ValueError(f'Quantity {quantity} is not a multiple of lot size {self._lot_size}.')
+        return lots
+
+    def to_quantity(self, lots):
+        return lots * self._lot_size
+
+
+UNIT_SCALE = TickScale()
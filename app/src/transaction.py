@@ -1,5 +1,5 @@
-from decimal import Decimal
 import uuid
+import json
 
 from .side import (
     Side,
@@ -10,6 +10,14 @@ from .order import (
     order_type_to_str
 )
 
+from .ticks import (
+    UNIT_SCALE
+)
+
+from .clock import (
+    wire_timestamp
+)
+
 class PassiveParty:
 
     def __init__(self):
@@ -66,12 +74,12 @@ class PassiveParty:
 
     @quantity_remaining.setter
     def quantity_remaining(self, value):
-        if not isinstance(value, (Decimal, type(None))):
+        if not isinstance(value, (int, type(None))):
             raise TypeError(f'Quantity remaining has to be type of <int>, was {type(value)}.')
         if value is None:
             self._quantity_remaining = 0
         else:
-            self._quantity_remaining = int(value)
+            self._quantity_remaining = value
 
 
 class AggressingParty:
@@ -178,8 +186,8 @@ class Transaction:
 
     @traded_price.setter
     def traded_price(self, value):
-        if not isinstance(value, Decimal):
-            raise TypeError('Traded price has to be <Decimal>.')
+        if not isinstance(value, int):
+            raise TypeError('Traded price has to be <int> ticks.')
         self._traded_price = value
 
     @property
@@ -189,31 +197,191 @@ class Transaction:
     @traded_quantity.setter
     def traded_quantity(self, value):
         """
-        Traded quantity is Decimal when
+        Traded quantity is given in integer lots.
         """
-        if not isinstance(value, Decimal):
+        if not isinstance(value, int):
             raise TypeError(f'Traded quantity was {type(value)}.')
-        self._traded_quantity = int(value)
+        self._traded_quantity = value
 
 
-# TODO: make property setters and getters with proper error handling
 class SelfMatchCancel:
+    """
+    Quantity taken out of an order by self-match prevention.
+
+    quantity is the canceled quantity and remaining_quantity what is left
+    of the order, 0 if it was canceled completely. aggressor is set when
+    the order is the incoming one rather than a resting one.
+    """
+    __slots__ = ('order_id', 'side', 'quantity', 'price', 'timestamp',
+                 'trader_id', 'instrument', 'remaining_quantity', 'aggressor')
+
+    def __init__(self, order_id=None, side=None, quantity=None, price=None, timestamp=None,
+                 trader_id=None, instrument=None, remaining_quantity=0, aggressor=False):
+        self.order_id = order_id
+        self.side = side
+        self.quantity = quantity
+        self.price = price
+        self.timestamp = timestamp
+        self.trader_id = trader_id
+        self.instrument = instrument
+        self.remaining_quantity = remaining_quantity
+        self.aggressor = aggressor
+
+
+def _validated_transaction(timestamp, price, quantity, instrument, aggressor_id, aggressor_side,
+                           aggressor_order_type, aggressor_trader_id, passive_id, passive_side,
+                           passive_trader_id, quantity_remaining):
+    # Runs the fields through the checking setters of the party classes
+    aggressor = AggressingParty()
+    aggressor.id = aggressor_id
+    aggressor.side = aggressor_side
+    aggressor.order_type = aggressor_order_type
+    aggressor.trader_id = aggressor_trader_id
+
+    passive = PassiveParty()
+    passive.id = passive_id
+    passive.order_id = passive_id
+    passive.quantity_remaining = quantity_remaining
+    passive.side = passive_side
+    passive.trader_id = passive_trader_id
+
+    transaction = Transaction()
+    transaction.aggressor = aggressor
+    transaction.passive = passive
+    transaction.timestamp = timestamp
+    transaction.traded_price = price
+    transaction.traded_quantity = quantity
+    transaction.instrument = instrument
+    return transaction
+
+
+class Fill:
+    """
+    Compact record of one trade between an aggressing order and a resting
+    order, in ticks and lots. The matching loop fills it in directly
+    without any checks, validate runs the checks of Transaction and its
+    parties when the book is in strict mode.
+
+    quantity_remaining is what is left of the resting order, 0 if it was
+    filled completely.
+    """
+    __slots__ = ('timestamp', 'price', 'quantity', 'instrument', 'aggressor_id', 'aggressor_side',
+                 'aggressor_order_type', 'aggressor_trader_id', 'passive_id', 'passive_side',
+                 'passive_trader_id', 'quantity_remaining')
+
+    def __init__(self, timestamp, price, quantity, instrument, aggressor_id, aggressor_side,
+                 aggressor_order_type, aggressor_trader_id, passive_id, passive_side,
+                 passive_trader_id, quantity_remaining):
+        self.timestamp = timestamp
+        self.price = price
+        self.quantity = quantity
+        self.instrument = instrument
+        self.aggressor_id = aggressor_id
+        self.aggressor_side = aggressor_side
+        self.aggressor_order_type = aggressor_order_type
+        self.aggressor_trader_id = aggressor_trader_id
+        self.passive_id = passive_id
+        self.passive_side = passive_side
+        self.passive_trader_id = passive_trader_id
+        self.quantity_remaining = quantity_remaining
+
+    def validate(self):
+        """
+        Raises TypeError if a field would be rejected by Transaction.
+
+        :return: the fill as a Transaction
+        """
+        return _validated_transaction(self.timestamp, self.price, self.quantity, self.instrument,
+                                      self.aggressor_id, self.aggressor_side, self.aggressor_order_type,
+                                      self.aggressor_trader_id, self.passive_id, self.passive_side,
+                                      self.passive_trader_id, self.quantity_remaining)
+
+
+class LevelFill:
+    """
+    Compact record of a whole price level consumed by one aggressing
+    order. Instead of a Fill per resting order, the level keeps one
+    (order_id, trader_id, quantity) tuple per passive order in time
+    priority. Every passive order of the level was fully filled.
+    """
+    __slots__ = ('aggressor_id', 'aggressor_side', 'aggressor_order_type', 'passive_side',
+                 'timestamp', 'price', 'quantity', 'instrument', 'orders')
+
+    def __init__(self, aggressor_id, aggressor_side, aggressor_order_type, passive_side,
+                 timestamp, price, quantity, instrument, orders):
+        self.aggressor_id = aggressor_id
+        self.aggressor_side = aggressor_side
+        self.aggressor_order_type = aggressor_order_type
+        self.passive_side = passive_side
+        self.timestamp = timestamp
+        self.price = price
+        self.quantity = quantity
+        self.instrument = instrument
+        self.orders = orders
+
+    def __len__(self):
+        return len(self.orders)
+
+    def validate(self):
+        """
+        Raises TypeError if a field would be rejected by Transaction.
+
+        :return: list of Transactions, one per passive order
+        """
+        return [_validated_transaction(self.timestamp, self.price, quantity, self.instrument,
+                                       self.aggressor_id, self.aggressor_side, self.aggressor_order_type,
+                                       None, order_id, self.passive_side, trader_id, 0)
+                for order_id, trader_id, quantity in self.orders]
+
+
+_SIDE_CODES = {Side.B: 'B', Side.S: 'S'}
+
+
+class EncodedMessage:
+    """
+    A message that is serialized once and sent as is to every recipient.
+    Has the instrument, message_type and get_message the market data feed
+    expects from queued events.
+    """
+    __slots__ = ('message_type', 'instrument', 'payload')
+
+    def __init__(self, message_type, instrument, payload):
+        self.message_type = message_type
+        self.instrument = instrument
+        self.payload = payload
+
+    def get_message(self):
+        return self.payload
+
+
+class EncodedFills:
+    """
+    JSON messages of a TransactionList, built by TransactionList.encode.
+
+    aggressor_reports are the execution reports of the aggressing order,
+    passive_reports (trader_id, report) pairs for the resting orders,
+    trade_prints the public trades and book_deltas the public remove (X)
+    and modify (M) messages of the resting orders.
+    """
+    __slots__ = ('aggressor_reports', 'passive_reports', 'trade_prints', 'book_deltas')
 
     def __init__(self):
-        self.order_id = None
-        self.side = None
-        self.quantity = None
-        self.price = None
-        self.timestamp = None
-        self.trader_id = None
-        self.instrument = None
+        self.aggressor_reports = []
+        self.passive_reports = []
+        self.trade_prints = []
+        self.book_deltas = []
 
 
 class TransactionList:
+    """
+    Fills of one order as Fill and LevelFill records, turned into wire
+    messages on demand.
+    """
 
-    def __init__(self):
+    def __init__(self, scale=UNIT_SCALE):
 
         self._trade_list = []
+        self._scale = scale
 
     def is_empty(self):
 
@@ -230,44 +398,121 @@ class TransactionList:
         elif isinstance(trades, list):
             self._trade_list += trades
 
-    def get_trade_messages(self):
+    def summary(self):
+        """
+        Returns (number of fills, traded quantity in lots), a LevelFill
+        counts as one fill per passive order.
+        """
+        fills = 0
+        quantity = 0
+        for entry in self._trade_list:
+            fills += 1 if entry.__class__ is Fill else len(entry.orders)
+            quantity += entry.quantity
+        return fills, quantity
+
+    def _iter_fills(self):
         """
+        Yields one (timestamp, price, quantity, instrument, aggressor_id,
+        aggressor_side, passive_id, passive_side, passive_trader_id,
+        quantity_remaining) tuple per passive order, expanding LevelFill
+        records into their individual orders.
+        """
+        for entry in self._trade_list:
+            if entry.__class__ is Fill:
+                yield (entry.timestamp, entry.price, entry.quantity, entry.instrument,
+                       entry.aggressor_id, entry.aggressor_side, entry.passive_id, entry.passive_side,
+                       entry.passive_trader_id, entry.quantity_remaining)
+            else:
+                for order_id, trader_id, quantity in entry.orders:
+                    yield (entry.timestamp, entry.price, quantity, entry.instrument,
+                           entry.aggressor_id, entry.aggressor_side, order_id, entry.passive_side,
+                           trader_id, 0)
+
+    def encode(self):
+        """
+        Serializes every message of the fills in a single pass. The text is
+        what json.dumps gives for the dicts of get_trade_messages and
+        get_remove_and_modify_messages, but it is formatted directly from
+        the fill fields. Fields shared by the orders of a level are
+        formatted once per level.
+
+        :return: EncodedFills
+        """
+        tick_size = self._scale.tick_size
+        lot_size = self._scale.lot_size
+        encoded = EncodedFills()
+        aggressor_reports = encoded.aggressor_reports
+        passive_reports = encoded.passive_reports
+        trade_prints = encoded.trade_prints
+        book_deltas = encoded.book_deltas
+
+        for entry in self._trade_list:
+            instrument = entry.instrument
+            quoted_instrument = json.dumps(instrument)
+            aggressor_id = entry.aggressor_id
+            aggressor_side = _SIDE_CODES[entry.aggressor_side]
+            passive_side = _SIDE_CODES[entry.passive_side]
+            timestamp = wire_timestamp(entry.timestamp)
+            price = entry.price * tick_size
+            head = f'{{"message-type": "E", "timestamp": "{timestamp}", "price": {price}, "order-id": '
+            delta_head = f'{{"timestamp": "{timestamp}", "side": "{passive_side}", "price": {price}, "order-id": '
+            delta_tail = f', "instrument": {quoted_instrument}, "message-type": '
+
+            if entry.__class__ is Fill:
+                orders = ((entry.passive_id, entry.passive_trader_id, entry.quantity, entry.quantity_remaining),)
+            else:
+                orders = [(order_id, trader_id, quantity, 0) for order_id, trader_id, quantity in entry.orders]
+
+            for passive_id, passive_trader_id, quantity, quantity_remaining in orders:
+                body = f', "quantity": {quantity * lot_size}, "instrument": {quoted_instrument}, "side": "'
 
+                aggressor_report = f'{head}{aggressor_id}{body}{aggressor_side}"}}'
+                aggressor_reports.append(aggressor_report)
+                trade_prints.append(EncodedMessage('E', instrument, aggressor_report))
+                passive_reports.append((passive_trader_id, f'{head}{passive_id}{body}{passive_side}"}}'))
+
+                if quantity_remaining == 0:
+                    book_deltas.append(EncodedMessage(
+                        'X', instrument, f'{delta_head}{passive_id}{delta_tail}"X"}}'))
+                elif quantity_remaining > 0:
+                    book_deltas.append(EncodedMessage(
+                        'M', instrument,
+                        f'{delta_head}{passive_id}{delta_tail}"M", "quantity": {quantity_remaining * lot_size}}}'))
+                else:
+                    raise ValueError(f'Quantity remaining invalid.')
+
+        return encoded
+
+    def get_trade_messages(self):
+        """
+        Creates execution messages for the aggressing and passive
+        parties. Prices and quantities are converted to wire units.
         """
+        scale = self._scale
         aggressor_messages = []
-        for transaction in self._trade_list:
+        passive_messages = []
+        for (timestamp, price, quantity, instrument, aggressor_id, aggressor_side,
+             passive_id, passive_side, passive_trader_id, _) in self._iter_fills():
 
             message = {}
             message.update({'message-type': 'E'})
-            message.update({'timestamp': str(transaction.timestamp)})
-            message.update({'price': int(transaction.traded_price)})
-            message.update({'order-id': transaction.aggressor.id})
-            message.update({'quantity': transaction.traded_quantity})
-            message.update({'instrument': transaction.instrument})
-            if transaction.aggressor.side == Side.B:
-                message.update({'side': 'B'})
-            elif transaction.aggressor.side == Side.S:
-                message.update({'side': 'S'})
-            else:
-                raise ValueError()
+            message.update({'timestamp': str(wire_timestamp(timestamp))})
+            message.update({'price': scale.to_price(price)})
+            message.update({'order-id': aggressor_id})
+            message.update({'quantity': scale.to_quantity(quantity)})
+            message.update({'instrument': instrument})
+            message.update({'side': side_to_str(aggressor_side)})
             aggressor_messages.append(message)
 
-        passive_messages = []
-        for transaction in self._trade_list:
+            message = {}
             message.update({'message-type': 'E'})
-            message.update({'timestamp': str(transaction.timestamp)})
-            message.update({'price': int(transaction.traded_price)})
-            message.update({'order-id': transaction.passive.id})
-            message.update({'quantity': transaction.traded_quantity})
-            message.update({'instrument': transaction.instrument})
-            # TODO: replace with the side_to_str function
-            if transaction.passive.side == Side.B:
-                message.update({'side': 'B'})
-            elif transaction.passive.side == Side.S:
-                message.update({'side': 'S'})
-            else:
-                raise ValueError()
-            passive_messages.append((transaction.passive.trader_id, message))
+            message.update({'timestamp': str(wire_timestamp(timestamp))})
+            message.update({'price': scale.to_price(price)})
+            message.update({'order-id': passive_id})
+            message.update({'quantity': scale.to_quantity(quantity)})
+            message.update({'instrument': instrument})
+            message.update({'side': side_to_str(passive_side)})
+            passive_messages.append((passive_trader_id, message))
 
         return aggressor_messages, passive_messages
 
@@ -277,24 +522,26 @@ class TransactionList:
         found in the trade list.
         """
 
+        scale = self._scale
         messages = []
-        for transaction in self._trade_list:
+        for (timestamp, price, _, instrument, _, _,
+             passive_id, passive_side, _, quantity_remaining) in self._iter_fills():
 
             message = {}
-            message.update({'timestamp': str(transaction.timestamp)})
-            message.update({'side': side_to_str(transaction.passive.side)})
-            message.update({'price': int(transaction.traded_price)})
-            message.update({'order-id': transaction.passive.id})
-            message.update({'instrument': transaction.instrument})
+            message.update({'timestamp': str(wire_timestamp(timestamp))})
+            message.update({'side': side_to_str(passive_side)})
+            message.update({'price': scale.to_price(price)})
+            message.update({'order-id': passive_id})
+            message.update({'instrument': instrument})
 
             # Remove
-            if transaction.passive.quantity_remaining == 0:
+            if quantity_remaining == 0:
                 message.update({'message-type': 'X'})
 
             # Modify
-            elif transaction.passive.quantity_remaining > 0:
+            elif quantity_remaining > 0:
                 message.update({'message-type': 'M'})
-                message.update({'quantity': int(transaction.passive.quantity_remaining)})
+                message.update({'quantity': scale.to_quantity(quantity_remaining)})
 
             else:
                 raise ValueError(f'Quantity remaining invalid.')
@@ -302,4 +549,3 @@ class TransactionList:
             messages.append(message)
 
         return messages
-